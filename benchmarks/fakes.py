@@ -0,0 +1,314 @@
+"""
+Local stand-ins for Gemini, the embedding model and the product catalog used by the benchmarks.
+"""
+
+import hashlib
+import json
+import random
+import re
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any
+
+import numpy as np
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from sqlalchemy.orm import Session
+
+from chatbot.categories import rebuild_category_closure
+from chatbot.prompts import CONVERSATION_ANALYSIS_PROMPT, INTENT_PROMPT, KEYWORD_PROMPT, PRODUCT_RESPONSE_PROMPT
+from chatbot.token_budget import STEP_TAG_PREFIX
+from chatbot.unit_price import register_unit_price_hooks
+from models.models import Category, Order, Product, User
+
+PRODUCT_NAMES = [
+    "Bắp Mỹ tươi",
+    "Bắp ngọt",
+    "Rau muống",
+    "Cải thìa",
+    "Nấm mèo đen thái sợi",
+    "Nấm kim châm",
+    "Sữa tươi Vinamilk",
+    "Sữa chua TH true milk",
+    "Mì Hảo Hảo tôm chua cay",
+    "Nước mắm Nam Ngư",
+    "Dầu ăn Tường An",
+    "Gạo ST25",
+    "Thịt ba rọi heo",
+    "Cá basa phi lê",
+    "Trứng gà Ba Huân",
+    "Táo Envy",
+    "Chuối già Nam Mỹ",
+    "Cà phê G7",
+    "Trà xanh không độ",
+    "Bánh quy Cosy",
+]
+# (id, name, parent id)
+CATEGORIES = [
+    (1, "Thực phẩm tươi sống", None),
+    (2, "Rau củ quả", 1),
+    (3, "Rau lá", 2),
+    (4, "Củ quả", 2),
+    (5, "Nấm", 2),
+    (6, "Thịt cá trứng", 1),
+    (7, "Thịt heo", 6),
+    (8, "Cá hải sản", 6),
+    (9, "Trứng", 6),
+    (10, "Trái cây", 1),
+    (11, "Sữa các loại", None),
+    (12, "Sữa tươi", 11),
+    (13, "Sữa chua", 11),
+    (14, "Thực phẩm khô", None),
+    (15, "Mì ăn liền", 14),
+    (16, "Gạo", 14),
+    (17, "Gia vị", 14),
+    (18, "Bánh kẹo", 14),
+    (19, "Đồ uống", None),
+    (20, "Cà phê", 19),
+    (21, "Trà", 19),
+]
+# Leaf category of each PRODUCT_NAMES entry, in the same order.
+PRODUCT_CATEGORIES = [4, 4, 3, 3, 5, 5, 12, 13, 15, 17, 17, 16, 7, 8, 9, 10, 10, 20, 21, 18]
+PACK_SIZES = [("Gói", "50g"), ("Gói", "200g"), ("Chai", "1L"), ("Hộp", "500g"), ("Túi", "1kg"), ("Vỉ", "10 quả")]
+
+MESSAGE_TEMPLATES = [
+    "Tôi muốn mua {name}",
+    "Có {name} dưới {budget}k không?",
+    "Tìm giúp tôi {name} giá rẻ",
+    "{name} loại nào ngon?",
+    "Cho tôi xem đơn hàng gần đây",
+    "Thông tin tài khoản của tôi",
+]
+
+
+def _prompt_head(prompt: str) -> str:
+    return prompt[:40]
+
+
+class FakeGeminiChatModel(BaseChatModel):
+    """Answers each LLMAnalyzer prompt with a plausible Gemini-shaped payload after a fixed delay."""
+
+    latency: float = 0.2
+    jitter: float = 0.0
+    table_every: int = 3
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None, **kwargs: Any) -> ChatResult:
+        system = str(messages[0].content) if messages else ""
+        human = str(messages[-1].content) if messages else ""
+        self.calls += 1
+        text = self._respond(system, human)
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        prompt_tokens = (len(system) + len(human)) // 4
+        message = AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": len(text) // 4,
+                "total_tokens": prompt_tokens + len(text) // 4,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _respond(self, system: str, human: str) -> str:
+        lowered = human.lower()
+        if system.startswith(_prompt_head(INTENT_PROMPT)):
+            if "đơn hàng" in lowered or "order" in lowered:
+                intent = "orders"
+            elif "tài khoản" in lowered or "profile" in lowered:
+                intent = "profile"
+            else:
+                intent = "product_search"
+            return f'```json\n{{"intent": "{intent}"}}\n```'
+        if system.startswith(_prompt_head(KEYWORD_PROMPT)):
+            names = [name for name in PRODUCT_NAMES if name.lower() in lowered]
+            keywords = names or [word for word in re.findall(r"\w+", lowered) if len(word) > 2][:3]
+            budget = re.search(r"(\d+)\s*k", lowered)
+            payload = {
+                "keywords": keywords,
+                "query": f"Khách đang cần {', '.join(keywords)}",
+                "min_price": None,
+                "max_price": float(budget.group(1)) * 1000 if budget else None,
+            }
+            return "```json\n" + json.dumps(payload, ensure_ascii=False) + "\n```"
+        if system.startswith(_prompt_head(CONVERSATION_ANALYSIS_PROMPT)):
+            return '{"context": "Khách đang hỏi về sản phẩm tạp hóa"}'
+        if system.startswith(_prompt_head(PRODUCT_RESPONSE_PROMPT)):
+            match = re.search(r"^products: (.*)$", human, re.M)
+            products = json.loads(match.group(1)) if match else []
+            names = [product.get("product_name", "") for product in products]
+            if self.table_every and self.calls % self.table_every == 0 and names:
+                rows = "\n".join(f"| {name} | {product.get('price')} |" for name, product in zip(names, products))
+                return f"Đây là các sản phẩm phù hợp:\n\n| Tên | Giá |\n|---|---|\n{rows}\n\nChúc bạn mua sắm vui vẻ!"
+            return "Mình tìm thấy các sản phẩm phù hợp: " + ", ".join(names) + ". Bạn cần thêm gì không?"
+        return "{}"
+
+
+STEP_PROMPTS = {
+    "intent": INTENT_PROMPT,
+    "keywords": KEYWORD_PROMPT,
+    "conversation": CONVERSATION_ANALYSIS_PROMPT,
+    "product": PRODUCT_RESPONSE_PROMPT,
+}
+
+
+class RecordedTurn:
+    """The LLM calls of one captured turn (chatbot.capture), handed out per step in recorded order."""
+
+    def __init__(self, record: dict[str, Any]) -> None:
+        self.record = record
+        self.calls: dict[str, list[dict[str, Any]]] = {}
+        for call in record.get("llm_calls", []):
+            tags = [tag for tag in call.get("tags", []) if tag.startswith(STEP_TAG_PREFIX)]
+            if tags and "output" in call:
+                self.calls.setdefault(tags[0].removeprefix(STEP_TAG_PREFIX), []).append(call)
+        self.served: dict[str, int] = {}
+
+    def next_call(self, step: str) -> dict[str, Any] | None:
+        """The step's next recorded call; the last one again once a new build asks more often."""
+        calls = self.calls.get(step)
+        if not calls:
+            return None
+        index = self.served.get(step, 0)
+        self.served[step] = index + 1
+        return calls[min(index, len(calls) - 1)]
+
+
+_replaying: ContextVar[RecordedTurn | None] = ContextVar("benchmarks_replaying", default=None)
+
+
+@contextmanager
+def replaying(turn: RecordedTurn) -> Iterator[RecordedTurn]:
+    """Make RecordedChatModel answer from `turn` for the calls made in this context."""
+    token = _replaying.set(turn)
+    try:
+        yield turn
+    finally:
+        _replaying.reset(token)
+
+
+class RecordedChatModel(BaseChatModel):
+    """Replays captured LLM outputs with their captured latencies (times `latency_scale`).
+
+    Steps the capture has no call for (a new build calling the LLM where the old one did not)
+    are answered by FakeGeminiChatModel without delay and counted in `unmatched`.
+    """
+
+    latency_scale: float = 1.0
+    fallback: FakeGeminiChatModel = FakeGeminiChatModel(latency=0.0, table_every=0)
+    unmatched: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "recorded"
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None, **kwargs: Any) -> ChatResult:
+        system = str(messages[0].content) if messages else ""
+        step = next((name for name, prompt in STEP_PROMPTS.items() if system.startswith(_prompt_head(prompt))), None)
+        turn = _replaying.get()
+        call = turn.next_call(step) if turn is not None and step else None
+        if call is None:
+            self.unmatched += 1
+            return self.fallback._generate(messages, stop, **kwargs)
+        if call.get("latency") and self.latency_scale > 0:
+            time.sleep(call["latency"] * self.latency_scale)
+        message = AIMessage(content=call["output"], usage_metadata=call.get("usage"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class HashingEmbeddingModel:
+    """Deterministic fastembed stand-in: hashed character trigrams projected to a fixed size."""
+
+    def __init__(self, dimension: int = 64) -> None:
+        self.dimension = dimension
+
+    def get_embedding_size(self, model_name: str | None = None) -> int:
+        return self.dimension
+
+    def embed(self, texts: list[str], batch_size: int | None = None):
+        for text in texts:
+            vector = np.zeros(self.dimension, dtype=np.float32)
+            padded = f"  {text.lower()}  "
+            for i in range(len(padded) - 2):
+                digest = hashlib.blake2b(padded[i : i + 3].encode(), digest_size=4).digest()
+                vector[int.from_bytes(digest, "little") % self.dimension] += 1.0
+            norm = np.linalg.norm(vector)
+            yield vector / norm if norm else vector
+
+
+def seed_catalog(db: Session, *, size: int, users: int = 20, orders_per_user: int = 5, seed: int = 42) -> None:
+    """Insert a synthetic Vietnamese grocery catalog plus users and orders."""
+    register_unit_price_hooks()
+    rng = random.Random(seed)
+    started = datetime(2024, 1, 1)
+    for category_id, category_name, parent_id in CATEGORIES:
+        db.add(Category(id=category_id, name=category_name, parent_id=parent_id))
+    for index in range(1, size + 1):
+        name = PRODUCT_NAMES[index % len(PRODUCT_NAMES)]
+        container, pack = rng.choice(PACK_SIZES)
+        price = rng.randrange(5, 300) * 1000
+        db.add(
+            Product(
+                id=index,
+                product_code=f"893{index:010d}",
+                product_id=str(200000 + index),
+                product_name=f"{name} {container.lower()} {pack}",
+                current_price=price,
+                current_price_text=f"{price:,}đ/{container} {pack}".replace(",", "."),
+                unit=pack,
+                category_id=PRODUCT_CATEGORIES[index % len(PRODUCT_NAMES)],
+                discount_percent=rng.choice([0, 0, 0, 5, 10, 15, 20, 30]),
+                stock_quantity=rng.choice([0, 3, 10, 50, 120]),
+                is_active=rng.random() > 0.05,
+                created_at=started + timedelta(minutes=index),
+                updated_at=started + timedelta(minutes=index),
+            )
+        )
+    for user_id in range(1, users + 1):
+        db.add(
+            User(
+                id=user_id,
+                email=f"user{user_id}@example.com",
+                username=f"user{user_id}",
+                hashed_password="x",
+                full_name=f"Nguyễn Văn {user_id}",
+                phone=f"09{user_id:08d}",
+            )
+        )
+        for order_index in range(orders_per_user):
+            db.add(
+                Order(
+                    user_id=user_id,
+                    order_number=f"ORD-{user_id:04d}-{order_index:03d}",
+                    total_amount=rng.randrange(50, 2000) * 1000,
+                    status=rng.choice(["pending", "confirmed", "shipping", "delivered"]),
+                    created_at=started + timedelta(days=order_index),
+                )
+            )
+    db.flush()
+    rebuild_category_closure(db.connection())
+    db.commit()
+
+
+def synthetic_messages(count: int, *, users: int = 20, seed: int = 7) -> list[dict[str, Any]]:
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        template = rng.choice(MESSAGE_TEMPLATES)
+        messages.append(
+            {
+                "message": template.format(name=rng.choice(PRODUCT_NAMES), budget=rng.choice([20, 50, 100])),
+                "user_id": rng.randint(1, users) if rng.random() < 0.7 else None,
+            }
+        )
+    return messages
@@ -0,0 +1,130 @@
+"""
+Micro-benchmark for the LLM reply post-processors.
+
+Usage:
+    python -m benchmarks.formatting_bench --number 2000
+
+Compares the previous LLMAnalyzer._remove_table_format / _load_json implementations (kept
+below as reference) with chatbot.formatting on replies shaped like real Gemini output: plain
+prose, prose with Markdown tables, fenced JSON. Every sample is checked for identical output
+before timing, and the streaming filter is checked against the one-shot result.
+"""
+
+import argparse
+import json
+import re
+import timeit
+
+from chatbot.formatting import TableStripper, remove_table_format, strip_code_fence
+
+
+def legacy_remove_table_format(text: str) -> str:
+    lines = text.split("\n")
+    cleaned_lines = []
+    in_table = False
+
+    for line in lines:
+        stripped = line.strip()
+        if re.match(r"^[\|\-\s:]+$", stripped):
+            in_table = True
+            continue
+        if "|" in stripped and stripped.count("|") >= 2:
+            in_table = True
+            parts = [p.strip() for p in stripped.split("|") if p.strip()]
+            if parts:
+                cleaned_lines.append(", ".join(parts))
+            continue
+        if in_table and not stripped:
+            in_table = False
+            continue
+        if not in_table:
+            cleaned_lines.append(line)
+
+    result = "\n".join(cleaned_lines).strip()
+    result = re.sub(r"\n{3,}", "\n\n", result)
+    return result
+
+
+def legacy_strip_code_fence(payload: str) -> str:
+    raw = payload.strip()
+    if raw.startswith("```"):
+        lines = raw.splitlines()
+        lines = lines[1:]
+        if lines and lines[-1].strip().startswith("```"):
+            lines = lines[:-1]
+        raw = "\n".join(lines).strip()
+    return raw
+
+
+def _product_rows(count: int) -> list[tuple[str, int]]:
+    return [(f"Bánh quy bơ Danisa hộp {200 + 50 * index}g", 45000 + 7000 * index) for index in range(count)]
+
+
+def sample_replies() -> list[str]:
+    rows = _product_rows(8)
+    prose = "\n".join(
+        f"{index + 1}. **{name}** - giá {price:,}đ, phù hợp làm quà biếu."
+        for index, (name, price) in enumerate(rows)
+    )
+    table = "\n".join(f"| {name} | {price:,}đ | Còn hàng |" for name, price in rows)
+    return [
+        "Chào bạn! Mình có thể giúp gì cho bạn hôm nay?",
+        f"Dưới đây là một số sản phẩm phù hợp với yêu cầu của bạn:\n\n{prose}\n\nBạn cần thêm thông tin gì không?",
+        f"Đây là các sản phẩm phù hợp:\n\n| Tên | Giá | Tình trạng |\n|:---|---:|:---:|\n{table}\n\nChúc bạn mua sắm vui vẻ!",
+        f"Gợi ý cho bạn:\n\n{prose}\n\n\n\n| Tên | Giá |\n|---|---|\n{table}\n\nLưu ý: giá có thể thay đổi theo khu vực.",
+    ]
+
+
+def sample_payloads() -> list[str]:
+    return [
+        '{"intent": "product_search"}',
+        '```json\n{"intent": "order_status"}\n```',
+        '```json\n{"keywords": ["bánh quy", "danisa"], "query": "bánh quy danisa", "min_price": null, '
+        '"max_price": 100000}\n```',
+        '```\n{"context": "Người dùng đang tìm bánh quy làm quà, ngân sách dưới 100k"}\n```',
+    ]
+
+
+def _stream(text: str, chunk_size: int = 7) -> str:
+    stripper = TableStripper()
+    output = [stripper.feed(text[i : i + chunk_size]) for i in range(0, len(text), chunk_size)]
+    return "".join(output) + stripper.flush()
+
+
+def verify(replies: list[str], payloads: list[str]) -> None:
+    for reply in replies:
+        expected = legacy_remove_table_format(reply)
+        assert remove_table_format(reply) == expected, reply
+        assert _stream(reply) == expected, reply
+    for payload in payloads:
+        assert json.loads(strip_code_fence(payload)) == json.loads(legacy_strip_code_fence(payload)), payload
+
+
+def bench(fn, samples: list[str], number: int) -> float:
+    """Mean microseconds per call over all samples."""
+    seconds = timeit.timeit(lambda: [fn(sample) for sample in samples], number=number)
+    return seconds / (number * len(samples)) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark reply post-processing")
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    replies = sample_replies()
+    payloads = sample_payloads()
+    verify(replies, payloads)
+
+    cases = [
+        ("remove_table_format", legacy_remove_table_format, remove_table_format, replies),
+        ("strip_code_fence", legacy_strip_code_fence, strip_code_fence, payloads),
+    ]
+    for name, legacy, current, samples in cases:
+        before = bench(legacy, samples, args.number)
+        after = bench(current, samples, args.number)
+        print(f"{name:<22} legacy {before:8.2f} us  new {after:8.2f} us  speedup {before / after:5.2f}x")
+    print(f"{'stream (7-char chunks)':<22} new {bench(_stream, replies, args.number):8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Load test for the chatbot API against local stand-ins for Gemini, Redis, Qdrant and MySQL.
+
+Usage:
+    python -m benchmarks.load_test --requests 200 --concurrency 16 --output bench.json
+    python -m benchmarks.load_test --baseline bench.json --tolerance 0.15
+
+Gemini is replaced by FakeGeminiChatModel with a configurable latency, the database by a
+SQLite file seeded with a synthetic catalog, Qdrant by QdrantClient(":memory:") and Redis by
+fakeredis (pip install fakeredis) or --redis-url. With --baseline the run exits non-zero when
+throughput or p95 latency regressed by more than --tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any
+
+
+def _percentiles(samples: list[float]) -> dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _isolate_environment(db_path: str) -> None:
+    """Point the app at local stand-ins; env vars win over any .env file in the working directory."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["GEMINI_API_KEY"] = ""
+    os.environ["REDIS_URL"] = ""
+    os.environ["QDRANT_URL"] = ""
+
+
+def build_app(args: argparse.Namespace):
+    from qdrant_client import QdrantClient
+
+    import main
+    from benchmarks.fakes import FakeGeminiChatModel, HashingEmbeddingModel, seed_catalog
+    from chatbot.embeddings import TextEmbedder
+    from chatbot.indexer import IndexCheckpoint, ProductIndexer
+    from chatbot.llm import LLMAnalyzer
+    from chatbot.rag import QdrantRAG
+    from chatbot.redis_memory import RedisConversationMemory
+    from db.database import get_engine, new_session
+    from models.models import Base
+
+    settings = main.settings
+    Base.metadata.create_all(get_engine())
+    db = new_session()
+    try:
+        seed_catalog(db, size=args.catalog_size, users=args.users)
+    finally:
+        db.close()
+
+    service = main.chatbot_service
+    service.analyzer = LLMAnalyzer(
+        settings, model=FakeGeminiChatModel(latency=args.llm_latency_ms / 1000, jitter=args.llm_jitter_ms / 1000)
+    )
+
+    redis_client = None
+    if args.redis_url:
+        import redis
+
+        redis_client = redis.from_url(args.redis_url, decode_responses=True)
+    else:
+        try:
+            import fakeredis
+
+            redis_client = fakeredis.FakeRedis(decode_responses=True)
+        except ImportError:
+            print("[Bench] fakeredis not installed, running without conversation history")
+    service.redis_memory = RedisConversationMemory(settings, client=redis_client)
+
+    if not args.no_qdrant:
+        embedder = TextEmbedder(settings, model=HashingEmbeddingModel())
+        client = QdrantClient(":memory:")
+        checkpoint = IndexCheckpoint(os.path.join(args.workdir, "index_checkpoint.json"))
+        indexer = ProductIndexer(settings, client=client, embedder=embedder, checkpoint=checkpoint)
+        db = new_session()
+        try:
+            indexer.run(db, full=True)
+        finally:
+            db.close()
+        service.rag = QdrantRAG(settings, embedder=embedder, client=client)
+    return main.app
+
+
+async def drive(app, args: argparse.Namespace) -> dict[str, Any]:
+    import httpx
+
+    from benchmarks.fakes import synthetic_messages
+
+    latencies: dict[str, list[float]] = {"session": [], "message": []}
+    errors: dict[str, int] = {"session": 0, "message": 0}
+    workload = synthetic_messages(args.requests, users=args.users, seed=args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+
+        async def timed(endpoint: str, path: str, payload: dict[str, Any]) -> dict[str, Any] | None:
+            started = time.perf_counter()
+            response = await client.post(path, json=payload)
+            latencies[endpoint].append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors[endpoint] += 1
+                return None
+            return response.json()
+
+        async def conversation(item: dict[str, Any]) -> None:
+            async with semaphore:
+                session = await timed("session", "/api/v1/chatbot/session", {"user_id": item["user_id"]})
+                if not session:
+                    return
+                for _ in range(args.turns):
+                    await timed(
+                        "message",
+                        "/api/v1/chatbot/message",
+                        {"session_id": session["session_id"], "message": item["message"], "user_id": item["user_id"]},
+                    )
+
+        started = time.perf_counter()
+        await asyncio.gather(*(conversation(item) for item in workload))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies["message"]) / elapsed, 2) if elapsed else 0.0,
+        "endpoints": {endpoint: _percentiles(samples) for endpoint, samples in latencies.items()},
+        "errors": errors,
+    }
+
+
+def compare(result: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    regressions = []
+    base_rps = baseline.get("throughput_rps") or 0
+    if base_rps and result["throughput_rps"] < base_rps * (1 - tolerance):
+        regressions.append(f"throughput {result['throughput_rps']} rps < baseline {base_rps} rps")
+    for endpoint, stats in result["endpoints"].items():
+        base_p95 = baseline.get("endpoints", {}).get(endpoint, {}).get("p95_ms")
+        if base_p95 and stats.get("p95_ms", 0) > base_p95 * (1 + tolerance):
+            regressions.append(f"{endpoint} p95 {stats['p95_ms']}ms > baseline {base_p95}ms")
+    for stage, stats in result["stages"].items():
+        base_p95 = baseline.get("stages", {}).get(stage, {}).get("p95_ms")
+        if base_p95 and stats.get("p95_ms", 0) > base_p95 * (1 + tolerance):
+            regressions.append(f"stage {stage} p95 {stats['p95_ms']}ms > baseline {base_p95}ms")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Chatbot load test against local stand-ins")
+    parser.add_argument("--requests", type=int, default=100, help="number of conversations")
+    parser.add_argument("--turns", type=int, default=1, help="messages per conversation")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--catalog-size", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--redis-url", default=None, help="use a real Redis instead of fakeredis")
+    parser.add_argument("--no-qdrant", action="store_true", help="skip the in-memory Qdrant index (SQL only)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--trace-memory", action="store_true", help="track allocations with tracemalloc (slow)")
+    parser.add_argument("--output", default=None, help="write results JSON to this path")
+    parser.add_argument("--baseline", default=None, help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative regression")
+    args = parser.parse_args()
+
+    args.workdir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    _isolate_environment(os.path.join(args.workdir, "bench.db"))
+
+    if args.trace_memory:
+        tracemalloc.start()
+    app = build_app(args)
+
+    from core.metrics import metrics
+
+    metrics.reset()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    traced_before = tracemalloc.get_traced_memory()[0] if args.trace_memory else 0
+    result = asyncio.run(drive(app, args))
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    snapshot = metrics.snapshot()
+    # What the app's lifespan does on exit: drain buffered history writes and captured traffic.
+    import main
+
+    main.chatbot_service.shutdown()
+    timings = snapshot["timings"]
+    result["stages"] = {name.removeprefix("graph."): stats for name, stats in timings.items() if name.startswith("graph.")}
+    result["models"] = {
+        name.removeprefix("llm.model."): value
+        for name, value in {**snapshot["counters"], **timings}.items()
+        if name.startswith("llm.model.")
+    }
+    result["memory"] = {"max_rss_kb": rss_after, "max_rss_growth_kb": rss_after - rss_before}
+    if args.trace_memory:
+        traced_after, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["memory"]["traced_growth_kb"] = round((traced_after - traced_before) / 1024, 1)
+        result["memory"]["traced_peak_kb"] = round(traced_peak / 1024, 1)
+    result["config"] = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in {"output", "baseline", "workdir", "redis_url"}
+    }
+    result["python"] = platform.python_version()
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        regressions = compare(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"[Bench] REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
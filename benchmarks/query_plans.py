@@ -0,0 +1,148 @@
+"""
+Check that every SQL query the chatbot issues is served by an index.
+
+Usage:
+    python -m benchmarks.query_plans                                   # seeded SQLite
+    python -m benchmarks.query_plans --database-url mysql+pymysql://…   # existing MySQL, not seeded
+
+Runs the real tool functions against the database, captures the statements they emit and
+prints the EXPLAIN plan of each. Exits non-zero when a plan contains a full table scan (SQLite
+`SCAN <table>` without an index, MySQL `type=ALL`), or when a query in EXPECTED_INDEXES does
+not use its index. Sorting in a temp B-tree / filesort after an index range search is reported
+but allowed.
+"""
+
+import argparse
+import re
+import sys
+from collections.abc import Callable
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from benchmarks.fakes import seed_catalog
+from chatbot import tools
+from chatbot.categories import populated_categories
+from chatbot.indexer import product_page
+from chatbot.unit_price import UnitPriceQuery
+from models.models import Base, Order
+
+SQLITE_FULL_SCAN_RE = re.compile(r"^SCAN (\w+)$")
+
+
+def _payment_order_lookup(db: Session) -> None:
+    # Same lookup as services.initiate_payment, without creating a payment.
+    db.query(Order).filter(Order.order_number == "ORD-0001-000").first()
+
+
+def _incremental_sync_page(db: Session) -> None:
+    product_page(db, "incremental", 100, datetime(2024, 1, 2), 256)
+
+
+QUERIES: list[tuple[str, Callable[[Session], Any]]] = [
+    ("get_user_orders", lambda db: tools.get_user_orders(db, 3)),
+    ("get_user_profile", lambda db: tools.get_user_profile(db, 3)),
+    ("suggest_products", lambda db: tools.suggest_products(db)),
+    ("search keyword", lambda db: tools.retrieve_product_candidates(db, ["bánh quy"])),
+    (
+        "search keyword + price",
+        lambda db: tools.retrieve_product_candidates(db, ["bánh quy"], min_price=20000, max_price=80000),
+    ),
+    ("search price only", lambda db: tools.retrieve_product_candidates(db, [], max_price=30000)),
+    (
+        "search unit price",
+        lambda db: tools.retrieve_product_candidates(db, [], unit_price=UnitPriceQuery("kg", 200000)),
+    ),
+    ("search category", lambda db: tools.retrieve_product_candidates(db, ["vinamilk"], category_id=11)),
+    ("populated categories", populated_categories),
+    ("payment order lookup", _payment_order_lookup),
+    ("indexer incremental page", _incremental_sync_page),
+]
+
+# Queries that must use a specific index, not just any index.
+EXPECTED_INDEXES = {
+    "search category": "ix_products_category_id_is_active_created_at",
+}
+
+
+def capture(engine: Engine, db: Session, run: Callable[[Session], Any]) -> list[tuple[str, Any]]:
+    statements: list[tuple[str, Any]] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany) -> None:
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        run(db)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def explain(engine: Engine, statement: str, parameters: Any) -> tuple[list[str], list[str]]:
+    """Return (plan lines, full-scan problems) for one statement."""
+    lines: list[str] = []
+    problems: list[str] = []
+    with engine.connect() as connection:
+        if engine.dialect.name == "sqlite":
+            for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters):
+                detail = row[3]
+                lines.append(detail)
+                if SQLITE_FULL_SCAN_RE.match(detail):
+                    problems.append(detail)
+        else:
+            result = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+            for row in result.mappings():
+                line = f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']} {row['Extra'] or ''}"
+                lines.append(line.strip())
+                if row["type"] == "ALL":
+                    problems.append(line)
+    return lines, problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="EXPLAIN every chatbot tool query and fail on full scans")
+    parser.add_argument("--database-url", default=None, help="check an existing database instead of seeded SQLite")
+    parser.add_argument("--catalog-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+    else:
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        with Session(engine) as db:
+            seed_catalog(db, size=args.catalog_size)
+        # Let the planner see realistic row counts.
+        with engine.connect() as connection:
+            connection.exec_driver_sql("ANALYZE")
+
+    failures = 0
+    with Session(engine) as db:
+        for name, run in QUERIES:
+            expected = EXPECTED_INDEXES.get(name)
+            plans: list[str] = []
+            for statement, parameters in capture(engine, db, run):
+                lines, problems = explain(engine, statement, parameters)
+                status = "FULL SCAN" if problems else "ok"
+                failures += bool(problems)
+                plans.extend(lines)
+                print(f"{name:<26} {status}")
+                for line in lines:
+                    print(f"    {line}")
+            if expected and not any(expected in line for line in plans):
+                failures += 1
+                print(f"{name:<26} NOT USING {expected}")
+
+    if failures:
+        print(f"{failures} queries do a full table scan or miss their index")
+        sys.exit(1)
+    print("All queries use an index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Replay captured production traffic against the current build, offline.
+
+Usage:
+    CAPTURE_DIR=captures python run.py                                  # record (see chatbot/capture.py)
+    python -m benchmarks.replay captures/*.jsonl.gz --output before.json
+    python -m benchmarks.replay captures/*.jsonl.gz --baseline before.json --output after.json
+
+Every recorded turn goes back through ChatbotService.send_message and build_graph against the
+load test's local stand-ins (SQLite catalog, fakeredis, in-memory Qdrant). The LLM is
+RecordedChatModel: each call returns the output captured for that step of that turn, after the
+captured latency. Sessions run concurrently, and the turns of a session run in recorded order.
+The report holds throughput, turn latency and per-stage timings, next to the stage timings
+captured in production. With --baseline it also prints the differences from an earlier run.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from benchmarks.load_test import _isolate_environment, _percentiles
+
+
+def load_turns(paths: list[str], limit: int | None) -> list[dict[str, Any]]:
+    from chatbot.capture import read_captures
+
+    turns = []
+    for record in read_captures(paths):
+        if record.get("error"):
+            continue
+        turns.append(record)
+        if limit and len(turns) >= limit:
+            break
+    return turns
+
+
+def recorded_stages(turns: list[dict[str, Any]]) -> dict[str, dict[str, float]]:
+    samples: dict[str, list[float]] = {}
+    for record in turns:
+        for node in record.get("nodes", []):
+            samples.setdefault(node["node"], []).append(node["seconds"])
+    return {stage: _percentiles(values) for stage, values in samples.items()}
+
+
+def replay(service, turns: list[dict[str, Any]], args: argparse.Namespace) -> dict[str, Any]:
+    from benchmarks.fakes import RecordedTurn, replaying
+
+    by_session: dict[str, list[dict[str, Any]]] = {}
+    for record in turns:
+        by_session.setdefault(record["session_id"], []).append(record)
+    latencies: list[float] = []
+    errors = 0
+
+    def user_id(recorded: int | None) -> int | None:
+        # Orders and profiles come from the synthetic users.
+        return (recorded - 1) % args.users + 1 if recorded else None
+
+    def run_session(records: list[dict[str, Any]]) -> None:
+        nonlocal errors
+        for record in records:
+            started = time.perf_counter()
+            try:
+                with replaying(RecordedTurn(record)):
+                    service.send_message(
+                        session_id=record["session_id"], message=record["message"], user_id=user_id(record["user_id"])
+                    )
+            except Exception as e:
+                print(f"[Replay] Turn of session {record['session_id']} failed: {e}")
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="replay") as executor:
+        list(executor.map(run_session, by_session.values()))
+    elapsed = time.perf_counter() - started
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "turns": _percentiles(latencies),
+        "errors": errors,
+    }
+
+
+def diff(result: dict[str, Any], baseline: dict[str, Any]) -> list[str]:
+    def change(after: float, before: float) -> str:
+        return f"{before} -> {after} ({(after - before) / before:+.1%})" if before else f"{before} -> {after}"
+
+    lines = [f"throughput_rps  {change(result['throughput_rps'], baseline.get('throughput_rps', 0))}"]
+    for key in ("p50_ms", "p95_ms"):
+        lines.append(f"turn {key:<6}     {change(result['turns'].get(key, 0), baseline['turns'].get(key, 0))}")
+    for stage, stats in result["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before:
+            lines.append(f"stage {stage:<9} new")
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            lines.append(f"stage {stage:<9} {key:<6} {change(stats.get(key, 0), before.get(key, 0))}")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay captured chatbot traffic with recorded LLM outputs")
+    parser.add_argument("captures", nargs="+", help="capture files (.jsonl.gz or .jsonl)")
+    parser.add_argument("--concurrency", type=int, default=8, help="sessions replayed at once")
+    parser.add_argument("--limit", type=int, default=None, help="replay at most this many turns")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier for recorded LLM latencies")
+    parser.add_argument("--catalog-size", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--no-qdrant", action="store_true", help="skip the vector index, SQL search only")
+    parser.add_argument("--redis-url", default=None, help="real Redis instead of fakeredis")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="report of an earlier run to diff against")
+    args = parser.parse_args()
+
+    turns = load_turns(args.captures, args.limit)
+    if not turns:
+        parser.error("no recorded turns found")
+
+    args.workdir = tempfile.mkdtemp(prefix="chatbot-replay-")
+    _isolate_environment(os.path.join(args.workdir, "replay.db"))
+    os.environ.pop("CAPTURE_DIR", None)
+    args.llm_latency_ms = 0.0
+    args.llm_jitter_ms = 0.0
+
+    from benchmarks.fakes import RecordedChatModel
+    from benchmarks.load_test import build_app
+    from chatbot.llm import LLMAnalyzer
+    from core.metrics import metrics
+
+    build_app(args)
+    import main as app_module
+
+    service = app_module.chatbot_service
+    model = RecordedChatModel(latency_scale=args.latency_scale)
+    service.analyzer = LLMAnalyzer(app_module.settings, model=model)
+
+    metrics.reset()
+    result = replay(service, turns, args)
+    timings = metrics.snapshot()["timings"]
+    result["stages"] = {name.removeprefix("graph."): stats for name, stats in timings.items() if name.startswith("graph.")}
+    result["recorded_stages"] = recorded_stages(turns)
+    result["unmatched_llm_calls"] = model.unmatched
+    result["config"] = {
+        "captures": args.captures,
+        "turns": len(turns),
+        "sessions": len({record["session_id"] for record in turns}),
+        "concurrency": args.concurrency,
+        "latency_scale": args.latency_scale,
+        "catalog_size": args.catalog_size,
+        "no_qdrant": args.no_qdrant,
+    }
+    service.shutdown()
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2, ensure_ascii=False)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        for line in diff(result, baseline):
+            print(f"[Replay] {line}")
+
+
+if __name__ == "__main__":
+    main()
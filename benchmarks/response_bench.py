@@ -0,0 +1,110 @@
+"""
+Micro-benchmark for serializing /api/v1/chatbot/message responses.
+
+Usage:
+    python -m benchmarks.response_bench --number 2000
+
+Compares the previous path (MessageContext -> model_dump -> MessageResponse(**response) ->
+FastAPI response_model validation -> JSON) with the current one (MessageResponse built once,
+encoded by core.responses.ModelResponse) for product_search replies carrying 5 to 50 products.
+Both paths are checked to produce the same JSON before timing. Also reports the gzip size of
+each payload.
+"""
+
+import argparse
+import gzip
+import json
+import timeit
+from typing import Any
+
+from fastapi import FastAPI
+
+from core.responses import GZIP_LEVEL, ModelResponse
+from schemas.schemas import MessageContext, MessageResponse
+
+SIZES = (5, 10, 20, 50)
+
+
+def sample_products(count: int) -> list[dict[str, Any]]:
+    # Shaped like QdrantRAG.search results after re-ranking.
+    return [
+        {
+            "product_id": str(200000 + index),
+            "product_code": f"893{index:010d}",
+            "product_name": f"Bánh quy bơ Danisa hộp {200 + 50 * index}g",
+            "price": 45000.0 + 7000 * index,
+            "price_text": f"{45000 + 7000 * index:,}đ/Hộp".replace(",", "."),
+            "unit": "Hộp",
+            "product_url": f"https://www.bachhoaxanh.com/banh-quy/danisa-{index}",
+            "image_url": f"https://cdn.tgdd.vn/Products/Images/{index}.jpg",
+            "discount_percent": index % 4 * 5 or None,
+            "stock_quantity": 40 + index,
+            "score": round(0.9 - index * 0.01, 4),
+            "score_details": {"relevance": 0.5, "stock": 0.2, "price": 0.15, "discount": 0.05},
+        }
+        for index in range(count)
+    ]
+
+
+def legacy_response_field():
+    """The response field FastAPI builds for `response_model=MessageResponse`."""
+    app = FastAPI()
+
+    @app.post("/message", response_model=MessageResponse)
+    def endpoint():
+        return None
+
+    return next(route for route in app.routes if getattr(route, "path", None) == "/message").response_field
+
+
+def legacy(tool_result: dict[str, Any], field) -> bytes:
+    context = MessageContext(products=tool_result.get("products"), suggested_products=None, orders=None, profile=None)
+    response = {
+        "reply": "Đây là các sản phẩm phù hợp.",
+        "session_id": "s-1",
+        "context": context.model_dump(exclude_none=True),
+    }
+    value, errors = field.validate(MessageResponse(**response), {}, loc=("response",))
+    assert not errors
+    return field.serialize_json(value)
+
+
+def current(tool_result: dict[str, Any]) -> bytes:
+    response = MessageResponse(
+        reply="Đây là các sản phẩm phù hợp.",
+        session_id="s-1",
+        context=MessageContext(
+            products=tool_result.get("products"), suggested_products=None, orders=None, profile=None
+        ),
+    )
+    return ModelResponse(response).body
+
+
+def bench(fn, number: int) -> float:
+    """Mean microseconds per call."""
+    return timeit.timeit(fn, number=number) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark chat response serialization")
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    field = legacy_response_field()
+    for size in SIZES:
+        tool_result = {"products": sample_products(size)}
+        body = current(tool_result)
+        assert json.loads(body) == json.loads(legacy(tool_result, field)), size
+
+        before = bench(lambda: legacy(tool_result, field), args.number)
+        after = bench(lambda: current(tool_result), args.number)
+        compress = bench(lambda: gzip.compress(body, compresslevel=GZIP_LEVEL), args.number)
+        compressed = len(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        print(
+            f"{size:>3} products  legacy {before:8.1f} us  new {after:8.1f} us  speedup {before / after:5.2f}x  "
+            f"body {len(body):>6} B  gzip {compressed:>5} B (+{compress:.1f} us)"
+        )
+
+
+if __name__ == "__main__":
+    main()
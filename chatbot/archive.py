@@ -0,0 +1,292 @@
+"""
+Archive conversation history from the Redis history stream into day-partitioned columnar files.
+
+Usage:
+    python -m chatbot.archive run                      # consume the stream until interrupted
+    python -m chatbot.archive scan --start 2026-10-01 --columns session_id,role,content --limit 20
+
+Messages reach the stream when HISTORY_STREAM_ENABLED is set (see chatbot.redis_writer). The
+worker reads them through a consumer group and writes one Parquet (or Arrow IPC) file per day
+per batch under ARCHIVE_DIR/date=YYYY-MM-DD/. Entries are acknowledged only after their file has
+been written, so the group's pending list is the checkpoint: a restarted worker first rewrites
+its own unacknowledged entries, then claims those of consumers idle for longer than
+ARCHIVE_CLAIM_IDLE_SECONDS. Delivery is at least once; `stream_id` identifies a message across
+files.
+"""
+
+import argparse
+import json
+import os
+import socket
+import time
+from collections.abc import Iterator
+from datetime import date, datetime, timezone
+from threading import Event
+from typing import Any
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import redis
+
+from core.config import Settings, get_settings
+from core.metrics import metrics
+
+GROUP = "history-archiver"
+SCHEMA = pa.schema(
+    [
+        ("stream_id", pa.string()),
+        ("message_id", pa.string()),
+        ("session_id", pa.string()),
+        ("role", pa.dictionary(pa.int8(), pa.string())),
+        ("content", pa.string()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+    ]
+)
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+# (stream id, fields)
+StreamEntry = tuple[str, dict[str, str]]
+
+
+def _timestamp(raw: str | None) -> datetime:
+    if not raw:
+        return datetime.now(timezone.utc)
+    parsed = datetime.fromisoformat(raw)
+    # Stored message timestamps are naive UTC.
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class HistoryArchiver:
+    """Consumer-group worker that turns history stream entries into columnar files.
+
+    At most `batch_rows` entries are held in memory: the worker reads no further until they
+    are written, so a slow disk leaves the backlog in the stream instead of in the process.
+    Only this worker trims the stream, after every flush and never past an entry some group has
+    not acknowledged. Producers stop publishing once the backlog reaches HISTORY_STREAM_MAXLEN.
+    """
+
+    def __init__(self, settings: Settings, client: redis.Redis | None = None, consumer: str | None = None) -> None:
+        self.client = client or redis.from_url(
+            settings.redis_url,
+            decode_responses=True,
+            socket_connect_timeout=settings.redis_socket_timeout_seconds,
+        )
+        self.stream_key = settings.history_stream_key
+        self.stream_maxlen = settings.history_stream_maxlen
+        self.directory = settings.archive_dir
+        if settings.archive_format not in FORMATS:
+            raise ValueError(f"archive_format must be one of {sorted(FORMATS)}, got {settings.archive_format!r}")
+        self.format = settings.archive_format
+        self.batch_rows = settings.archive_batch_rows
+        self.flush_seconds = settings.archive_flush_seconds
+        self.claim_idle_ms = int(settings.archive_claim_idle_seconds * 1000)
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self._entries: list[StreamEntry] = []
+        self._oldest = 0.0
+
+    def ensure_group(self) -> None:
+        try:
+            self.client.xgroup_create(self.stream_key, GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def run(self, stop: Event | None = None, block_ms: int = 1000) -> None:
+        """Archive until `stop` is set; whatever is buffered is flushed before returning."""
+        stop = stop or Event()
+        self.ensure_group()
+        print(f"[Archive] Consumer {self.consumer} reading {self.stream_key}")
+        # Own entries left unacknowledged (by a previous run or a failed flush) are read from the
+        # pending list first, starting after `recover_from`; then idle consumers' entries are claimed.
+        recover_from: str | None = "0"
+        while not stop.is_set():
+            if recover_from is not None:
+                entries = self._read(recover_from, block_ms=None)
+                recover_from = entries[-1][0] if entries else None
+                if recover_from is None:
+                    entries = self._claim()
+            else:
+                entries = self._read(">", block_ms=block_ms)
+            self._add(entries)
+            if self._due():
+                try:
+                    self.flush()
+                except (OSError, redis.RedisError) as e:
+                    print(f"[Archive] Flush failed, entries stay pending: {e}")
+                    metrics.incr("archive.flush_errors")
+                    stop.wait(5)
+                recover_from = "0"
+        self.flush()
+
+    def _read(self, start: str, block_ms: int | None) -> list[StreamEntry]:
+        count = self.batch_rows - len(self._entries)
+        if count <= 0:
+            return []
+        response = self.client.xreadgroup(GROUP, self.consumer, {self.stream_key: start}, count=count, block=block_ms)
+        # Entries deleted by trimming come back as (id, None).
+        return [(entry_id, fields) for _, entries in response or [] for entry_id, fields in entries if fields]
+
+    def _claim(self) -> list[StreamEntry]:
+        count = self.batch_rows - len(self._entries)
+        if count <= 0:
+            return []
+        _, entries, *_ = self.client.xautoclaim(
+            self.stream_key, GROUP, self.consumer, min_idle_time=self.claim_idle_ms, start_id="0-0", count=count
+        )
+        if entries:
+            print(f"[Archive] Claimed {len(entries)} entries from idle consumers")
+            metrics.incr("archive.claimed", len(entries))
+        return [(entry_id, fields) for entry_id, fields in entries if fields]
+
+    def _add(self, entries: list[StreamEntry]) -> None:
+        if entries and not self._entries:
+            self._oldest = time.monotonic()
+        self._entries.extend(entries)
+
+    def _due(self) -> bool:
+        if not self._entries:
+            return False
+        return len(self._entries) >= self.batch_rows or time.monotonic() - self._oldest >= self.flush_seconds
+
+    def flush(self) -> int:
+        """Write buffered entries, acknowledge them and trim them from the stream."""
+        if not self._entries:
+            return 0
+        entries, self._entries = self._entries, []
+        with metrics.timer("archive.flush_latency"):
+            files = self._write(entries)
+            ids = [entry_id for entry_id, _ in entries]
+            self.client.xack(self.stream_key, GROUP, *ids)
+            self._trim()
+        metrics.incr("archive.rows", len(entries))
+        metrics.incr("archive.files", files)
+        print(f"[Archive] Archived {len(entries)} messages into {files} files")
+        return len(entries)
+
+    def _write(self, entries: list[StreamEntry]) -> int:
+        by_day: dict[date, list[dict[str, Any]]] = {}
+        for entry_id, fields in entries:
+            timestamp = _timestamp(fields.get("timestamp"))
+            by_day.setdefault(timestamp.date(), []).append(
+                {
+                    "stream_id": entry_id,
+                    "message_id": fields.get("id"),
+                    "session_id": fields.get("session_id"),
+                    "role": fields.get("role"),
+                    "content": fields.get("content"),
+                    "timestamp": timestamp,
+                }
+            )
+        for day, rows in by_day.items():
+            table = pa.Table.from_pylist(rows, schema=SCHEMA)
+            directory = os.path.join(self.directory, f"date={day.isoformat()}")
+            os.makedirs(directory, exist_ok=True)
+            # Named after the stream ids it holds, so a batch rewritten after a crash replaces its file.
+            name = f"part-{rows[0]['stream_id']}_{rows[-1]['stream_id']}{FORMATS[self.format]}"
+            path = os.path.join(directory, name)
+            tmp_path = os.path.join(directory, f".{name}.tmp")
+            if self.format == "parquet":
+                pq.write_table(table, tmp_path, compression="zstd")
+            else:
+                with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(
+                    sink, SCHEMA, options=pa.ipc.IpcWriteOptions(compression="zstd")
+                ) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+        return len(by_day)
+
+    def _trim(self) -> None:
+        """Drop entries every consumer group is done with; warn when the backlog nears the cap."""
+        keep_from = []
+        for group in self.client.xinfo_groups(self.stream_key):
+            pending = self.client.xpending(self.stream_key, group["name"])
+            keep_from.append(pending["min"] if pending.get("pending") else group["last-delivered-id"])
+        if keep_from:
+            minid = min(keep_from, key=lambda entry_id: tuple(int(part) for part in entry_id.split("-")))
+            self.client.xtrim(self.stream_key, minid=minid, approximate=False)
+        length = self.client.xlen(self.stream_key)
+        if self.stream_maxlen and length >= self.stream_maxlen * 0.8:
+            metrics.incr("archive.backlog_warnings")
+            print(f"[Archive] Stream backlog at {length}/{self.stream_maxlen}; producers drop new entries at the cap")
+
+
+def scan_history(
+    directory: str,
+    *,
+    columns: list[str] | None = None,
+    start: date | None = None,
+    end: date | None = None,
+    session_id: str | None = None,
+    archive_format: str = "parquet",
+) -> ds.Scanner:
+    """Scanner over archived messages: only the requested columns and day partitions are read.
+
+    Use `.to_table()`, `.to_batches()` or `.to_reader()` on the result. `start` and `end` are
+    inclusive days.
+    """
+    dataset = ds.dataset(
+        directory,
+        format="parquet" if archive_format == "parquet" else "ipc",
+        partitioning=ds.partitioning(pa.schema([("date", pa.date32())]), flavor="hive"),
+        exclude_invalid_files=True,
+    )
+    conditions = []
+    if start is not None:
+        conditions.append(pc.field("date") >= pa.scalar(start, pa.date32()))
+    if end is not None:
+        conditions.append(pc.field("date") <= pa.scalar(end, pa.date32()))
+    if session_id is not None:
+        conditions.append(pc.field("session_id") == session_id)
+    condition = None
+    for expression in conditions:
+        condition = expression if condition is None else condition & expression
+    return dataset.scanner(columns=columns, filter=condition)
+
+
+def iter_history(directory: str, **kwargs: Any) -> Iterator[dict[str, Any]]:
+    """Archived messages as dicts, one record batch in memory at a time."""
+    for batch in scan_history(directory, **kwargs).to_batches():
+        yield from batch.to_pylist()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Archive conversation history from the Redis stream")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("run", help="consume the history stream")
+    scan = commands.add_parser("scan", help="print archived messages")
+    scan.add_argument("--start", type=date.fromisoformat, default=None)
+    scan.add_argument("--end", type=date.fromisoformat, default=None)
+    scan.add_argument("--session-id", default=None)
+    scan.add_argument("--columns", default=None, help="comma-separated, e.g. session_id,role,content")
+    scan.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    settings = get_settings()
+    if args.command == "run":
+        archiver = HistoryArchiver(settings)
+        try:
+            archiver.run()
+        except KeyboardInterrupt:
+            archiver.flush()
+        return
+
+    columns = args.columns.split(",") if args.columns else None
+    scanner = scan_history(
+        settings.archive_dir,
+        columns=columns,
+        start=args.start,
+        end=args.end,
+        session_id=args.session_id,
+        archive_format=settings.archive_format,
+    )
+    if not args.limit:
+        print(scanner.count_rows())
+        return
+    for row in scanner.head(args.limit).to_pylist():
+        print(json.dumps(row, ensure_ascii=False, default=str))
+
+
+if __name__ == "__main__":
+    main()
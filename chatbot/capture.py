@@ -0,0 +1,219 @@
+import atexit
+import gzip
+import json
+import os
+import random
+import re
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from threading import Lock, Timer
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from core.config import Settings
+from core.metrics import metrics
+
+CAPTURE_VERSION = 1
+REDACTED = "[REDACTED]"
+# Profile fields and anything else that names, reaches or locates a person.
+PII_KEYS = {"full_name", "email", "phone", "address", "shipping_address", "password", "hashed_password"}
+# Catalog and order identifiers: kept as recorded (a barcode looks like a card number) so replays compare.
+IDENTIFIER_KEYS = {"product_code", "product_id", "product_url", "image_url", "order_number"}
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+# Vietnamese mobile and landline numbers, with or without +84 and separators.
+PHONE_RE = re.compile(r"(?<![\w.,])(?:\+?84|0)(?:[\s.-]?\d){8,10}(?![\w.,])")
+# Card and account numbers.
+LONG_NUMBER_RE = re.compile(r"(?<![\w.,])\d(?:[\s-]?\d){11,18}(?![\w.,])")
+
+_current_capture: ContextVar["TurnCapture | None"] = ContextVar("chatbot_turn_capture", default=None)
+
+
+def redact_text(text: str) -> str:
+    text = EMAIL_RE.sub("[EMAIL]", text)
+    text = LONG_NUMBER_RE.sub("[NUMBER]", text)
+    return PHONE_RE.sub("[PHONE]", text)
+
+
+def redact(value: Any) -> Any:
+    """Copy of a JSON-like value with PII fields blanked and emails / phone numbers masked in strings."""
+    if isinstance(value, str):
+        return redact_text(value)
+    if isinstance(value, dict):
+        return {key: _redact_field(key, item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+def _redact_field(key: str, value: Any) -> Any:
+    if key in PII_KEYS and value is not None:
+        return REDACTED
+    if key in IDENTIFIER_KEYS:
+        return value
+    return redact(value)
+
+
+def _message_text(message: Any) -> str:
+    content = getattr(message, "content", message)
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return str(content or "")
+
+
+class TurnCapture(BaseCallbackHandler):
+    """One recorded turn: the request, the state each graph node produced and every LLM call.
+
+    Attached as a callback to the turn's chain calls (see `current_capture()`); graph nodes report
+    through `node()`. Everything is redacted as it is recorded.
+    """
+
+    def __init__(self, state: dict[str, Any]) -> None:
+        self.started = time.perf_counter()
+        self.record: dict[str, Any] = {
+            "version": CAPTURE_VERSION,
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "session_id": state.get("session_id"),
+            "user_id": state.get("user_id"),
+            "message": redact_text(state.get("message") or ""),
+            "nodes": [],
+            "llm_calls": [],
+        }
+        self._calls: dict[UUID, dict[str, Any]] = {}
+        self._lock = Lock()
+
+    def node(self, stage: str, seconds: float, before: dict[str, Any], after: dict[str, Any]) -> None:
+        """Record the keys a graph node set or changed."""
+        changed = {key: value for key, value in after.items() if key not in before or before[key] is not value}
+        self.record["nodes"].append(
+            {"node": stage, "seconds": round(seconds, 6), "state": redact(json.loads(json.dumps(changed, default=str)))}
+        )
+
+    def on_chat_model_start(
+        self, serialized: dict[str, Any], messages: Any, *, run_id: UUID, tags: list[str] | None = None, **kwargs: Any
+    ) -> None:
+        prompt = [
+            {"role": message.type, "content": redact_text(_message_text(message))}
+            for batch in messages
+            for message in batch
+        ]
+        with self._lock:
+            self._calls[run_id] = {"tags": tags or [], "input": prompt, "started": time.perf_counter()}
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        message = getattr(generation, "message", None)
+        self._add_call(
+            call,
+            output=redact_text(_message_text(message) if message is not None else getattr(generation, "text", "")),
+            usage=getattr(message, "usage_metadata", None),
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call is not None:
+            self._add_call(call, error=type(error).__name__)
+
+    def _add_call(self, call: dict[str, Any], **result: Any) -> None:
+        latency = time.perf_counter() - call.pop("started")
+        with self._lock:
+            self.record["llm_calls"].append({**call, "latency": round(latency, 6), **result})
+
+    def finish(self, response: Any = None, error: BaseException | None = None) -> dict[str, Any]:
+        self.record["seconds"] = round(time.perf_counter() - self.started, 6)
+        if response is not None:
+            self.record["response"] = redact(json.loads(response.model_dump_json(exclude_none=True)))
+        if error is not None:
+            self.record["error"] = type(error).__name__
+        return self.record
+
+
+def current_capture() -> TurnCapture | None:
+    return _current_capture.get()
+
+
+@contextmanager
+def capturing(capture: TurnCapture | None) -> Iterator[TurnCapture | None]:
+    token = _current_capture.set(capture)
+    try:
+        yield capture
+    finally:
+        _current_capture.reset(token)
+
+
+class TrafficRecorder:
+    """Writes a sample of turns to gzip-compressed JSONL files in `directory`, one file per hour.
+
+    Records are buffered and appended as one gzip member once `flush_records` are waiting or, via a
+    daemon timer armed by the first buffered record, once it has waited `flush_seconds`. A file stays
+    readable while it grows, and a crash loses at most that buffer. The buffer is also flushed when the
+    interpreter exits.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.directory = settings.capture_dir
+        self.sample_rate = settings.capture_sample_rate
+        self.flush_records = settings.capture_flush_records
+        self.flush_seconds = settings.capture_flush_seconds
+        self._buffer: list[str] = []
+        self._timer: Timer | None = None
+        self._lock = Lock()
+        atexit.register(self.close)
+
+    def start(self, state: dict[str, Any]) -> TurnCapture | None:
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return None
+        return TurnCapture(state)
+
+    def finish(self, capture: TurnCapture, response: Any = None, error: BaseException | None = None) -> None:
+        line = json.dumps(capture.finish(response, error), ensure_ascii=False, default=str)
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= self.flush_records:
+                self._flush()
+            elif self._timer is None and self.flush_seconds > 0:
+                self._timer = Timer(self.flush_seconds, self.close)
+                self._timer.daemon = True
+                self._timer.start()
+        metrics.incr("capture.turns")
+
+    def _path(self) -> str:
+        return os.path.join(self.directory, f"traffic-{datetime.now(timezone.utc):%Y%m%dT%H}-{os.getpid()}.jsonl.gz")
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with gzip.open(self._path(), "at", encoding="utf-8") as fh:
+                fh.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"[Capture] Dropped {len(lines)} recorded turns: {e}")
+            metrics.incr("capture.dropped", len(lines))
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+
+
+def read_captures(paths: Iterable[str]) -> Iterator[dict[str, Any]]:
+    """Recorded turns from capture files (gzip or plain JSONL), in file order."""
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
@@ -0,0 +1,285 @@
+import argparse
+import time
+import unicodedata
+from datetime import datetime
+from functools import lru_cache
+from threading import Lock
+
+from sqlalchemy import bindparam, delete, event, insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from core.config import Settings, get_settings
+from core.metrics import metrics
+from models.models import Category, CategoryClosure, Product
+
+
+def _normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).lower().split())
+
+
+def closure_rows(parents: dict[int, int | None]) -> list[dict[str, int]]:
+    """(ancestor, descendant, depth) rows for a parent map; cycles and dangling parents are cut."""
+    rows = []
+    for category_id in parents:
+        node: int | None = category_id
+        depth = 0
+        seen: set[int] = set()
+        while node is not None and node in parents and node not in seen:
+            seen.add(node)
+            rows.append({"ancestor_id": node, "descendant_id": category_id, "depth": depth})
+            node = parents[node]
+            depth += 1
+    return rows
+
+
+def rebuild_category_closure(connection: Connection) -> int:
+    """Recompute category_closure from categories.parent_id in the caller's transaction."""
+    parents = dict(connection.execute(select(Category.id, Category.parent_id)).all())
+    rows = closure_rows(parents)
+    connection.execute(delete(CategoryClosure))
+    if rows:
+        connection.execute(insert(CategoryClosure.__table__), rows)
+    print(f"[Categories] Rebuilt closure: {len(parents)} categories, {len(rows)} pairs")
+    return len(rows)
+
+
+def touch_category_products(connection: Connection, category_ids: list[int]) -> int:
+    """Bump updated_at of the products in these categories' subtrees so the indexer re-syncs them.
+
+    Their Qdrant `category_ids` payload lists every ancestor, which changes when the tree does.
+    """
+    if not category_ids:
+        return 0
+    subtree = select(CategoryClosure.descendant_id).where(CategoryClosure.ancestor_id.in_(category_ids))
+    result = connection.execute(
+        update(Product.__table__).where(Product.category_id.in_(subtree)).values(updated_at=datetime.utcnow())
+    )
+    return result.rowcount
+
+
+def populated_categories(db: Session | Connection) -> set[int]:
+    """Categories with at least one active product (read from the category index, not the table)."""
+    return set(
+        db.execute(
+            select(Product.category_id)
+            .where(Product.category_id.is_not(None), Product.is_active.is_(True))
+            .group_by(Product.category_id)
+        ).scalars()
+    )
+
+
+class CategoryTree:
+    """In-memory copy of the active category tree, for resolving a category name to an id.
+
+    `populated` holds the categories that have active products (None when unknown), so a search
+    is not scoped to a subtree with nothing in it.
+    """
+
+    def __init__(
+        self, categories: list[tuple[int, str, int | None]], populated: set[int] | None = None
+    ) -> None:
+        self.populated = populated
+        self.parents = {category_id: parent_id for category_id, _, parent_id in categories}
+        self.names = {category_id: _normalize(name) for category_id, name, _ in categories if name}
+        self.children: dict[int, list[int]] = {}
+        for category_id, parent_id in self.parents.items():
+            if parent_id is not None:
+                self.children.setdefault(parent_id, []).append(category_id)
+        self.depths = {category_id: len(self.ancestors(category_id)) - 1 for category_id in self.parents}
+
+    @classmethod
+    def load(cls, db: Session | Connection) -> "CategoryTree":
+        rows = db.execute(
+            select(Category.id, Category.name, Category.parent_id).where(Category.is_active.is_not(False))
+        ).all()
+        return cls([tuple(row) for row in rows], populated_categories(db))
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def ancestors(self, category_id: int | None) -> list[int]:
+        """The category and its ancestors, nearest first."""
+        chain: list[int] = []
+        node = category_id
+        while node is not None and node in self.parents and node not in chain:
+            chain.append(node)
+            node = self.parents[node]
+        return chain
+
+    def subtree(self, category_id: int) -> set[int]:
+        found = {category_id}
+        stack = [category_id]
+        while stack:
+            for child in self.children.get(stack.pop(), ()):
+                if child not in found:
+                    found.add(child)
+                    stack.append(child)
+        return found
+
+    def has_products(self, category_id: int) -> bool:
+        if self.populated is None:
+            return True
+        return not self.populated.isdisjoint(self.subtree(category_id))
+
+    def resolve(self, name: str | None) -> int | None:
+        """Category for a group name such as "rau củ": exact name, else the broadest name overlap."""
+        if not name:
+            return None
+        term = _normalize(name)
+        matches = []
+        for category_id, category_name in self.names.items():
+            if category_name == term:
+                return category_id
+            if term in category_name or category_name in term:
+                matches.append(category_id)
+        if not matches:
+            return None
+        return min(matches, key=lambda category_id: (self.depths[category_id], len(self.names[category_id])))
+
+    def match(self, message: str | None) -> int | None:
+        """Most specific category named in a message.
+
+        A category matches when its whole name, or at least its first two words ("rau củ" for
+        "Rau củ quả"), appear in the message as a phrase.
+        """
+        if not message:
+            return None
+        text = f" {_normalize(message)} "
+        best: int | None = None
+        for category_id, category_name in self.names.items():
+            words = category_name.split()
+            phrases = {category_name} | ({" ".join(words[:2])} if len(words) > 2 else set())
+            if any(f" {phrase} " in text for phrase in phrases):
+                key = (self.depths[category_id], len(category_name))
+                if best is None or key > (self.depths[best], len(self.names[best])):
+                    best = category_id
+        return best
+
+
+class CategoryTreeCache:
+    """Process-wide CategoryTree reloaded every `ttl` seconds and after category changes commit."""
+
+    def __init__(self, settings: Settings) -> None:
+        self.ttl = settings.category_tree_ttl_seconds
+        self._tree: CategoryTree | None = None
+        self._loaded_at = 0.0
+        self._lock = Lock()
+
+    def get(self, db: Session | Connection) -> CategoryTree:
+        tree = self._tree
+        if tree is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return tree
+        with self._lock:
+            if self._tree is None or time.monotonic() - self._loaded_at >= self.ttl:
+                with metrics.timer("categories.load_latency"):
+                    self._tree = CategoryTree.load(db)
+                self._loaded_at = time.monotonic()
+            return self._tree
+
+    def invalidate(self) -> None:
+        self._loaded_at = 0.0
+
+
+@lru_cache(maxsize=1)
+def get_category_tree_cache() -> CategoryTreeCache:
+    return CategoryTreeCache(get_settings())
+
+
+def assign_product_categories(
+    connection: Connection, *, reassign: bool = False, batch_size: int = 1000
+) -> int:
+    """Set products.category_id to the most specific category named in the product name.
+
+    Only products without a category are touched unless `reassign`; names that match no
+    category are left alone.
+    """
+    tree = CategoryTree.load(connection)
+    table = Product.__table__
+    statement = update(table).where(table.c.id == bindparam("_id")).values(category_id=bindparam("_category_id"))
+    last_id = 0
+    assigned = 0
+    while True:
+        query = select(table.c.id, table.c.product_name, table.c.title, table.c.category_id).where(
+            table.c.id > last_id
+        )
+        if not reassign:
+            query = query.where(table.c.category_id.is_(None))
+        rows = connection.execute(query.order_by(table.c.id).limit(batch_size)).all()
+        if not rows:
+            return assigned
+        params = []
+        for row in rows:
+            category_id = tree.match(row.product_name or row.title)
+            if category_id is not None and category_id != row.category_id:
+                params.append({"_id": row.id, "_category_id": category_id})
+        if params:
+            connection.execute(statement, params)
+            assigned += len(params)
+        last_id = rows[-1].id
+
+
+def _assign_category(mapper, connection: Connection, target: Product) -> None:
+    if target.category_id is None and target.category is None:
+        target.category_id = get_category_tree_cache().get(connection).match(target.product_name or target.title)
+
+
+def _rebuild_after_flush(session: Session, flush_context) -> None:
+    changed = (*session.new, *session.dirty, *session.deleted)
+    if any(isinstance(instance, Category) for instance in changed):
+        connection = session.connection()
+        rebuild_category_closure(connection)
+        # Only edited categories move products in the tree; a new one has no products yet.
+        moved = [instance.id for instance in session.dirty if isinstance(instance, Category)]
+        touched = touch_category_products(connection, moved)
+        if touched:
+            print(f"[Categories] Marked {touched} products for re-indexing")
+        session.info["chatbot_categories_changed"] = True
+
+
+def _invalidate_after_commit(session: Session) -> None:
+    if session.info.pop("chatbot_categories_changed", False):
+        get_category_tree_cache().invalidate()
+
+
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop("chatbot_categories_changed", None)
+
+
+def register_category_hooks() -> None:
+    """Rebuild the closure in the transaction that changes a category; reload the tree after commit.
+
+    New products without a category get the one their name matches.
+    """
+    if event.contains(Session, "after_flush", _rebuild_after_flush):
+        return
+    event.listen(Session, "after_flush", _rebuild_after_flush)
+    event.listen(Product, "before_insert", _assign_category)
+    event.listen(Session, "after_commit", _invalidate_after_commit)
+    event.listen(Session, "after_rollback", _discard_after_rollback)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the category closure and product categories")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="rebuild",
+        choices=("rebuild", "assign"),
+        help="rebuild: recompute the closure; assign: categorize products by name",
+    )
+    parser.add_argument("--reassign", action="store_true", help="assign: also re-match products with a category")
+    args = parser.parse_args()
+
+    from db.database import get_engine
+
+    with get_engine().begin() as connection:
+        if args.command == "rebuild":
+            rebuild_category_closure(connection)
+            return
+        assigned = assign_product_categories(connection, reassign=args.reassign)
+    print(f"[Categories] Assigned categories to {assigned} products")
+
+
+if __name__ == "__main__":
+    main()
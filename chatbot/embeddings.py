@@ -0,0 +1,98 @@
+import re
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Iterable
+from threading import Lock
+from typing import Any
+
+from core.config import Settings
+from core.metrics import metrics
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip().lower()
+
+
+class TextEmbedder:
+    """Lazily loads the fastembed model so importing this module stays cheap."""
+
+    def __init__(self, settings: Settings, model: Any | None = None) -> None:
+        self.model_name = settings.embedding_model
+        self.batch_size = settings.embedding_batch_size
+        self.cache_size = settings.embedding_cache_size
+        self._model = model
+        self._cache: OrderedDict[str, list[float]] = OrderedDict()
+        self._cache_lock = Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def model(self) -> Any:
+        if self._model is None:
+            from fastembed import TextEmbedding
+
+            self._model = TextEmbedding(model_name=self.model_name)
+            print(f"[Embeddings] Loaded embedding model {self.model_name}")
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        if hasattr(self.model, "get_embedding_size"):
+            return self.model.get_embedding_size(self.model_name)
+        return len(self.embed_documents(["dimension probe"])[0])
+
+    def embed_documents(self, texts: Iterable[str]) -> list[list[float]]:
+        vectors = self.model.embed(list(texts), batch_size=self.batch_size)
+        return [vector.tolist() if hasattr(vector, "tolist") else list(vector) for vector in vectors]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: Iterable[str]) -> list[list[float]]:
+        """Embed queries through the LRU cache; misses are embedded together in one model call."""
+        keys = [normalize_query(text) for text in texts]
+        found: dict[str, list[float]] = {}
+        with self._cache_lock:
+            for key in keys:
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = vector
+            hits = sum(1 for key in keys if key in found)
+            self._hits += hits
+            self._misses += len(keys) - hits
+        misses = list(dict.fromkeys(key for key in keys if key not in found))
+        metrics.incr("embeddings.cache_hits", hits)
+        metrics.incr("embeddings.cache_misses", len(keys) - hits)
+
+        if misses:
+            with metrics.timer("embeddings.query_latency"):
+                vectors = self.embed_documents(misses)
+            with self._cache_lock:
+                for key, vector in zip(misses, vectors):
+                    found[key] = vector
+                    self._cache[key] = vector
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return [found[key] for key in keys]
+
+    def warm_up(self, queries: Iterable[str]) -> int:
+        """Pre-populate the query cache, e.g. with the most common searches at startup."""
+        queries = [query for query in queries if query and query.strip()]
+        if queries:
+            self.embed_queries(queries)
+        return len(queries)
+
+    def cache_stats(self) -> dict[str, float]:
+        """This embedder's own cache; the `embeddings.*` metrics add up every embedder in the process."""
+        with self._cache_lock:
+            hits, misses, size = self._hits, self._misses, len(self._cache)
+        total = hits + misses
+        return {
+            "size": size,
+            "capacity": self.cache_size,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,133 @@
+"""
+Post-processing for LLM replies.
+
+TableStripper rewrites Markdown tables into comma-separated text in one pass over the lines and
+works incrementally, so it can sit on a token stream as well as on a full reply.
+"""
+
+import json
+import re
+from typing import Any
+
+from langchain_core.utils.json import parse_partial_json
+
+TABLE_SEPARATOR_RE = re.compile(r"^[\|\-\s:]+$")
+BLANK_RUN_RE = re.compile(r"\n{3,}")
+# Any line that could be a table separator ("---", ":--:") starts with "-" or ":" after indentation.
+SEPARATOR_CANDIDATE_RE = re.compile(r"^[^\S\n]*[\-:]", re.M)
+
+
+class TableStripper:
+    """Incremental table remover: feed() chunks as they arrive, then flush() once at the end.
+
+    The concatenated output equals remove_table_format() of the concatenated input: table rows
+    become "a, b, c", separator rows and the blank line closing a table are dropped, runs of blank
+    lines collapse to one and the result is stripped.
+    """
+
+    def __init__(self) -> None:
+        self._partial = ""
+        self._in_table = False
+        self._started = False
+        self._pending = ""
+
+    def feed(self, chunk: str) -> str:
+        if "\n" not in chunk:
+            self._partial += chunk
+            return ""
+        lines = (self._partial + chunk).split("\n")
+        self._partial = lines.pop()
+        return "".join(self._emit(line) for line in lines)
+
+    def flush(self) -> str:
+        output = self._emit(self._partial) if self._partial else ""
+        self._partial = ""
+        self._pending = ""
+        return output
+
+    def _emit(self, line: str) -> str:
+        kept = self._filter(line)
+        if kept is None:
+            return ""
+        if not self._started:
+            kept = kept.lstrip()
+            if not kept:
+                return ""
+            self._started = True
+            content = kept.rstrip()
+            self._pending = kept[len(content):]
+            return content
+        content = kept.rstrip()
+        if not content:
+            self._pending += "\n" + kept
+            return ""
+        gap = self._pending + "\n"
+        self._pending = kept[len(content):]
+        if "\n\n\n" in gap:
+            gap = BLANK_RUN_RE.sub("\n\n", gap)
+        return gap + content
+
+    def _filter(self, line: str) -> str | None:
+        if "|" not in line and "-" not in line and ":" not in line:
+            if self._in_table:
+                if not line.strip():
+                    self._in_table = False
+                return None
+            return line
+        stripped = line.strip()
+        if stripped and TABLE_SEPARATOR_RE.match(stripped):
+            self._in_table = True
+            return None
+        if stripped.count("|") >= 2:
+            self._in_table = True
+            parts = [part.strip() for part in stripped.split("|") if part.strip()]
+            return ", ".join(parts) if parts else None
+        if self._in_table:
+            if not stripped:
+                self._in_table = False
+            return None
+        return line
+
+
+def remove_table_format(text: str) -> str:
+    if "|" not in text and not SEPARATOR_CANDIDATE_RE.search(text):
+        # No table markup at all: only the strip and blank-run collapse apply.
+        text = text.strip()
+        return BLANK_RUN_RE.sub("\n\n", text) if "\n\n\n" in text else text
+    stripper = TableStripper()
+    return stripper.feed(text) + stripper.flush()
+
+
+def strip_code_fence(payload: str) -> str:
+    """Drop a surrounding Markdown code fence (```json ... ```) if present."""
+    raw = payload.strip()
+    if not raw.startswith("```"):
+        return raw
+    # splitlines() so CRLF and bare CR replies are unfenced too.
+    lines = raw.splitlines()[1:]
+    if lines and lines[-1].lstrip().startswith("```"):
+        lines = lines[:-1]
+    return "\n".join(lines).strip()
+
+
+def load_json_object(text: str) -> dict[str, Any] | None:
+    """Best-effort JSON object from an LLM reply.
+
+    Accepts fenced blocks, prose around the object and truncated output (unclosed strings,
+    arrays or objects are closed); returns None when no object can be recovered.
+    """
+    raw = strip_code_fence(text)
+    start = raw.find("{")
+    if start == -1:
+        return None
+    try:
+        data = parse_partial_json(raw[start:])
+    except Exception:
+        data = None
+    if data is None:
+        # Trailing prose after a complete object: decode just the object.
+        try:
+            data, _ = json.JSONDecoder().raw_decode(raw, start)
+        except json.JSONDecodeError:
+            return None
+    return data if isinstance(data, dict) else None
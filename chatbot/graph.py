@@ -1,20 +1,31 @@
 import re
+import time
+from collections.abc import Callable
 
 from langgraph.graph import END, START, StateGraph
 from sqlalchemy.orm import Session
 
+from chatbot.capture import TurnCapture
+from chatbot.categories import get_category_tree_cache
 from chatbot.llm import LLMAnalyzer
 from chatbot.memory import ConversationMemory
 from chatbot.rag import QdrantRAG
 from chatbot.redis_memory import RedisConversationMemory
+from chatbot.session_lock import TurnTicket
+from chatbot.speculation import SpeculativeTools
 from chatbot.state import ChatbotState
 from chatbot.tools import get_user_orders, get_user_profile, search_products_by_keyword, suggest_products
+from chatbot.unit_price import format_unit_price, parse_unit_price_query
+from chatbot.user_cache import UserDataCache
+from core.metrics import metrics
 
 INTENT_KEYWORDS = {
     "orders": ["order", "orders", "tracking", "shipment"],
     "profile": ["profile", "account", "information", "user"],
 }
 
+RERANK_CANDIDATES = 50
+
 STOP_WORDS = {
     "i",
     "me",
@@ -36,16 +47,29 @@ def _analyze_conversation(
 ) -> ChatbotState:
     session_id = state.get("session_id", "")
     current_message = state.get("message", "")
+    if "conversation_context" in state:
+        print(f"[LangGraph] Conversation context already resolved for session {session_id}")
+        return state
     print(f"[LangGraph] Analyzing conversation for session {session_id}")
 
-    if redis_memory and redis_memory.available:
-        recent_messages = redis_memory.get_recent_messages(session_id, limit=5)
+    # Readable while Redis is down too: messages still buffered for it are history as well.
+    if redis_memory and redis_memory.readable:
+        recent_messages = state.get("recent_messages")
+        if recent_messages is None:
+            recent_messages = redis_memory.get_recent_messages(session_id, limit=5)
+        else:
+            print("[LangGraph] Using preloaded session history")
         state["recent_messages"] = recent_messages
 
         if recent_messages and ai and ai.available:
             context = ai.analyze_conversation(recent_messages, current_message)
             state["conversation_context"] = context
             print(f"[LangGraph] Conversation context: {context}")
+            if context and state.get("user_id"):
+                redis_memory.set_user_summary(state["user_id"], context)
+        elif state.get("prior_summary"):
+            state["conversation_context"] = state["prior_summary"]
+            print(f"[LangGraph] Using summary from the user's previous session: {state['prior_summary']}")
         else:
             state["conversation_context"] = None
             print("[LangGraph] No recent messages or AI unavailable, skipping conversation analysis")
@@ -60,6 +84,9 @@ def _analyze_conversation(
 def _detect_intent(ai: LLMAnalyzer | None, state: ChatbotState) -> ChatbotState:
     message = state.get("message", "")
     context = state.get("conversation_context")
+    if state.get("intent"):
+        print(f"[LangGraph] Intent already resolved: {state['intent']}")
+        return state
     print(f"[LangGraph] Detect intent for message: {message}")
     if context:
         print(f"[LangGraph] Using conversation context: {context}")
@@ -81,9 +108,12 @@ def _detect_intent(ai: LLMAnalyzer | None, state: ChatbotState) -> ChatbotState:
 
 def _extract_keywords(ai: LLMAnalyzer | None, state: ChatbotState) -> ChatbotState:
     message = state.get("message", "")
+    if "keywords" in state:
+        print(f"[LangGraph] Keywords already resolved: {state['keywords']}")
+        return _detect_unit_price(state)
     if ai and ai.available:
         print("[LangGraph] Using LLM to extract keywords")
-        keywords, summary, (min_price, max_price) = ai.extract_keywords(message)
+        keywords, summary, (min_price, max_price), category = ai.extract_keywords(message)
         keywords = keywords or []
     else:
         print("[LangGraph] Falling back to regex keyword extraction")
@@ -94,33 +124,109 @@ def _extract_keywords(ai: LLMAnalyzer | None, state: ChatbotState) -> ChatbotSta
         summary = message
         min_price = None
         max_price = None
+        category = None
     state["keywords"] = keywords
     state["product_query"] = summary
     state["min_price"] = min_price
     state["max_price"] = max_price
+    state["category"] = category
     print(f"[LangGraph] Extracted keywords: {keywords}")
+    return _detect_unit_price(state)
+
+
+def _detect_unit_price(state: ChatbotState) -> ChatbotState:
+    """Best-value requests ("rẻ nhất tính theo kg") are ranked by the stored unit price."""
+    query = parse_unit_price_query(state.get("message"))
+    state["unit_price_query"] = query
+    if query:
+        print(f"[LangGraph] Ranking by unit price: {query}")
+        if query.max_unit_price is not None and state.get("max_price") == query.max_unit_price:
+            # "dưới 100k/kg" is a budget per kg, not a pack price.
+            state["max_price"] = None
     return state
 
 
-def run_tools(state: ChatbotState, db: Session) -> ChatbotState:
+def _product_names(products: list[dict], with_unit_price: bool = False) -> str:
+    names = []
+    for product in products:
+        if not product.get("product_name"):
+            continue
+        if with_unit_price and product.get("unit_price") is not None:
+            price = format_unit_price(product["unit_price"], product["unit_price_unit"])
+            names.append(f"{product['product_name']} ({price})")
+        else:
+            names.append(product["product_name"])
+    return ", ".join(names)
+
+
+def _resolve_category(db: Session, state: ChatbotState) -> set[int] | None:
+    """Category subtree to restrict a product search to: the extracted category, else one named in the message."""
+    tree = get_category_tree_cache().get(db)
+    if "category_id" not in state:
+        category_id = tree.resolve(state.get("category"))
+        if category_id is None:
+            category_id = tree.match(state.get("message"))
+        if category_id is not None and not tree.has_products(category_id):
+            # A scoped search would find nothing and fall back to the full search anyway.
+            print(f"[LangGraph] Category {category_id} has no products, searching all products")
+            metrics.incr("categories.empty_subtree")
+            category_id = None
+        state["category_id"] = category_id
+        if category_id is not None:
+            print(f"[LangGraph] Restricting product search to category {category_id}")
+    return tree.subtree(state["category_id"]) if state["category_id"] is not None else None
+
+
+def run_tools(
+    state: ChatbotState,
+    db: Session,
+    rag: QdrantRAG | None = None,
+    user_cache: UserDataCache | None = None,
+    speculation: SpeculativeTools | None = None,
+) -> ChatbotState:
     intent = state.get("intent")
     print(f"[LangGraph] Running tools for intent: {intent}")
     if intent == "orders" and state.get("user_id"):
         print("[LangGraph] Fetching order history")
-        state["tool_result"] = {"orders": get_user_orders(db, state["user_id"])}
+        orders = speculation.orders_for(state["user_id"]) if speculation else None
+        if orders is None:
+            orders = (
+                user_cache.get_orders(db, state["user_id"]) if user_cache else get_user_orders(db, state["user_id"])
+            )
+        state["tool_result"] = {"orders": orders}
     elif intent == "profile" and state.get("user_id"):
         print("[LangGraph] Fetching user profile")
-        state["tool_result"] = {"profile": get_user_profile(db, state["user_id"])}
+        profile = (
+            user_cache.get_profile(db, state["user_id"]) if user_cache else get_user_profile(db, state["user_id"])
+        )
+        state["tool_result"] = {"profile": profile}
     else:
         print("[LangGraph] Searching products")
-        state["tool_result"] = {
-            "products": search_products_by_keyword(
+        category_ids = _resolve_category(db, state)
+        products = (
+            speculation.products_for(
+                state.get("keywords"),
+                min_price=state.get("min_price"),
+                max_price=state.get("max_price"),
+                unit_price=state.get("unit_price_query"),
+                category_ids=category_ids,
+            )
+            if speculation
+            else None
+        )
+        if products is None:
+            products = search_products_by_keyword(
                 db,
                 state.get("keywords"),
                 min_price=state.get("min_price"),
                 max_price=state.get("max_price"),
+                unit_price=state.get("unit_price_query"),
+                category_id=state.get("category_id"),
+                query_text=state.get("product_query"),
+                rag=rag,
+                candidate_limit=RERANK_CANDIDATES,
             )
-        }
+        state["tool_result"] = {"products": products}
     print(f"[LangGraph] Tool result keys: {list((state.get('tool_result') or {}).keys())}")
     return state
 
@@ -151,7 +257,10 @@ def craft_response(
     elif intent == "product_search":
         products = result.get("products", [])
         query_desc = state.get("product_query")
-        
+        if state.get("llm_mode", "full") != "full":
+            # Over a token budget: template reply instead of the product response model.
+            ai = None
+
         if products:
             ai_reply = (
                 ai.compose_product_response(query=query_desc, products=products, suggested_products=[])
@@ -161,7 +270,7 @@ def craft_response(
             if ai_reply:
                 reply = ai_reply
             else:
-                names = ", ".join(p["product_name"] for p in products if p.get("product_name"))
+                names = _product_names(products, with_unit_price=bool(state.get("unit_price_query")))
                 prefix = f"Bạn đang tìm: {query_desc}. " if query_desc else ""
                 reply = f"{prefix}Tôi tìm thấy các sản phẩm sau: {names}"
         else:
@@ -191,11 +300,10 @@ def craft_response(
 
     memory.append(state["session_id"], "assistant", reply)
 
-    if redis_memory and redis_memory.available:
+    if redis_memory and redis_memory.writable:
         session_id = state.get("session_id", "")
         user_message = state.get("message", "")
-        redis_memory.append(session_id, "user", user_message)
-        redis_memory.append(session_id, "assistant", reply)
+        redis_memory.append_turn(session_id, [("user", user_message), ("assistant", reply)])
         print(f"[LangGraph] Saved messages to Redis for session {session_id}")
 
     print(f"[LangGraph] Reply generated: {reply}")
@@ -203,19 +311,56 @@ def craft_response(
     return state
 
 
+def _timed(
+    stage: str,
+    node: Callable[[ChatbotState], ChatbotState],
+    turn: TurnTicket | None = None,
+    capture: TurnCapture | None = None,
+) -> Callable[[ChatbotState], ChatbotState]:
+    def run(state: ChatbotState) -> ChatbotState:
+        if turn:
+            turn.raise_if_superseded()
+        if capture is None:
+            with metrics.timer(f"graph.{stage}"):
+                return node(state)
+        before = dict(state)
+        started = time.perf_counter()
+        with metrics.timer(f"graph.{stage}"):
+            result = node(state)
+        capture.node(stage, time.perf_counter() - started, before, result)
+        return result
+
+    return run
+
+
 def build_graph(
     db: Session,
     memory: ConversationMemory,
     ai: LLMAnalyzer | None,
     redis_memory: RedisConversationMemory | None = None,
+    rag: QdrantRAG | None = None,
+    user_cache: UserDataCache | None = None,
+    speculation: SpeculativeTools | None = None,
+    turn: TurnTicket | None = None,
+    capture: TurnCapture | None = None,
 ) -> StateGraph:
     graph = StateGraph(ChatbotState)
 
-    graph.add_node("analyze", lambda state: _analyze_conversation(ai, redis_memory, state))
-    graph.add_node("intent", lambda state: _detect_intent(ai, state))
-    graph.add_node("keywords", lambda state: _extract_keywords(ai, state))
-    graph.add_node("tools", lambda state: run_tools(state, db))
-    graph.add_node("response", lambda state: craft_response(state, memory, ai, redis_memory, db))
+    def analyze(state: ChatbotState) -> ChatbotState:
+        if speculation:
+            speculation.launch(state)
+        return _analyze_conversation(ai, redis_memory, state)
+
+    graph.add_node("analyze", _timed("analyze", analyze, turn, capture))
+    graph.add_node("intent", _timed("intent", lambda state: _detect_intent(ai, state), turn, capture))
+    graph.add_node("keywords", _timed("keywords", lambda state: _extract_keywords(ai, state), turn, capture))
+    graph.add_node(
+        "tools", _timed("tools", lambda state: run_tools(state, db, rag, user_cache, speculation), turn, capture)
+    )
+    graph.add_node(
+        "response",
+        _timed("response", lambda state: craft_response(state, memory, ai, redis_memory, db), turn, capture),
+    )
 
     graph.add_edge(START, "analyze")
     graph.add_edge("analyze", "intent")
@@ -0,0 +1,294 @@
+"""
+Build and incrementally refresh the Qdrant `products` collection from MySQL.
+
+Usage:
+    python -m chatbot.indexer            # incremental sync since the last checkpoint
+    python -m chatbot.indexer --full     # re-index every product and drop points with no active product
+"""
+
+import argparse
+import json
+import os
+import time
+from collections.abc import Iterator
+from datetime import datetime
+from typing import Any
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, PayloadSchemaType, PointStruct, VectorParams
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from chatbot.categories import CategoryTree
+from chatbot.embeddings import TextEmbedder
+from chatbot.unit_price import unit_price
+from core.config import Settings, get_settings
+from models.models import Product
+
+
+class IndexCheckpoint:
+    """Keyset position persisted after every batch so an interrupted run can resume."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.mode = "incremental"
+        self.last_id = 0
+        self.last_updated_at: datetime | None = None
+        self.completed = True
+
+    def load(self) -> "IndexCheckpoint":
+        if not os.path.exists(self.path):
+            return self
+        with open(self.path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        self.mode = data.get("mode", "incremental")
+        self.last_id = int(data.get("last_id") or 0)
+        updated_at = data.get("last_updated_at")
+        self.last_updated_at = datetime.fromisoformat(updated_at) if updated_at else None
+        self.completed = bool(data.get("completed", True))
+        return self
+
+    def save(self) -> None:
+        data = {
+            "mode": self.mode,
+            "last_id": self.last_id,
+            "last_updated_at": self.last_updated_at.isoformat() if self.last_updated_at else None,
+            "completed": self.completed,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.replace(tmp_path, self.path)
+
+
+def product_page(
+    db: Session, mode: str, last_id: int, last_updated_at: datetime | None, limit: int
+) -> list[Product]:
+    """One keyset page: full runs walk the primary key, incremental runs walk (updated_at, id)."""
+    query = db.query(Product)
+    if mode == "full":
+        query = query.filter(Product.id > last_id).order_by(Product.id)
+    else:
+        if last_updated_at is not None:
+            query = query.filter(
+                or_(
+                    Product.updated_at > last_updated_at,
+                    and_(Product.updated_at == last_updated_at, Product.id > last_id),
+                )
+            )
+        query = query.order_by(Product.updated_at, Product.id)
+    return query.limit(limit).all()
+
+
+class ProductIndexer:
+    def __init__(
+        self,
+        settings: Settings,
+        *,
+        client: QdrantClient | None = None,
+        embedder: TextEmbedder | None = None,
+        checkpoint: IndexCheckpoint | None = None,
+    ) -> None:
+        self.collection = settings.qdrant_collection
+        self.vector_name = settings.qdrant_vector_name
+        self.batch_size = settings.index_batch_size
+        self.client = client or QdrantClient(
+            url=settings.qdrant_url,
+            api_key=settings.qdrant_api_key if settings.qdrant_api_key else None,
+        )
+        self.embedder = embedder or TextEmbedder(settings)
+        self.checkpoint = checkpoint or IndexCheckpoint(settings.index_checkpoint_path).load()
+
+    def ensure_collection(self) -> None:
+        if not self.client.collection_exists(self.collection):
+            self.client.create_collection(
+                collection_name=self.collection,
+                vectors_config={
+                    self.vector_name: VectorParams(size=self.embedder.dimension, distance=Distance.COSINE)
+                },
+            )
+            print(f"[Indexer] Created collection {self.collection}")
+        for field_name, field_schema in (
+            ("current_price", PayloadSchemaType.FLOAT),
+            ("unit_price", PayloadSchemaType.FLOAT),
+            ("unit_price_unit", PayloadSchemaType.KEYWORD),
+            ("category_ids", PayloadSchemaType.INTEGER),
+        ):
+            self.client.create_payload_index(
+                collection_name=self.collection, field_name=field_name, field_schema=field_schema
+            )
+
+    def run(self, db: Session, *, full: bool = False) -> dict[str, Any]:
+        checkpoint = self.checkpoint
+        if full:
+            checkpoint.mode = "full"
+            checkpoint.last_id = 0
+            checkpoint.last_updated_at = None
+            checkpoint.completed = False
+        elif checkpoint.completed:
+            checkpoint.mode = "incremental"
+            checkpoint.last_id = 0
+        else:
+            print(f"[Indexer] Resuming {checkpoint.mode} run after product id {checkpoint.last_id}")
+
+        self.ensure_collection()
+        checkpoint.completed = False
+        checkpoint.save()
+
+        tree = CategoryTree.load(db)
+        started = time.perf_counter()
+        upserted = deleted = 0
+        high_water = checkpoint.last_updated_at
+        for batch in self._stream_products(db, checkpoint):
+            active = [product for product in batch if product.is_active]
+            inactive_ids = [product.id for product in batch if not product.is_active]
+            if active:
+                vectors = self.embedder.embed_documents(self._document(product) for product in active)
+                self.client.upsert(
+                    collection_name=self.collection,
+                    points=[
+                        PointStruct(
+                            id=product.id,
+                            vector={self.vector_name: vector},
+                            payload=self._payload(product, tree.ancestors(product.category_id)),
+                        )
+                        for product, vector in zip(active, vectors)
+                    ],
+                    wait=True,
+                )
+                upserted += len(active)
+            if inactive_ids:
+                self.client.delete(collection_name=self.collection, points_selector=inactive_ids, wait=True)
+                deleted += len(inactive_ids)
+
+            batch_high = max((product.updated_at for product in batch if product.updated_at), default=None)
+            if batch_high and (high_water is None or batch_high > high_water):
+                high_water = batch_high
+            checkpoint.last_id = batch[-1].id
+            checkpoint.last_updated_at = high_water
+            checkpoint.save()
+
+            elapsed = time.perf_counter() - started
+            print(
+                f"[Indexer] Processed {upserted + deleted} products "
+                f"({(upserted + deleted) / elapsed:.1f}/s), last id {checkpoint.last_id}"
+            )
+
+        if checkpoint.mode == "full":
+            # Hard-deleted rows never show up in the product stream; sweep what the index still holds.
+            deleted += self._delete_missing(db)
+
+        checkpoint.mode = "incremental"
+        checkpoint.last_id = 0
+        checkpoint.last_updated_at = high_water
+        checkpoint.completed = True
+        checkpoint.save()
+
+        elapsed = time.perf_counter() - started
+        stats = {
+            "upserted": upserted,
+            "deleted": deleted,
+            "seconds": round(elapsed, 3),
+            "products_per_second": round((upserted + deleted) / elapsed, 1) if elapsed else 0.0,
+        }
+        print(f"[Indexer] Finished: {stats}")
+        return stats
+
+    def _delete_missing(self, db: Session) -> int:
+        """Delete points whose product no longer exists or is inactive, one scroll page at a time."""
+        deleted = 0
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection,
+                limit=self.batch_size,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False,
+            )
+            point_ids = [point.id for point in points]
+            if point_ids:
+                live = {
+                    product_id
+                    for (product_id,) in db.query(Product.id).filter(
+                        Product.id.in_(point_ids), Product.is_active.is_(True)
+                    )
+                }
+                missing = [point_id for point_id in point_ids if point_id not in live]
+                if missing:
+                    self.client.delete(collection_name=self.collection, points_selector=missing, wait=True)
+                    deleted += len(missing)
+            if offset is None:
+                break
+        if deleted:
+            print(f"[Indexer] Removed {deleted} points with no active product")
+        return deleted
+
+    def _stream_products(self, db: Session, checkpoint: IndexCheckpoint) -> Iterator[list[Product]]:
+        """Pages of `product_page` from the checkpoint position; the session is cleared between pages."""
+        last_id = checkpoint.last_id
+        last_updated_at = checkpoint.last_updated_at
+        while True:
+            batch = product_page(db, checkpoint.mode, last_id, last_updated_at, self.batch_size)
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1].id
+            last_updated_at = batch[-1].updated_at or last_updated_at
+            db.expunge_all()
+
+    @staticmethod
+    def _document(product: Product) -> str:
+        parts = [product.product_name or product.title or "", product.unit or "", product.description or ""]
+        return " ".join(part for part in parts if part)[:1000]
+
+    @staticmethod
+    def _payload(product: Product, category_ids: list[int]) -> dict[str, Any]:
+        if product.unit_price is not None:
+            parsed = (float(product.unit_price), product.unit_price_unit)
+        else:
+            # Written outside the ORM and not backfilled yet.
+            parsed = unit_price(
+                product.current_price, product.current_price_text, product.unit, product.product_name
+            )
+        return {
+            "product_id": str(product.id),
+            "product_code": product.product_code,
+            "product_name": product.product_name,
+            "title": product.title,
+            "current_price": float(product.current_price or 0),
+            "current_price_text": product.current_price_text,
+            "unit": product.unit,
+            "product_url": product.product_url,
+            "image_url": product.image_url,
+            "discount_percent": product.discount_percent,
+            "stock_quantity": product.stock_quantity,
+            "unit_price": parsed[0] if parsed else None,
+            "unit_price_unit": parsed[1] if parsed else None,
+            "category_id": product.category_id,
+            "category_ids": category_ids,
+            "updated_at": product.updated_at.isoformat() if product.updated_at else None,
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sync products from the database into Qdrant")
+    parser.add_argument("--full", action="store_true", help="rebuild the whole index instead of syncing changes")
+    parser.add_argument("--batch-size", type=int, default=None, help="products per DB page / upsert")
+    args = parser.parse_args()
+
+    from db.database import new_session
+
+    settings = get_settings()
+    indexer = ProductIndexer(settings)
+    if args.batch_size:
+        indexer.batch_size = args.batch_size
+    db = new_session()
+    try:
+        indexer.run(db, full=args.full)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
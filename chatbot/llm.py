@@ -1,155 +1,246 @@
 from __future__ import annotations
 
 import json
+from collections.abc import Callable, Iterator
 from typing import Any
 
+from langchain_core.language_models import BaseChatModel
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI
 
 from core.config import Settings
+from core.health import CallBreaker, health
+from chatbot.formatting import TableStripper, remove_table_format
 from chatbot.prompts import (
     CONVERSATION_ANALYSIS_PROMPT,
     INTENT_PROMPT,
     KEYWORD_PROMPT,
     PRODUCT_RESPONSE_PROMPT,
 )
+from chatbot.structured import (
+    ConversationOutput,
+    IntentOutput,
+    KeywordOutput,
+    ModelUsageCallback,
+    StructuredChain,
+    TieredChain,
+    model_label,
+    turn_callbacks,
+)
+from chatbot.token_budget import TurnUsage, current_turn_usage, step_tags
+
+# (keywords, query summary, (min_price, max_price), category name)
+KeywordResult = tuple[list[str] | None, str | None, tuple[float | None, float | None], str | None]
+
+
+# Chains that may escalate: name -> (prompt, schema)
+STEP_PROMPTS: dict[str, tuple[ChatPromptTemplate, type]] = {
+    "intent": (ChatPromptTemplate.from_messages([("system", INTENT_PROMPT), ("human", "{message}")]), IntentOutput),
+    "keywords": (
+        ChatPromptTemplate.from_messages([("system", KEYWORD_PROMPT), ("human", "{message}")]),
+        KeywordOutput,
+    ),
+    "conversation": (
+        ChatPromptTemplate.from_messages(
+            [
+                ("system", CONVERSATION_ANALYSIS_PROMPT),
+                ("human", "Recent messages:\n{messages}\n\nCurrent message: {current_message}"),
+            ]
+        ),
+        ConversationOutput,
+    ),
+}
+PRODUCT_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", PRODUCT_RESPONSE_PROMPT),
+        ("human", "user_query: {query}\nproducts: {products}\nsuggested_products: {suggested_products}"),
+    ]
+)
 
 
 class LLMAnalyzer:
-    def __init__(self, settings: Settings) -> None:
+    def __init__(self, settings: Settings, model: BaseChatModel | None = None) -> None:
         api_key = settings.gemini_api_key
-        if not api_key:
+        self.settings = settings
+        self.batch_concurrency = settings.batch_max_concurrency
+        self.model_name = settings.gemini_model
+        if model is None and not api_key:
             self.model = None
             return
 
-        self.model = ChatGoogleGenerativeAI(
-            model=settings.gemini_model,
-            api_key=api_key,
-            temperature=0,
+        # Gemini's health comes from the outcome of real calls, not a probe of its metadata endpoint.
+        self.breaker = CallBreaker(
+            "gemini", health, failures=settings.llm_breaker_failures, cooldown=settings.llm_breaker_cooldown_seconds
         )
-        self.intent_chain = (
-            ChatPromptTemplate.from_messages(
-                [
-                    (
-                        "system",
-                        INTENT_PROMPT,
-                    ),
-                    ("human", "{message}"),
-                ]
-            )
-            | self.model
-            | StrOutputParser()
+        # An injected model (tests, load test) serves every step and never escalates.
+        self._injected = model
+        self._models: dict[tuple[str, float, float | None], BaseChatModel] = {}
+        # Default client, shared with steps that use the defaults; carries no step's timeout.
+        self.model = model or self._model(settings.gemini_model, 0.0, None)
+        min_confidence = settings.llm_intent_min_confidence
+        self.intent_chain = self._step_chain(
+            "intent", unsure=lambda result: result.confidence is not None and result.confidence < min_confidence
         )
-        self.keyword_chain = (
-            ChatPromptTemplate.from_messages(
-                [
-                    (
-                        "system",
-                        KEYWORD_PROMPT,
-                    ),
-                    ("human", "{message}"),
-                ]
-            )
-            | self.model
-            | StrOutputParser()
+        self.keyword_chain = self._step_chain("keywords", unsure=lambda result: not result.keywords)
+        self.conversation_chain = self._step_chain("conversation")
+
+        product_model = self._model(
+            settings.llm_product_model or settings.gemini_model,
+            settings.llm_product_temperature,
+            settings.llm_product_timeout_seconds,
         )
-        self.conversation_chain = (
-            ChatPromptTemplate.from_messages(
-                [
-                    (
-                        "system",
-                        CONVERSATION_ANALYSIS_PROMPT,
-                    ),
-                    (
-                        "human",
-                        "Recent messages:\n{messages}\n\nCurrent message: {current_message}",
-                    ),
-                ]
+        self.product_callback = ModelUsageCallback(model_label(product_model), self.breaker)
+        self.product_chain = PRODUCT_PROMPT | product_model | StrOutputParser()
+
+    def _model(self, name: str, temperature: float, timeout: float | None) -> BaseChatModel:
+        if self._injected is not None:
+            return self._injected
+        key = (name, temperature, timeout)
+        if key not in self._models:
+            self._models[key] = ChatGoogleGenerativeAI(
+                model=name,
+                api_key=self.settings.gemini_api_key,
+                temperature=temperature,
+                timeout=timeout,
             )
-            | self.model
-            | StrOutputParser()
-        )
-        self.product_chain = (
-            ChatPromptTemplate.from_messages(
-                [
-                    (
-                        "system",
-                        PRODUCT_RESPONSE_PROMPT,
-                    ),
-                    (
-                        "human",
-                        "user_query: {query}\nproducts: {products}\nsuggested_products: {suggested_products}",
-                    ),
-                ]
+        return self._models[key]
+
+    def _step_chain(self, name: str, unsure: Callable[[Any], bool] | None = None) -> TieredChain:
+        settings = self.settings
+        prompt, schema = STEP_PROMPTS[name]
+        model_name = getattr(settings, f"llm_{name}_model") or settings.gemini_model
+        temperature = getattr(settings, f"llm_{name}_temperature")
+        timeout = getattr(settings, f"llm_{name}_timeout_seconds")
+        escalation_name = settings.llm_escalation_model or settings.gemini_model
+        escalates = self._injected is None and escalation_name != model_name
+
+        def chain(model: BaseChatModel, retry_deadline: float) -> StructuredChain:
+            return StructuredChain(
+                name,
+                prompt,
+                model,
+                schema,
+                structured=settings.llm_structured_output,
+                retry_deadline=retry_deadline,
+                batch_concurrency=self.batch_concurrency,
+                breaker=self.breaker,
             )
-            | self.model
-            | StrOutputParser()
+
+        if not escalates:
+            model = self._model(model_name, temperature, timeout)
+            return TieredChain(chain(model, settings.llm_retry_deadline_seconds))
+        # Escalating replaces the same-model retry: a bad answer goes straight to the larger model.
+        return TieredChain(
+            chain(self._model(model_name, temperature, timeout), 0),
+            chain(self._model(escalation_name, temperature, timeout), 0),
+            unsure,
         )
 
     @property
     def available(self) -> bool:
-        return self.model is not None
+        return self.model is not None and health.is_up("gemini")
 
     def classify_intent(self, message: str) -> str | None:
         if not self.available:
             return None
-        result = self.intent_chain.invoke({"message": message})
-        data = self._load_json(result)
-        intent = data.get("intent") if isinstance(data, dict) else None
-        print(f"[LLM] Intent data: {data}")
-        return intent
-
-    def extract_keywords(
-        self, message: str
-    ) -> tuple[list[str] | None, str | None, tuple[float | None, float | None]]:
+        return self._parse_intent(self.intent_chain.invoke({"message": message}))
+
+    def classify_intents(self, messages: list[str], usages: list[TurnUsage | None] | None = None) -> list[str | None]:
+        """Classify many messages with one batched chain call; failed items come back as None."""
+        if not self.available or not messages:
+            return [None] * len(messages)
+        results = self.intent_chain.batch([{"message": message} for message in messages], usages)
+        return [self._parse_intent(result) for result in results]
+
+    @staticmethod
+    def _parse_intent(result: IntentOutput | None) -> str | None:
+        print(f"[LLM] Intent data: {result}")
+        return result.intent if result else None
+
+    def extract_keywords(self, message: str) -> KeywordResult:
         if not self.available:
-            return None, None, (None, None)
-        result = self.keyword_chain.invoke({"message": message})
-        data = self._load_json(result) or {}
-        print(f"[LLM] Keyword payload: {data}")
-        keywords = data.get("keywords")
-        summary = data.get("query")
-        min_price = data.get("min_price")
-        max_price = data.get("max_price")
+            return None, None, (None, None), None
+        return self._parse_keywords(self.keyword_chain.invoke({"message": message}))
+
+    def extract_keywords_batch(
+        self, messages: list[str], usages: list[TurnUsage | None] | None = None
+    ) -> list[KeywordResult]:
+        if not self.available or not messages:
+            return [(None, None, (None, None), None)] * len(messages)
+        results = self.keyword_chain.batch([{"message": message} for message in messages], usages)
+        return [self._parse_keywords(result) for result in results]
+
+    @staticmethod
+    def _parse_keywords(result: KeywordOutput | None) -> KeywordResult:
+        print(f"[LLM] Keyword payload: {result}")
+        if result is None:
+            return None, None, (None, None), None
 
         cleaned: list[str] | None = None
-        if isinstance(keywords, list):
-            cleaned = [str(keyword).strip() for keyword in keywords if str(keyword).strip()]
+        if result.keywords is not None:
+            cleaned = [keyword.strip() for keyword in result.keywords if keyword.strip()]
 
-        summary_text = summary if isinstance(summary, str) and summary.strip() else None
-        min_price_val = float(min_price) if isinstance(min_price, (int, float)) else None
-        max_price_val = float(max_price) if isinstance(max_price, (int, float)) else None
+        summary_text = result.query if result.query and result.query.strip() else None
+        category = result.category.strip() if result.category and result.category.strip() else None
 
-        print(f"[LLM] Parsed keywords: {cleaned}, min_price={min_price_val}, max_price={max_price_val}")
-        return cleaned, summary_text, (min_price_val, max_price_val)
+        print(
+            f"[LLM] Parsed keywords: {cleaned}, min_price={result.min_price}, max_price={result.max_price}, "
+            f"category={category}"
+        )
+        return cleaned, summary_text, (result.min_price, result.max_price), category
 
     def analyze_conversation(self, recent_messages: list[dict], current_message: str) -> str | None:
         if not self.available or not recent_messages:
             return None
 
         try:
-            messages_text = "\n".join(
-                [
-                    f"{msg.get('role', 'unknown')}: {msg.get('content', '')}"
-                    for msg in recent_messages
-                ]
-            )
-            payload = {
-                "messages": messages_text,
-                "current_message": current_message,
-            }
-            result = self.conversation_chain.invoke(payload)
-            data = self._load_json(result) or {}
-            context = data.get("context")
-            if isinstance(context, str) and context.strip():
-                print(f"[LLM] Conversation context: {context}")
-                return context.strip()
-            return None
+            result = self.conversation_chain.invoke(self._conversation_payload(recent_messages, current_message))
+            return self._parse_context(result)
         except Exception as e:
             print(f"[LLM] Error analyzing conversation: {e}")
             return None
 
+    def analyze_conversations(
+        self, items: list[tuple[list[dict], str]], usages: list[TurnUsage | None] | None = None
+    ) -> list[str | None]:
+        """Batched analyze_conversation; items without history are skipped without an LLM call."""
+        contexts: list[str | None] = [None] * len(items)
+        indexed = [(index, recent, current) for index, (recent, current) in enumerate(items) if recent]
+        if not self.available or not indexed:
+            return contexts
+        results = self.conversation_chain.batch(
+            [self._conversation_payload(recent, current) for _, recent, current in indexed],
+            [usages[index] for index, _, _ in indexed] if usages else None,
+        )
+        for (index, _, _), result in zip(indexed, results):
+            contexts[index] = self._parse_context(result)
+        return contexts
+
+    @staticmethod
+    def _conversation_payload(recent_messages: list[dict], current_message: str) -> dict[str, str]:
+        messages_text = "\n".join(
+            [
+                f"{msg.get('role', 'unknown')}: {msg.get('content', '')}"
+                for msg in recent_messages
+            ]
+        )
+        return {
+            "messages": messages_text,
+            "current_message": current_message,
+        }
+
+    @staticmethod
+    def _parse_context(result: ConversationOutput | None) -> str | None:
+        if result and result.context.strip():
+            print(f"[LLM] Conversation context: {result.context}")
+            return result.context.strip()
+        return None
+
+    def _product_config(self) -> dict[str, Any]:
+        callbacks = [self.product_callback, *turn_callbacks(current_turn_usage())]
+        return {"callbacks": callbacks, "tags": step_tags("product")}
+
     def compose_product_response(
         self, *, query: str | None, products: list[dict], suggested_products: list[dict] | None = None
     ) -> str | None:
@@ -160,57 +251,34 @@ class LLMAnalyzer:
             "products": json.dumps(products, ensure_ascii=False),
             "suggested_products": json.dumps(suggested_products or [], ensure_ascii=False),
         }
-        response = self.product_chain.invoke(payload)
+        response = self.product_chain.invoke(payload, config=self._product_config())
         if isinstance(response, str):
             cleaned = response.strip()
             cleaned = self._remove_table_format(cleaned)
             return cleaned
         return None
 
+    def stream_product_response(
+        self, *, query: str | None, products: list[dict], suggested_products: list[dict] | None = None
+    ) -> Iterator[str]:
+        """Streamed compose_product_response: yields cleaned text as complete lines arrive."""
+        if not self.available:
+            return
+        payload = {
+            "query": query or "",
+            "products": json.dumps(products, ensure_ascii=False),
+            "suggested_products": json.dumps(suggested_products or [], ensure_ascii=False),
+        }
+        stripper = TableStripper()
+        for chunk in self.product_chain.stream(payload, config=self._product_config()):
+            cleaned = stripper.feed(chunk)
+            if cleaned:
+                yield cleaned
+        tail = stripper.flush()
+        if tail:
+            yield tail
+
     @staticmethod
     def _remove_table_format(text: str) -> str:
         """Remove table formatting from text response."""
-        import re
-
-        lines = text.split("\n")
-        cleaned_lines = []
-        in_table = False
-
-        for line in lines:
-            stripped = line.strip()
-            if re.match(r"^[\|\-\s:]+$", stripped):
-                in_table = True
-                continue
-            if "|" in stripped and stripped.count("|") >= 2:
-                in_table = True
-                parts = [p.strip() for p in stripped.split("|") if p.strip()]
-                if parts:
-                    cleaned_lines.append(", ".join(parts))
-                continue
-            if in_table and not stripped:
-                in_table = False
-                continue
-            if not in_table:
-                cleaned_lines.append(line)
-
-        result = "\n".join(cleaned_lines).strip()
-        result = re.sub(r"\n{3,}", "\n\n", result)
-        return result
-
-    @staticmethod
-    def _load_json(payload: str) -> dict | None:
-        raw = payload.strip()
-        if raw.startswith("```"):
-            lines = raw.splitlines()
-            # drop opening fence line (e.g. ```json)
-            lines = lines[1:]
-            # drop closing fence if present
-            if lines and lines[-1].strip().startswith("```"):
-                lines = lines[:-1]
-            raw = "\n".join(lines).strip()
-        try:
-            return json.loads(raw)
-        except json.JSONDecodeError:
-            print("[LLM] Failed to parse JSON payload", raw)
-            return None
-
+        return remove_table_format(text)
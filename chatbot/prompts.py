@@ -9,7 +9,8 @@ INTENT_PROMPT = (
     "Nhiệm vụ: xác định intent phù hợp cho câu tiếng Việt của người dùng. "
     "Intent hợp lệ: orders, profile, product_search. "
     "Chọn product_search khi người dùng muốn tìm, so sánh hoặc hỏi về sản phẩm. "
-    "Trả về JSON: {{\"intent\": \"value\"}}."
+    "Điền confidence từ 0 đến 1 cho biết bạn chắc chắn đến đâu; câu mơ hồ hoặc nhiều ý thì confidence thấp. "
+    "Trả về JSON: {{\"intent\": \"value\", \"confidence\": number}}."
 )
 
 KEYWORD_PROMPT = (
@@ -19,7 +20,10 @@ KEYWORD_PROMPT = (
     "Ngữ cảnh: kết quả dùng cho tool search_products_by_keyword nên phải cho thấy rõ sản phẩm và khoảng giá mong muốn. "
     "Ví dụ: \"Tôi muốn mua bắp mỹ\" → keywords [\"bắp mỹ\", \"bắp ngọt\", \"ngô ngọt\"], query \"Khách đang cần bắp Mỹ tươi\", min_price null, max_price null. "
     "Nếu câu có ngân sách (\"dưới 50k\", \"khoảng 30-40 nghìn\") hãy chuyển sang số VND (float) và điền min_price / max_price. "
-    "Trả về JSON: {{\"keywords\": [\"keyword\", ...], \"query\": \"summary\", \"min_price\": number|null, \"max_price\": number|null}}."
+    "Ngân sách tính theo đơn vị (\"dưới 100k/kg\", \"mỗi lít không quá 40 nghìn\") không phải giá sản phẩm: để min_price / max_price null. "
+    "Nếu người dùng hỏi theo nhóm hàng (\"rau củ dưới 30k\", \"có loại sữa nào\", \"đồ uống giải khát\") hãy điền category là tên nhóm hàng ngắn gọn (\"rau củ\", \"sữa\", \"đồ uống\"); "
+    "khi hỏi một sản phẩm cụ thể thì category null. "
+    "Trả về JSON: {{\"keywords\": [\"keyword\", ...], \"query\": \"summary\", \"min_price\": number|null, \"max_price\": number|null, \"category\": string|null}}."
 )
 
 CONVERSATION_ANALYSIS_PROMPT = (
@@ -44,6 +48,9 @@ PRODUCT_RESPONSE_PROMPT = (
     "- user_query: mô tả ngắn nhu cầu\n"
     "- products: JSON array sản phẩm tìm thấy (có thể rỗng)\n"
     "- suggested_products: JSON array 3 sản phẩm gợi ý (có thể rỗng)\n"
+    "Nếu sản phẩm có unit_price thì đó là giá đã quy đổi chính xác theo unit_price_unit "
+    "(kg, l = lít, item = cái/quả); khi so sánh độ rẻ hãy dùng đúng số này, không tự tính lại, "
+    "và giữ nguyên thứ tự sản phẩm đã được sắp xếp.\n"
     "Giữ giọng điệu thân thiện, tự nhiên, hữu ích. Chỉ trả về text thuần, không format bảng."
 )
 
@@ -52,8 +59,10 @@ TOOL_PROMPTS = {
         "Tool search_products_by_keyword:\n"
         "- Input: keywords (list[str]), min_price (float|None), max_price (float|None).\n"
         "- Hành vi: truy vấn tối đa 5 sản phẩm is_active=1 có tên LIKE bất kỳ keyword nào, "
-        "lọc giá >= min_price và <= max_price nếu được cung cấp, sắp xếp created_at desc.\n"
+        "lọc giá >= min_price và <= max_price nếu được cung cấp, lấy tối đa 50 ứng viên rồi xếp hạng lại "
+        "theo độ liên quan, tồn kho, mức giá phù hợp và giảm giá.\n"
         "- Ví dụ: keywords ['bắp mỹ','bắp ngọt'], max_price 60000 sẽ trả về cả 'Bắp Mỹ tươi 55k'.\n"
+        "- Với câu hỏi rẻ nhất theo kg/lít/cái: sắp xếp theo unit_price (giá quy đổi) tăng dần.\n"
         "- Output: list gồm product_name, price, discount_percent.\n"
         "- Ghi chú: nếu thiếu keyword thì trả về sản phẩm mới nhất."
     ),
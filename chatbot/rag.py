@@ -1,18 +1,34 @@
+from collections.abc import Callable
 from typing import Any
 
 from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, Range
+from qdrant_client.http.exceptions import ResponseHandlingException
+from qdrant_client.models import Filter, FieldCondition, MatchValue, Range
 
+from chatbot.embeddings import TextEmbedder
+from chatbot.unit_price import UnitPriceQuery
 from core.config import Settings
+from core.health import health
+from core.metrics import metrics
+
+QueryFn = Callable[[list[float], Filter | None, int, float | None], list[Any]]
 
 
 class QdrantRAG:
-    def __init__(self, settings: Settings) -> None:
+    def __init__(
+        self,
+        settings: Settings,
+        embedder: TextEmbedder | None = None,
+        client: QdrantClient | None = None,
+    ) -> None:
         self.url = settings.qdrant_url
         self.api_key = settings.qdrant_api_key
         self.collection = settings.qdrant_collection
-        self.client: QdrantClient | None = None
-        if self.url:
+        self.vector_name = settings.qdrant_vector_name
+        self.score_threshold = settings.rag_score_threshold
+        self.embedder = embedder or TextEmbedder(settings)
+        self.client: QdrantClient | None = client
+        if self.client is None and self.url:
             try:
                 self.client = QdrantClient(
                     url=self.url,
@@ -22,10 +38,50 @@ class QdrantRAG:
             except Exception as e:
                 print(f"[RAG] Failed to connect to Qdrant: {e}")
                 self.client = None
+        self._query: QueryFn | None = self._bind_query_api() if self.client is not None else None
 
     @property
     def available(self) -> bool:
-        return self.client is not None
+        return self.client is not None and self._query is not None and health.is_up("qdrant")
+
+    def ping(self) -> None:
+        self.client.get_collection(self.collection)
+
+    def _bind_query_api(self) -> QueryFn | None:
+        """Pick the query API this qdrant-client supports once, instead of probing on every search."""
+        if hasattr(self.client, "query_points"):
+            print("[RAG] Using query_points API")
+            return self._query_points
+        if hasattr(self.client, "search"):
+            print("[RAG] Using legacy search API")
+            return self._legacy_search
+        print("[RAG] No supported Qdrant query API found, RAG disabled")
+        metrics.incr("rag.failures.unsupported_client")
+        return None
+
+    def _query_points(
+        self, vector: list[float], search_filter: Filter | None, limit: int, score_threshold: float | None
+    ) -> list[Any]:
+        response = self.client.query_points(
+            collection_name=self.collection,
+            query=vector,
+            using=self.vector_name,
+            query_filter=search_filter,
+            limit=limit,
+            score_threshold=score_threshold,
+        )
+        return response.points
+
+    def _legacy_search(
+        self, vector: list[float], search_filter: Filter | None, limit: int, score_threshold: float | None
+    ) -> list[Any]:
+        return self.client.search(
+            collection_name=self.collection,
+            query_vector=(self.vector_name, vector),
+            query_filter=search_filter,
+            limit=limit,
+            score_threshold=score_threshold,
+        )
 
     def search_products(
         self,
@@ -34,78 +90,84 @@ class QdrantRAG:
         limit: int = 5,
         min_price: float | None = None,
         max_price: float | None = None,
+        unit_price: UnitPriceQuery | None = None,
+        category_id: int | None = None,
+        score_threshold: float | None = None,
     ) -> list[dict[str, Any]]:
         if not self.available:
+            metrics.incr("rag.failures.unavailable")
             return []
 
-        try:
-            filters = []
-            if min_price is not None or max_price is not None:
-                price_filter = {}
-                if min_price is not None:
-                    price_filter["gte"] = min_price
-                if max_price is not None:
-                    price_filter["lte"] = max_price
-                filters.append(
-                    FieldCondition(
-                        key="current_price",
-                        range=Range(**price_filter),
-                    )
+        if not query_text or not query_text.strip():
+            metrics.incr("rag.failures.empty_query")
+            return []
+
+        filters = []
+        if min_price is not None or max_price is not None:
+            price_filter = {}
+            if min_price is not None:
+                price_filter["gte"] = min_price
+            if max_price is not None:
+                price_filter["lte"] = max_price
+            filters.append(
+                FieldCondition(
+                    key="current_price",
+                    range=Range(**price_filter),
                 )
+            )
 
-            search_filter = Filter(must=filters) if filters else None
+        if unit_price is not None:
+            # Only products with a known unit price can be compared.
+            filters.append(FieldCondition(key="unit_price", range=Range(gt=0, lte=unit_price.max_unit_price)))
+            if unit_price.unit:
+                filters.append(FieldCondition(key="unit_price_unit", match=MatchValue(value=unit_price.unit)))
 
-            if not query_text or not query_text.strip():
-                print("[RAG] Empty query text, skipping Qdrant search")
-                return []
+        if category_id is not None:
+            # category_ids holds the product's category and all its ancestors.
+            filters.append(FieldCondition(key="category_ids", match=MatchValue(value=category_id)))
 
-            query_text_clean = query_text.strip()
-            
-            try:
-                from qdrant_client.models import QueryRequest, Query
-                query_req = QueryRequest(
-                    query=Query(text=query_text_clean),
-                    limit=limit,
-                    filter=search_filter,
-                )
-                results = self.client.query(
-                    collection_name=self.collection,
-                    query_request=query_req,
-                )
-            except Exception as e:
-                print(f"[RAG] Error with QueryRequest: {e}")
-                try:
-                    results = self.client.query(
-                        collection_name=self.collection,
-                        query_text=query_text_clean,
-                        limit=limit,
-                        query_filter=search_filter,
-                    )
-                except Exception as e2:
-                    print(f"[RAG] Error with query_text: {e2}, falling back to SQL")
-                    return []
-
-            products = []
-            for point in results.points:
-                payload = point.payload
-                if payload:
-                    products.append(
-                        {
-                            "product_id": payload.get("product_id"),
-                            "product_code": payload.get("product_code"),
-                            "product_name": payload.get("product_name") or payload.get("title"),
-                            "price": payload.get("current_price", 0),
-                            "price_text": payload.get("current_price_text"),
-                            "unit": payload.get("unit"),
-                            "product_url": payload.get("product_url"),
-                            "image_url": payload.get("image_url"),
-                            "score": point.score,
-                        }
-                    )
-
-            print(f"[RAG] Found {len(products)} products for query: {query_text}")
-            return products
+        search_filter = Filter(must=filters) if filters else None
+        threshold = score_threshold if score_threshold is not None else self.score_threshold
+
+        try:
+            query_vector = self.embedder.embed_query(query_text)
+        except Exception:
+            metrics.incr("rag.failures.embedding")
+            return []
+
+        try:
+            with metrics.timer("rag.query_latency"):
+                points = self._query(query_vector, search_filter, limit, threshold)
         except Exception as e:
-            print(f"[RAG] Error searching Qdrant: {e}")
+            metrics.incr(f"rag.failures.{type(e).__name__}")
+            if isinstance(e, ResponseHandlingException):
+                # Transport-level failure: skip Qdrant until the health monitor sees it answer again.
+                health.mark_down("qdrant", e)
             return []
 
+        products = []
+        for point in points:
+            payload = point.payload
+            if payload:
+                products.append(
+                    {
+                        "product_id": payload.get("product_id"),
+                        "product_code": payload.get("product_code"),
+                        "product_name": payload.get("product_name") or payload.get("title"),
+                        "price": payload.get("current_price", 0),
+                        "price_text": payload.get("current_price_text"),
+                        "unit": payload.get("unit"),
+                        "product_url": payload.get("product_url"),
+                        "image_url": payload.get("image_url"),
+                        "discount_percent": payload.get("discount_percent"),
+                        "stock_quantity": payload.get("stock_quantity"),
+                        "unit_price": payload.get("unit_price"),
+                        "unit_price_unit": payload.get("unit_price_unit"),
+                        "category_id": payload.get("category_id"),
+                        "score": point.score,
+                    }
+                )
+
+        metrics.incr("rag.searches")
+        print(f"[RAG] Found {len(products)} products for query: {query_text}")
+        return products
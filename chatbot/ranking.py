@@ -0,0 +1,120 @@
+import numpy as np
+
+from chatbot.unit_price import UnitPriceQuery
+
+RERANK_WEIGHTS = {
+    "relevance": 0.55,
+    "stock": 0.2,
+    "price": 0.15,
+    "discount": 0.1,
+}
+# With a unit-price sort, candidates below this share of the best relevance are ranked after the rest.
+UNIT_PRICE_RELEVANCE_FLOOR = 0.5
+# Candidates are retrieved this far outside the requested price range so the price component can
+# rank near misses below in-range products instead of the range being a hard cut.
+PRICE_TOLERANCE = 0.2
+
+
+def price_search_bounds(min_price: float | None, max_price: float | None) -> tuple[float | None, float | None]:
+    """Price bounds to retrieve candidates with: the requested range widened by PRICE_TOLERANCE."""
+    lower = min_price * (1 - PRICE_TOLERANCE) if min_price is not None else None
+    upper = max_price * (1 + PRICE_TOLERANCE) if max_price is not None else None
+    return lower, upper
+
+
+def _keyword_coverage(names: list[str], keywords: list[str]) -> np.ndarray:
+    if not keywords:
+        return np.ones(len(names))
+    lowered = [name.lower() for name in names]
+    hits = np.array([[keyword in name for keyword in keywords] for name in lowered], dtype=float)
+    return hits.mean(axis=1)
+
+
+def _price_fit(prices: np.ndarray, min_price: float | None, max_price: float | None) -> np.ndarray:
+    """1.0 inside the requested range, decaying with relative distance outside it."""
+    if min_price is None and max_price is None:
+        return np.ones(len(prices))
+    lower = min_price if min_price is not None else -np.inf
+    upper = max_price if max_price is not None else np.inf
+    below = np.clip(lower - prices, 0, None)
+    above = np.clip(prices - upper, 0, None)
+    reference = max(min_price or 0, max_price or 0, 1.0)
+    return 1.0 / (1.0 + (below + above) / reference * 4)
+
+
+def _unit_price_order(
+    products: list[dict], relevance: np.ndarray, total: np.ndarray, query: UnitPriceQuery
+) -> np.ndarray:
+    """Relevant products priced in the same unit first, cheapest per unit first; the rest by score.
+
+    Without a requested unit the most common one among the relevant products is used, so a
+    per-kg comparison is not mixed with per-liter prices.
+    """
+    unit_prices = np.array(
+        [np.nan if product.get("unit_price") is None else float(product["unit_price"]) for product in products]
+    )
+    units = np.array([product.get("unit_price_unit") or "" for product in products])
+    relevant = relevance >= UNIT_PRICE_RELEVANCE_FLOOR * relevance.max()
+    priced = relevant & ~np.isnan(unit_prices)
+    unit = query.unit
+    if unit is None and priced.any():
+        values, counts = np.unique(units[priced], return_counts=True)
+        unit = values[np.argmax(counts)]
+    comparable = priced & (units == unit)
+    if query.max_unit_price is not None:
+        comparable &= unit_prices <= query.max_unit_price
+    # lexsort: the last key is the primary one.
+    return np.lexsort((-total, np.where(comparable, unit_prices, np.inf), ~comparable))
+
+
+def rerank_products(
+    products: list[dict],
+    *,
+    keywords: list[str] | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    unit_price: UnitPriceQuery | None = None,
+    top_k: int = 5,
+) -> list[dict]:
+    """Score retrieved candidates in one vectorized pass and return the best top_k.
+
+    Each returned product gets `score` (0-1) and `score_details` with the weighted components,
+    so it is visible why a product ranked where it did. With `unit_price` the order is by price
+    per kg / liter / item instead of by score.
+    """
+    if not products:
+        return []
+
+    terms = [keyword.lower() for keyword in (keywords or []) if keyword]
+    names = [product.get("product_name") or "" for product in products]
+    prices = np.array([float(product.get("price") or 0) for product in products])
+    discounts = np.array([float(product.get("discount_percent") or 0) for product in products])
+    stock = np.array(
+        [np.nan if product.get("stock_quantity") is None else float(product["stock_quantity"]) for product in products]
+    )
+    vector_scores = np.array(
+        [np.nan if product.get("score") is None else float(product["score"]) for product in products]
+    )
+
+    coverage = _keyword_coverage(names, terms)
+    relevance = np.where(np.isnan(vector_scores), coverage, np.clip(vector_scores, 0, 1))
+    components = {
+        "relevance": relevance,
+        "stock": np.where(np.isnan(stock), 0.5, (stock > 0).astype(float)),
+        "price": _price_fit(prices, min_price, max_price),
+        "discount": np.clip(discounts / 100.0, 0, 1),
+    }
+    weighted = {name: RERANK_WEIGHTS[name] * values for name, values in components.items()}
+    total = np.sum(list(weighted.values()), axis=0)
+
+    if unit_price is not None:
+        order = _unit_price_order(products, relevance, total, unit_price)[:top_k]
+    else:
+        order = np.argsort(-total, kind="stable")[:top_k]
+    ranked = []
+    for index in order:
+        product = dict(products[index])
+        product["score"] = round(float(total[index]), 4)
+        product["score_details"] = {name: round(float(values[index]), 4) for name, values in weighted.items()}
+        ranked.append(product)
+    return ranked
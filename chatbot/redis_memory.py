@@ -1,46 +1,107 @@
 import json
 from typing import Any
+from uuid import uuid4
 
 import redis
 
+from chatbot.redis_writer import RedisWriteBehind, publish_message, stream_has_room
 from core.config import Settings
+from core.health import health
+
+MAX_MESSAGES = 50
+MESSAGE_TTL_SECONDS = 86400 * 7
 
 
 class RedisConversationMemory:
-    def __init__(self, settings: Settings) -> None:
-        self.redis_client: redis.Redis | None = None
-        if settings.redis_url:
+    def __init__(self, settings: Settings, client: redis.Redis | None = None) -> None:
+        self.redis_client: redis.Redis | None = client
+        if self.redis_client is None and settings.redis_url:
             try:
-                self.redis_client = redis.from_url(settings.redis_url, decode_responses=True)
+                self.redis_client = redis.from_url(
+                    settings.redis_url,
+                    decode_responses=True,
+                    socket_connect_timeout=settings.redis_socket_timeout_seconds,
+                    socket_timeout=settings.redis_socket_timeout_seconds,
+                )
                 print(f"[RedisMemory] Connected to Redis at {settings.redis_url}")
             except Exception as e:
                 print(f"[RedisMemory] Failed to connect to Redis: {e}")
                 self.redis_client = None
+        self.stream_key = settings.history_stream_key if settings.history_stream_enabled else None
+        self.stream_maxlen = settings.history_stream_maxlen
+        self.flush_wait = settings.redis_write_flush_wait_seconds
+        self.writer: RedisWriteBehind | None = None
+        if self.redis_client is not None and settings.redis_write_behind:
+            self.writer = RedisWriteBehind(
+                self.redis_client,
+                message_key=self._key,
+                summary_key=self._summary_key,
+                max_messages=MAX_MESSAGES,
+                message_ttl=MESSAGE_TTL_SECONDS,
+                max_buffer=settings.redis_write_buffer_size,
+                batch_size=settings.redis_write_batch_size,
+                stream_key=self.stream_key,
+                stream_maxlen=self.stream_maxlen,
+            )
 
     @property
     def available(self) -> bool:
-        return self.redis_client is not None
+        return self.redis_client is not None and health.is_up("redis")
+
+    @property
+    def writable(self) -> bool:
+        """Writes are accepted while Redis is down when they can be buffered for later."""
+        return self.writer is not None or self.available
+
+    @property
+    def readable(self) -> bool:
+        """History can be read from Redis or, while it is down, from the writes still buffered for it."""
+        return self.writer is not None or self.available
+
+    @staticmethod
+    def _report(message: str, error: Exception) -> None:
+        print(f"[RedisMemory] {message}: {error}")
+        if isinstance(error, (redis.ConnectionError, redis.TimeoutError)):
+            health.mark_down("redis", error)
 
     def _key(self, session_id: str) -> str:
         return f"chatbot:session:{session_id}:messages"
 
     def append(self, session_id: str, role: str, content: str) -> None:
-        if not self.available:
+        self.append_turn(session_id, [(role, content)])
+
+    def append_turn(self, session_id: str, messages: list[tuple[str, str]]) -> None:
+        """Store a turn's messages in order; queued for the background writer when enabled."""
+        if not self.writable:
+            return
+
+        timestamp = self._get_timestamp()
+        records = [
+            {"id": uuid4().hex, "role": role, "content": content, "timestamp": timestamp}
+            for role, content in messages
+        ]
+        if self.writer is not None:
+            self.writer.submit([("message", session_id, record) for record in records])
             return
 
         try:
-            message = {"role": role, "content": content, "timestamp": self._get_timestamp()}
             key = self._key(session_id)
-            self.redis_client.lpush(key, json.dumps(message, ensure_ascii=False))
-            self.redis_client.ltrim(key, 0, 49)
-            self.redis_client.expire(key, 86400 * 7)
-            print(f"[RedisMemory] Saved message for session {session_id}: {role}")
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.lpush(key, *[json.dumps(record, ensure_ascii=False) for record in records])
+            pipe.ltrim(key, 0, MAX_MESSAGES - 1)
+            pipe.expire(key, MESSAGE_TTL_SECONDS)
+            stream_key = self.stream_key
+            if stream_key and stream_has_room(self.redis_client, stream_key, self.stream_maxlen, len(records)):
+                for record in records:
+                    publish_message(pipe, self.stream_key, session_id, record)
+            pipe.execute()
+            print(f"[RedisMemory] Saved {len(records)} messages for session {session_id}")
         except Exception as e:
-            print(f"[RedisMemory] Error saving message: {e}")
+            self._report("Error saving message", e)
 
     def get_recent_messages(self, session_id: str, limit: int = 5) -> list[dict[str, Any]]:
         if not self.available:
-            return []
+            return self._with_pending(session_id, [])[:limit]
 
         try:
             key = self._key(session_id)
@@ -52,15 +113,27 @@ class RedisConversationMemory:
                     messages.append(msg)
                 except json.JSONDecodeError:
                     continue
+            messages = self._with_pending(session_id, messages)[:limit]
             print(f"[RedisMemory] Retrieved {len(messages)} recent messages for session {session_id}")
             return messages
         except Exception as e:
-            print(f"[RedisMemory] Error retrieving messages: {e}")
-            return []
+            self._report("Error retrieving messages", e)
+            return self._with_pending(session_id, [])[:limit]
+
+    def _with_pending(self, session_id: str, stored: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Put messages still queued for Redis in front of the stored ones (both newest first)."""
+        if self.writer is None:
+            return stored
+        pending = self.writer.pending_messages(session_id)
+        if not pending:
+            return stored
+        # A batch that was just written may still be listed as pending.
+        stored_ids = {message.get("id") for message in stored}
+        return [message for message in reversed(pending) if message["id"] not in stored_ids] + stored
 
     def get_all_messages(self, session_id: str) -> list[dict[str, Any]]:
         if not self.available:
-            return []
+            return self._with_pending(session_id, [])
 
         try:
             key = self._key(session_id)
@@ -72,10 +145,37 @@ class RedisConversationMemory:
                     messages.append(msg)
                 except json.JSONDecodeError:
                     continue
-            return messages
+            return self._with_pending(session_id, messages)
+        except Exception as e:
+            self._report("Error retrieving all messages", e)
+            return self._with_pending(session_id, [])
+
+    def _summary_key(self, user_id: int) -> str:
+        return f"chatbot:user:{user_id}:summary"
+
+    def set_user_summary(self, user_id: int, summary: str) -> None:
+        """Keep the latest conversation summary per user so a new session can start with context."""
+        if not self.writable:
+            return
+        if self.writer is not None:
+            self.writer.submit([("summary", user_id, summary)])
+            return
+
+        try:
+            self.redis_client.set(self._summary_key(user_id), summary, ex=MESSAGE_TTL_SECONDS)
         except Exception as e:
-            print(f"[RedisMemory] Error retrieving all messages: {e}")
-            return []
+            self._report("Error saving summary", e)
+
+    def get_user_summary(self, user_id: int) -> str | None:
+        pending = self.writer.pending_summary(user_id) if self.writer is not None else None
+        if pending is not None or not self.available:
+            return pending
+
+        try:
+            return self.redis_client.get(self._summary_key(user_id))
+        except Exception as e:
+            self._report("Error retrieving summary", e)
+            return None
 
     def clear(self, session_id: str) -> None:
         if not self.available:
@@ -86,7 +186,19 @@ class RedisConversationMemory:
             self.redis_client.delete(key)
             print(f"[RedisMemory] Cleared messages for session {session_id}")
         except Exception as e:
-            print(f"[RedisMemory] Error clearing messages: {e}")
+            self._report("Error clearing messages", e)
+
+    def flush_session(self, session_id: str) -> None:
+        """Write the session's buffered messages now, so a turn handled by another worker reads them."""
+        if self.writer is None or not self.available:
+            return
+        if not self.writer.wait_flushed(session_id, self.flush_wait):
+            print(f"[RedisMemory] History of session {session_id} not flushed within {self.flush_wait}s")
+
+    def close(self) -> None:
+        """Flush buffered writes before the process exits."""
+        if self.writer is not None:
+            self.writer.close()
 
     @staticmethod
     def _get_timestamp() -> str:
@@ -0,0 +1,253 @@
+import json
+import time
+from collections import deque
+from collections.abc import Callable
+from threading import Condition, Thread
+from typing import Any
+
+import redis
+
+from core.health import health
+from core.metrics import metrics
+
+# (kind, key, value): ("message", session_id, message dict) or ("summary", user_id, text)
+WriteRecord = tuple[str, Any, Any]
+
+
+def stream_has_room(client: Any, stream_key: str, maxlen: int, incoming: int) -> bool:
+    """Whether `incoming` more entries fit in the history stream under `maxlen`.
+
+    Producers never trim the stream: only the archiver removes entries, and only those every
+    consumer group is done with. When the unarchived backlog is at the cap the new entries are
+    not published and are counted as `history_stream.dropped` instead.
+    """
+    if not maxlen or not incoming:
+        return True
+    length = client.xlen(stream_key)
+    if length + incoming <= maxlen:
+        return True
+    metrics.incr("history_stream.dropped", incoming)
+    print(f"[RedisWriter] History stream backlog at {length}/{maxlen}; not publishing {incoming} messages")
+    return False
+
+
+def publish_message(pipe: Any, stream_key: str, session_id: str, message: dict[str, Any]) -> None:
+    """Queue an XADD of one stored message to the history stream (read by chatbot.archive)."""
+    fields = {"session_id": session_id, **{name: message[name] for name in ("id", "role", "content", "timestamp")}}
+    pipe.xadd(stream_key, fields)
+
+
+class RedisWriteBehind:
+    """Buffers conversation writes in memory and flushes them to Redis from a background thread.
+
+    Writers return as soon as the record is queued. A worker drains the queue in batches of up to
+    `batch_size` records, one MULTI/EXEC pipeline per batch. Records stay visible through
+    `pending_messages()` / `pending_summary()` until their batch is written, which gives the next
+    turn of a session read-your-writes in this process even while Redis is slow or briefly down;
+    `wait_flushed()` lets a turn make its writes visible to other workers before it ends. When Redis
+    is unreachable, the batch goes back to the front of the queue and the worker backs off; since the
+    batch is applied atomically, the retry cannot duplicate history or stream entries. A batch Redis
+    rejects (ResponseError) would fail the same way again, so it is dropped and counted. Once the queue
+    holds `max_buffer` records, the oldest ones are dropped and counted.
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        *,
+        message_key: Callable[[str], str],
+        summary_key: Callable[[int], str],
+        max_messages: int = 50,
+        message_ttl: int = 86400 * 7,
+        max_buffer: int = 10000,
+        batch_size: int = 200,
+        linger: float = 0.01,
+        stream_key: str | None = None,
+        stream_maxlen: int = 1000000,
+    ) -> None:
+        self.client = client
+        self.message_key = message_key
+        self.summary_key = summary_key
+        self.max_messages = max_messages
+        self.message_ttl = message_ttl
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.linger = linger
+        self.stream_key = stream_key
+        self.stream_maxlen = stream_maxlen
+        self._queue: deque[WriteRecord] = deque()
+        self._pending_messages: dict[str, list[dict[str, Any]]] = {}
+        self._pending_summaries: dict[int, list[str]] = {}
+        self._in_flight = 0
+        self._waiting = 0
+        self._condition = Condition()
+        self._closing = False
+        self._thread: Thread | None = None
+
+    def submit(self, records: list[WriteRecord]) -> None:
+        with self._condition:
+            if self._closing:
+                metrics.incr("redis_writer.dropped", len(records))
+                return
+            for record in records:
+                self._queue.append(record)
+                self._track(record)
+            metrics.incr("redis_writer.enqueued", len(records))
+            overflow = len(self._queue) - self.max_buffer
+            for _ in range(max(0, overflow)):
+                self._untrack(self._queue.popleft())
+            if overflow > 0:
+                metrics.incr("redis_writer.dropped", overflow)
+                print(f"[RedisWriter] Buffer full, dropped {overflow} oldest records")
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="redis-writer", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def pending_messages(self, session_id: str) -> list[dict[str, Any]]:
+        """Queued messages of the session, oldest first."""
+        with self._condition:
+            return list(self._pending_messages.get(session_id, ()))
+
+    def pending_summary(self, user_id: int) -> str | None:
+        with self._condition:
+            summaries = self._pending_summaries.get(user_id)
+            return summaries[-1] if summaries else None
+
+    def wait_flushed(self, session_id: str, timeout: float) -> bool:
+        """Block until the session's queued messages are in Redis; False if `timeout` passed first."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if session_id not in self._pending_messages:
+                return True
+            # Waiters cut the worker's linger short.
+            self._waiting += 1
+            self._condition.notify_all()
+            try:
+                while session_id in self._pending_messages:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        metrics.incr("redis_writer.flush_wait_timeouts")
+                        return False
+                    self._condition.wait(remaining)
+                return True
+            finally:
+                self._waiting -= 1
+
+    def depth(self) -> int:
+        with self._condition:
+            return len(self._queue) + self._in_flight
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop accepting records and give the worker up to `timeout` seconds to flush the rest."""
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        left = self.depth()
+        if left:
+            print(f"[RedisWriter] {left} records were not flushed before shutdown")
+            metrics.incr("redis_writer.lost_on_shutdown", left)
+
+    def _track(self, record: WriteRecord) -> None:
+        kind, key, value = record
+        pending = self._pending_messages if kind == "message" else self._pending_summaries
+        pending.setdefault(key, []).append(value)
+
+    def _untrack(self, record: WriteRecord) -> None:
+        kind, key, value = record
+        pending = self._pending_messages if kind == "message" else self._pending_summaries
+        values = pending.get(key)
+        if values:
+            values.remove(value)
+            if not values:
+                del pending[key]
+
+    def _run(self) -> None:
+        backoff = 0.0
+        while True:
+            with self._condition:
+                while not self._queue and not self._closing:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+            if backoff:
+                if self._closing_and_down():
+                    return
+                time.sleep(backoff)
+            elif self.linger:
+                # Let concurrent turns add to this batch, unless a turn is waiting for its writes.
+                with self._condition:
+                    self._condition.wait_for(lambda: self._closing or self._waiting > 0, timeout=self.linger)
+
+            with self._condition:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._in_flight = len(batch)
+            try:
+                with metrics.timer("redis_writer.flush_latency"):
+                    self._write(batch)
+            except Exception as e:
+                # ReadOnlyError is a replica mid-failover and clears once a primary is back; any other
+                # ResponseError would fail the same way on every retry and block the queue behind it.
+                if isinstance(e, redis.ResponseError) and not isinstance(e, redis.ReadOnlyError):
+                    print(f"[RedisWriter] Redis rejected a batch of {len(batch)} records, dropping it: {e}")
+                    metrics.incr("redis_writer.rejected", len(batch))
+                    self._finish_batch(batch)
+                    backoff = 0.0
+                else:
+                    backoff = self._requeue(batch, e, backoff)
+                continue
+
+            backoff = 0.0
+            self._finish_batch(batch)
+            metrics.incr("redis_writer.flushed", len(batch))
+            metrics.incr("redis_writer.batches")
+
+    def _requeue(self, batch: list[WriteRecord], error: Exception, backoff: float) -> float:
+        """Put a failed batch back at the front of the queue; returns the next backoff."""
+        print(f"[RedisWriter] Flush of {len(batch)} records failed, will retry: {error}")
+        metrics.incr("redis_writer.flush_errors")
+        if isinstance(error, (redis.ConnectionError, redis.TimeoutError)):
+            health.mark_down("redis", error)
+        with self._condition:
+            self._queue.extendleft(reversed(batch))
+            self._in_flight = 0
+        return min(max(backoff * 2, 0.1), 5.0)
+
+    def _finish_batch(self, batch: list[WriteRecord]) -> None:
+        with self._condition:
+            for record in batch:
+                self._untrack(record)
+            self._in_flight = 0
+            self._condition.notify_all()
+
+    def _closing_and_down(self) -> bool:
+        # On shutdown do not keep retrying against a Redis the health monitor reports down.
+        with self._condition:
+            return self._closing and not health.is_up("redis")
+
+    def _write(self, batch: list[WriteRecord]) -> None:
+        messages: dict[str, list[str]] = {}
+        summaries: dict[int, str] = {}
+        pipe = self.client.pipeline(transaction=True)
+        publish = bool(self.stream_key) and stream_has_room(
+            self.client, self.stream_key, self.stream_maxlen, sum(kind == "message" for kind, _, _ in batch)
+        )
+        for kind, key, value in batch:
+            if kind == "message":
+                messages.setdefault(key, []).append(json.dumps(value, ensure_ascii=False))
+                if publish:
+                    publish_message(pipe, self.stream_key, key, value)
+            else:
+                summaries[key] = value
+
+        for session_id, encoded in messages.items():
+            key = self.message_key(session_id)
+            pipe.lpush(key, *encoded)
+            pipe.ltrim(key, 0, self.max_messages - 1)
+            pipe.expire(key, self.message_ttl)
+        for user_id, summary in summaries.items():
+            pipe.set(self.summary_key(user_id), summary, ex=self.message_ttl)
+        pipe.execute()
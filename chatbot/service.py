@@ -1,61 +1,446 @@
-from contextlib import contextmanager
-from typing import Any
+from __future__ import annotations
+
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+from typing import TYPE_CHECKING, Any
 from uuid import uuid4
 
-from chatbot.graph import build_graph
-from chatbot.llm import LLMAnalyzer
+from sqlalchemy import text
+
+from chatbot.capture import TrafficRecorder, TurnCapture, capturing
+from chatbot.categories import register_category_hooks
 from chatbot.memory import ConversationMemory
-from chatbot.rag import QdrantRAG
 from chatbot.redis_memory import RedisConversationMemory
+from chatbot.session_lock import SessionTurnCoordinator, TurnTicket
+from chatbot.session_warmup import SessionWarmup
 from chatbot.state import ChatbotState
+from chatbot.token_budget import TokenBudget, TurnUsage, track_turn
+from chatbot.unit_price import register_unit_price_hooks
+from chatbot.user_cache import get_user_cache, register_invalidation_hooks
 from core.config import get_settings
-from db.database import SessionLocal
-from schemas.schemas import MessageContext
+from core.health import health
+from core.startup import LazyResource
+from db.database import get_engine, new_session
+from schemas.schemas import MessageContext, MessageResponse
+
+if TYPE_CHECKING:
+    from chatbot.llm import LLMAnalyzer
+    from chatbot.rag import QdrantRAG
+
+
+def _load_graph_builder() -> Callable[..., Any]:
+    # langgraph and the LLM/RAG modules it pulls in account for most of the import time.
+    from chatbot.graph import build_graph
+
+    return build_graph
+
+
+def _load_analyzer(settings) -> LLMAnalyzer:
+    from chatbot.llm import LLMAnalyzer
+
+    return LLMAnalyzer(settings)
+
+
+def _load_rag(settings) -> QdrantRAG:
+    from chatbot.rag import QdrantRAG
+
+    return QdrantRAG(settings)
+
+
+def _check_database(engine) -> None:
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+def _check_redis(memory: RedisConversationMemory) -> None:
+    if memory.redis_client is not None:
+        memory.redis_client.ping()
+
+
+def _ping_redis(memory: RedisConversationMemory) -> None:
+    if memory.redis_client is None:
+        raise ConnectionError("Redis client could not be created")
+    memory.redis_client.ping()
+
+
+def _check_rag(rag: QdrantRAG) -> None:
+    if rag.client is not None:
+        rag.client.get_collections()
+        # Loading the embedding model is the slow part of the first search.
+        rag.embedder.model
 
 
 class ChatbotService:
+    """Builds its dependencies lazily; start() warms them up concurrently in the background.
+
+    Until a dependency is warm, the first request that needs it waits for (or performs) its
+    initialization, so the service can accept traffic as soon as the process is up.
+    """
+
     def __init__(self) -> None:
         self.settings = get_settings()
         self.memory = ConversationMemory()
-        self.analyzer = LLMAnalyzer(self.settings)
-        self.rag = QdrantRAG(self.settings)
-        self.redis_memory = RedisConversationMemory(self.settings)
+        self.user_cache = get_user_cache()
+        self.warmup = SessionWarmup()
+        self.recorder = TrafficRecorder(self.settings) if self.settings.capture_dir else None
+        self.components: dict[str, LazyResource] = {
+            "database": LazyResource("database", get_engine, check=_check_database),
+            "redis": LazyResource(
+                "redis", lambda: RedisConversationMemory(self.settings), check=_check_redis
+            ),
+            "llm": LazyResource("llm", lambda: _load_analyzer(self.settings)),
+            "rag": LazyResource("rag", lambda: _load_rag(self.settings), check=_check_rag),
+            "graph": LazyResource("graph", _load_graph_builder),
+        }
+        self._turns = LazyResource(
+            "turns", lambda: SessionTurnCoordinator(self.settings, client=self.redis_memory.redis_client)
+        )
+        self._budget = LazyResource(
+            "token_budget", lambda: TokenBudget(self.settings, client=self.redis_memory.redis_client)
+        )
+        self._startup_executor: ThreadPoolExecutor | None = None
+        self._started_at: float | None = None
+        self._speculation_executor = (
+            ThreadPoolExecutor(max_workers=self.settings.speculation_workers, thread_name_prefix="speculation")
+            if self.settings.speculative_tools
+            else None
+        )
+        register_invalidation_hooks()
+        register_unit_price_hooks()
+        register_category_hooks()
+        self._register_health_probes()
+
+    def _register_health_probes(self) -> None:
+        """Probe only the dependencies that are configured, once their client has been built.
+
+        Gemini is not probed: LLMAnalyzer marks it down after repeated failed calls (CallBreaker).
+        """
+        health.interval = self.settings.health_check_interval_seconds
+        health.timeout = self.settings.health_check_timeout_seconds
+        components = self.components
+        health.register(
+            "database", lambda: _check_database(components["database"].get()), when=lambda: components["database"].done
+        )
+        if self.settings.redis_url:
+            health.register("redis", lambda: _ping_redis(self.redis_memory), when=lambda: components["redis"].done)
+        if self.settings.qdrant_url:
+            health.register("qdrant", lambda: self.rag.ping(), when=lambda: components["rag"].done)
+
+    def start(self) -> None:
+        """Initialize every dependency concurrently without blocking the caller, then monitor them."""
+        self._started_at = time.perf_counter()
+        self._startup_executor = ThreadPoolExecutor(max_workers=len(self.components), thread_name_prefix="startup")
+        for component in self.components.values():
+            component.start(self._startup_executor)
+        health.start()
+
+    def readiness(self) -> dict[str, Any]:
+        components = {name: component.status() for name, component in self.components.items()}
+        warm = all(component.done for component in self.components.values())
+        readiness: dict[str, Any] = {
+            # The database is the only dependency without a fallback path.
+            "ready": warm and self.components["database"].ready and health.is_up("database"),
+            "components": components,
+            "dependencies": health.snapshot(),
+        }
+        if warm and self._started_at is not None:
+            finished = max(component.finished_at or self._started_at for component in self.components.values())
+            readiness["warmup_seconds"] = round(finished - self._started_at, 3)
+        return readiness
+
+    def shutdown(self) -> None:
+        health.stop()
+        self.warmup.shutdown()
+        if self.components["redis"].done:
+            # Drain queued history writes while Redis is still reachable.
+            self.redis_memory.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        for executor in (self._startup_executor, self._speculation_executor):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def analyzer(self) -> LLMAnalyzer:
+        return self.components["llm"].get()
+
+    @analyzer.setter
+    def analyzer(self, value: LLMAnalyzer) -> None:
+        self.components["llm"].set(value)
+
+    @property
+    def rag(self) -> QdrantRAG:
+        return self.components["rag"].get()
+
+    @rag.setter
+    def rag(self, value: QdrantRAG) -> None:
+        self.components["rag"].set(value)
+
+    @property
+    def redis_memory(self) -> RedisConversationMemory:
+        return self.components["redis"].get()
+
+    @redis_memory.setter
+    def redis_memory(self, value: RedisConversationMemory) -> None:
+        self.components["redis"].set(value)
+        self._turns = LazyResource(
+            "turns", lambda: SessionTurnCoordinator(self.settings, client=value.redis_client)
+        )
+        self._budget = LazyResource("token_budget", lambda: TokenBudget(self.settings, client=value.redis_client))
+
+    @property
+    def turns(self) -> SessionTurnCoordinator:
+        return self._turns.get()
+
+    @property
+    def token_budget(self) -> TokenBudget:
+        return self._budget.get()
 
     @contextmanager
     def _db(self):
-        db = SessionLocal()
+        db = new_session()
         try:
             yield db
         finally:
             db.close()
 
+    @contextmanager
+    def _speculation(self, db):
+        if self._speculation_executor is None:
+            yield None
+            return
+        from chatbot.speculation import SpeculativeTools
+
+        speculation = SpeculativeTools(
+            self._speculation_executor,
+            db.get_bind(),
+            rag=self.rag,
+            user_cache=self.user_cache,
+            match_threshold=self.settings.speculation_match_threshold,
+        )
+        try:
+            yield speculation
+        finally:
+            speculation.finish()
+
     def create_session(self, user_id: int | None = None) -> str:
         session_id = str(uuid4())
         if user_id:
             self.memory.append(session_id, "system", f"session initialized for user {user_id}")
+            self.warmup.start(session_id, lambda: self._warm_up_session(user_id))
         print(f"[ChatbotService] Created session {session_id} for user {user_id}")
         return session_id
 
-    def send_message(self, *, session_id: str, message: str, user_id: int | None = None) -> dict[str, Any]:
-        print(f"[ChatbotService] Received message for session {session_id}: {message}")
+    def _warm_up_session(self, user_id: int) -> dict[str, Any]:
+        """Load what the first turn needs while the client is still typing."""
         with self._db() as db:
-            graph = build_graph(db, self.memory, self.analyzer, self.redis_memory)
-            state: ChatbotState = {
-                "session_id": session_id,
-                "user_id": user_id,
-                "message": message,
-            }
-            result = graph.invoke(state)
+            self.user_cache.prefetch(db, user_id)
+        return {
+            # A freshly created session has no Redis history yet, so the first turn can skip that read.
+            "recent_messages": [],
+            "prior_summary": self.redis_memory.get_user_summary(user_id),
+        }
+
+    def send_message(self, *, session_id: str, message: str, user_id: int | None = None) -> MessageResponse:
+        print(f"[ChatbotService] Received message for session {session_id}: {message}")
+        state: ChatbotState = {
+            "session_id": session_id,
+            "user_id": user_id,
+            "message": message,
+        }
+        capture = self.recorder.start(state) if self.recorder is not None else None
+        if capture is None:
+            return self._run_turn(state)
+        try:
+            with capturing(capture):
+                response = self._run_turn(state, capture=capture)
+        except Exception as e:
+            self.recorder.finish(capture, error=e)
+            raise
+        self.recorder.finish(capture, response)
+        return response
+
+    def _start_usage(self, state: ChatbotState) -> TurnUsage:
+        usage = self.token_budget.start_turn(state["session_id"], state.get("user_id"))
+        state["llm_mode"] = usage.mode
+        return usage
+
+    @contextmanager
+    def _token_usage(self, state: ChatbotState, usage: TurnUsage | None):
+        """Count the turn's LLM tokens and add them to the session, user and global counters at the end."""
+        usage = usage or self._start_usage(state)
+        with track_turn(usage):
+            try:
+                yield usage
+            finally:
+                self.token_budget.commit(usage)
+
+    @contextmanager
+    def _session_turn(self, session_id: str, held: tuple[ExitStack, TurnTicket] | None):
+        """The turn's session lock: taken here, or already taken for it by `send_messages`."""
+        if held is None:
+            with self.turns.turn(session_id) as turn:
+                yield turn
+            return
+        stack, turn = held
+        with stack:
+            yield turn
+
+    def _run_turn(
+        self,
+        state: ChatbotState,
+        usage: TurnUsage | None = None,
+        capture: TurnCapture | None = None,
+        held: tuple[ExitStack, TurnTicket] | None = None,
+    ) -> MessageResponse:
+        session_id = state["session_id"]
+        with (
+            self._session_turn(session_id, held) as turn,
+            self._token_usage(state, usage) as usage,
+            self._db() as db,
+            self._speculation(db) as speculation,
+        ):
+            build_graph = self.components["graph"].get()
+            # Past its token budget the turn runs without the LLM (regex intent and keywords, template reply).
+            analyzer = self.analyzer if usage.mode != "off" else None
+            graph = build_graph(
+                db, self.memory, analyzer, self.redis_memory, self.rag, self.user_cache, speculation, turn, capture
+            )
+            warm = self.warmup.take(session_id, timeout=self.settings.session_warmup_wait_seconds)
+            if warm:
+                state.setdefault("recent_messages", warm["recent_messages"])
+                state["prior_summary"] = warm["prior_summary"]
+            try:
+                result = graph.invoke(state)
+            finally:
+                if turn.shared:
+                    # The next turn may run in another worker, which only sees what is in Redis.
+                    self.redis_memory.flush_session(session_id)
             print(f"[ChatbotService] Graph completed for session {session_id}")
             tool_result = result.get("tool_result", {})
-            context = MessageContext(
-                products=tool_result.get("products"),
-                suggested_products=tool_result.get("suggested_products"),
-                orders=tool_result.get("orders"),
-                profile=tool_result.get("profile"),
+            # Validated once here; the endpoints serialize this model as is.
+            return MessageResponse(
+                reply=result.get("response", "I am not sure how to respond yet."),
+                session_id=session_id,
+                context=MessageContext(
+                    products=tool_result.get("products"),
+                    suggested_products=tool_result.get("suggested_products"),
+                    orders=tool_result.get("orders"),
+                    profile=tool_result.get("profile"),
+                ),
             )
-            return {
-                "reply": result.get("response", "I am not sure how to respond yet."),
-                "session_id": session_id,
-                "context": context.model_dump(exclude_none=True),
-            }
+
+    def send_messages(
+        self, items: list[dict[str, Any]], *, max_concurrency: int | None = None
+    ) -> Iterator[tuple[int, MessageResponse | Exception]]:
+        """Process many turns at once, yielding (index, response or error) as each one finishes.
+
+        The first turn of every session takes its session lock, then has its conversation analysis,
+        intent and keywords resolved with batched LLM calls up front. Later turns of the same session
+        run after it, in order, through the normal graph so they see the earlier turns' history.
+        """
+        print(f"[ChatbotService] Received batch of {len(items)} messages")
+        states: list[ChatbotState] = [
+            {"session_id": item["session_id"], "user_id": item.get("user_id"), "message": item["message"]}
+            for item in items
+        ]
+        by_session: dict[str, list[int]] = {}
+        for index, state in enumerate(states):
+            by_session.setdefault(state["session_id"], []).append(index)
+        heads = [indexes[0] for indexes in by_session.values()]
+        usages = {index: self._start_usage(states[index]) for index in heads}
+
+        held: dict[int, tuple[ExitStack, TurnTicket]] = {}
+        failed: dict[int, Exception] = {}
+        if self.analyzer.available:
+            # Prepared turns hold their session lock from before their history is read until their
+            # graph run ends, like a single turn does.
+            for index in heads:
+                if usages[index].mode == "off":
+                    continue
+                stack = ExitStack()
+                try:
+                    held[index] = (stack, stack.enter_context(self.turns.turn(states[index]["session_id"])))
+                except Exception as e:
+                    print(f"[ChatbotService] Batch item {index} failed: {e}")
+                    failed[index] = e
+            try:
+                self._prepare_batch([states[index] for index in held], [usages[index] for index in held])
+            except BaseException:
+                for stack, _ in held.values():
+                    stack.close()
+                raise
+
+        def run_session(indexes: list[int]) -> list[tuple[int, MessageResponse | Exception]]:
+            results: list[tuple[int, MessageResponse | Exception]] = []
+            for index in indexes:
+                if index in failed:
+                    results.append((index, failed[index]))
+                    continue
+                try:
+                    response = self._run_turn(states[index], usages.get(index), held=held.get(index))
+                    results.append((index, response))
+                except Exception as e:
+                    print(f"[ChatbotService] Batch item {index} failed: {e}")
+                    results.append((index, e))
+            return results
+
+        workers = max_concurrency or self.settings.batch_max_concurrency
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat-batch") as executor:
+            futures = [executor.submit(run_session, indexes) for indexes in by_session.values()]
+            for future in as_completed(futures):
+                yield from future.result()
+
+    def _prepare_batch(self, states: list[ChatbotState], usages: list[TurnUsage]) -> None:
+        """Resolve context, intent and keywords for many independent turns with batched LLM calls."""
+        history = []
+        for state in states:
+            warm = self.warmup.take(state["session_id"], timeout=self.settings.session_warmup_wait_seconds)
+            if warm:
+                state["prior_summary"] = warm["prior_summary"]
+                recent = warm["recent_messages"]
+            else:
+                recent = self.redis_memory.get_recent_messages(state["session_id"], limit=5)
+            state["recent_messages"] = recent
+            history.append((recent, state["message"]))
+
+        contexts = self.analyzer.analyze_conversations(history, usages)
+        for state, context in zip(states, contexts):
+            if not context and not state["recent_messages"]:
+                context = state.get("prior_summary")
+            state["conversation_context"] = context
+
+        intents = self.analyzer.classify_intents(
+            [
+                f"{state['conversation_context']}\n\n{state['message']}"
+                if state["conversation_context"]
+                else state["message"]
+                for state in states
+            ],
+            usages,
+        )
+        searching = []
+        searching_usages = []
+        for state, usage, intent in zip(states, usages, intents):
+            if intent:
+                state["intent"] = intent
+            if intent in ("orders", "profile") and state.get("user_id"):
+                state["keywords"] = []
+                state["product_query"] = None
+                state["min_price"] = None
+                state["max_price"] = None
+            else:
+                searching.append(state)
+                searching_usages.append(usage)
+
+        extracted = self.analyzer.extract_keywords_batch([state["message"] for state in searching], searching_usages)
+        for state, (keywords, summary, (min_price, max_price), category) in zip(searching, extracted):
+            if keywords is None and summary is None:
+                continue
+            state["keywords"] = keywords or []
+            state["product_query"] = summary
+            state["min_price"] = min_price
+            state["max_price"] = max_price
+            state["category"] = category
@@ -0,0 +1,160 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from threading import Lock
+
+import redis
+
+from core.config import Settings
+from core.health import health
+from core.metrics import metrics
+
+
+class TurnSuperseded(Exception):
+    """Raised inside a turn once a newer message for the same session has arrived (latest-wins mode)."""
+
+
+class SessionBusy(Exception):
+    """Raised when a turn could not get the session lock within the configured wait."""
+
+
+class TurnTicket:
+    def __init__(
+        self, coordinator: "SessionTurnCoordinator", session_id: str, seq: int | None, client: redis.Redis | None
+    ) -> None:
+        self.coordinator = coordinator
+        self.session_id = session_id
+        self.seq = seq
+        self.client = client
+
+    @property
+    def shared(self) -> bool:
+        """Whether the lock is held in Redis, so the session's next turn may run in another worker."""
+        return self.client is not None
+
+    def is_superseded(self) -> bool:
+        # A turn that could not be numbered is never treated as superseded.
+        if not self.coordinator.latest_wins or self.seq is None:
+            return False
+        return self.coordinator.latest_seq(self.session_id, self.client) > self.seq
+
+    def raise_if_superseded(self) -> None:
+        if self.is_superseded():
+            metrics.incr("session_turns.superseded")
+            raise TurnSuperseded(f"Turn {self.seq} of session {self.session_id} was superseded")
+
+
+class SessionTurnCoordinator:
+    """Serializes turns per session so history reads and writes of two turns never interleave.
+
+    With Redis the lock and turn counter are shared by every worker; without it, or while the
+    health monitor reports Redis down, they are per-process. Only turns of the same session wait
+    on each other.
+    """
+
+    def __init__(self, settings: Settings, client: redis.Redis | None = None) -> None:
+        self.redis_client = client
+        self.latest_wins = settings.session_latest_wins
+        self.lock_ttl = settings.session_lock_ttl_seconds
+        self.lock_wait = settings.session_lock_wait_seconds
+        self._mutex = Lock()
+        self._locks: dict[str, tuple[Lock, int]] = {}
+        self._seqs: dict[str, int] = {}
+
+    def _seq_key(self, session_id: str) -> str:
+        return f"chatbot:session:{session_id}:turn_seq"
+
+    def _lock_key(self, session_id: str) -> str:
+        return f"chatbot:session:{session_id}:lock"
+
+    def latest_seq(self, session_id: str, client: redis.Redis | None) -> int:
+        if client is not None:
+            try:
+                return int(client.get(self._seq_key(session_id)) or 0)
+            except Exception as e:
+                print(f"[SessionLock] Error reading turn sequence: {e}")
+                return 0
+        with self._mutex:
+            return self._seqs.get(session_id, 0)
+
+    def _next_seq(self, session_id: str, client: redis.Redis | None) -> int | None:
+        """Number this turn (None if Redis failed); in local mode also register it as a waiter on the lock."""
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=True)
+                pipe.incr(self._seq_key(session_id))
+                pipe.expire(self._seq_key(session_id), 86400)
+                return int(pipe.execute()[0])
+            except Exception as e:
+                print(f"[SessionLock] Error incrementing turn sequence: {e}")
+                return None
+        with self._mutex:
+            seq = self._seqs.get(session_id, 0) + 1
+            self._seqs[session_id] = seq
+            lock, waiters = self._locks.get(session_id, (Lock(), 0))
+            self._locks[session_id] = (lock, waiters + 1)
+            return seq
+
+    @contextmanager
+    def turn(self, session_id: str) -> Iterator[TurnTicket]:
+        client = self.redis_client if self.redis_client is not None and health.is_up("redis") else None
+        ticket = TurnTicket(self, session_id, self._next_seq(session_id, client), client)
+        with metrics.timer("session_turns.lock_wait"):
+            release = self._acquire(session_id, client)
+        try:
+            # A newer message may have arrived while this one was queued; drop it before any work.
+            ticket.raise_if_superseded()
+            yield ticket
+        finally:
+            release()
+
+    def _acquire(self, session_id: str, client: redis.Redis | None):
+        if client is not None:
+            try:
+                lock = client.lock(
+                    self._lock_key(session_id),
+                    timeout=self.lock_ttl,
+                    blocking_timeout=self.lock_wait,
+                    # The token lives on the lock, so a batch can release it from the worker that ran the turn.
+                    thread_local=False,
+                )
+                acquired = lock.acquire()
+            except Exception as e:
+                print(f"[SessionLock] Redis lock unavailable, continuing without it: {e}")
+                if isinstance(e, (redis.ConnectionError, redis.TimeoutError)):
+                    health.mark_down("redis", e)
+                metrics.incr("session_turns.lock_errors")
+                return lambda: None
+            if not acquired:
+                metrics.incr("session_turns.busy")
+                raise SessionBusy(f"Session {session_id} is busy")
+
+            def release_redis() -> None:
+                try:
+                    lock.release()
+                except Exception as e:
+                    print(f"[SessionLock] Error releasing lock: {e}")
+
+            return release_redis
+
+        with self._mutex:
+            lock, _ = self._locks[session_id]
+        if not lock.acquire(timeout=self.lock_wait):
+            self._forget(session_id)
+            metrics.incr("session_turns.busy")
+            raise SessionBusy(f"Session {session_id} is busy")
+
+        def release_local() -> None:
+            lock.release()
+            self._forget(session_id)
+
+        return release_local
+
+    def _forget(self, session_id: str) -> None:
+        """Drop the per-session lock and counter once no turn of the session is queued or running."""
+        with self._mutex:
+            lock, waiters = self._locks[session_id]
+            if waiters <= 1:
+                del self._locks[session_id]
+                del self._seqs[session_id]
+            else:
+                self._locks[session_id] = (lock, waiters - 1)
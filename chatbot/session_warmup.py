@@ -0,0 +1,57 @@
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import Lock
+from typing import Any
+
+from core.metrics import metrics
+
+
+class SessionWarmup:
+    """Runs per-session warm-up work in the background and hands the result to the first message.
+
+    Entries that are never claimed (session created, no message sent) expire after `ttl` seconds.
+    """
+
+    def __init__(self, *, max_workers: int = 4, ttl: float = 300.0) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="session-warmup")
+        self._pending: dict[str, tuple[float, Future]] = {}
+        self._lock = Lock()
+        self.ttl = ttl
+
+    def start(self, session_id: str, loader: Callable[[], dict[str, Any]]) -> None:
+        future = self._executor.submit(self._run, loader)
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (created, _) in self._pending.items() if now - created > self.ttl]
+            for key in expired:
+                del self._pending[key]
+            self._pending[session_id] = (now, future)
+
+    def take(self, session_id: str, timeout: float) -> dict[str, Any] | None:
+        """Claim the warm-up result, waiting up to `timeout` seconds if it is still running."""
+        with self._lock:
+            entry = self._pending.pop(session_id, None)
+        if entry is None:
+            return None
+        _, future = entry
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            metrics.incr("session_warmup.timeouts")
+            return None
+        except Exception as e:
+            print(f"[SessionWarmup] Warm-up failed for session {session_id}: {e}")
+            metrics.incr("session_warmup.failures")
+            return None
+        metrics.incr("session_warmup.hits")
+        return result
+
+    @staticmethod
+    def _run(loader: Callable[[], dict[str, Any]]) -> dict[str, Any]:
+        with metrics.timer("session_warmup.latency"):
+            return loader()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
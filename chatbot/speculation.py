@@ -0,0 +1,220 @@
+import re
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from chatbot.rag import QdrantRAG
+from chatbot.ranking import price_search_bounds, rerank_products
+from chatbot.state import ChatbotState
+from chatbot.tools import get_user_orders, retrieve_product_candidates
+from chatbot.unit_price import UnitPriceQuery
+from chatbot.user_cache import UserDataCache
+from core.metrics import metrics
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+VI_STOP_WORDS = {
+    "tôi",
+    "mình",
+    "bạn",
+    "em",
+    "anh",
+    "chị",
+    "muốn",
+    "mua",
+    "cần",
+    "tìm",
+    "giúp",
+    "cho",
+    "xem",
+    "có",
+    "không",
+    "loại",
+    "nào",
+    "giá",
+    "rẻ",
+    "của",
+    "với",
+    "và",
+    "là",
+    "dưới",
+    "trên",
+    "khoảng",
+    "nghìn",
+    "ngàn",
+    "đồng",
+    "k",
+    "ạ",
+    "nhé",
+    "nha",
+    "ngon",
+    "hãy",
+    "đi",
+    "được",
+    "gì",
+}
+
+
+def speculative_terms(message: str) -> list[str]:
+    text = unicodedata.normalize("NFC", message).lower()
+    return [token for token in _TOKEN_RE.findall(text) if token not in VI_STOP_WORDS and not token.isdigit()]
+
+
+def keyword_overlap(speculative: list[str], keywords: list[str] | None) -> float:
+    """Share of the final keyword tokens that the speculative search already covered."""
+    final_tokens = {token for keyword in (keywords or []) for token in speculative_terms(keyword)}
+    if not final_tokens:
+        return 1.0 if not speculative else 0.0
+    return len(final_tokens & set(speculative)) / len(final_tokens)
+
+
+class SpeculativeTools:
+    """Starts the cheap tool calls on the raw message while the LLM is still classifying it.
+
+    One instance lives for a single graph run. Results are only used when the resolved intent and
+    keywords agree closely enough with what was speculated; otherwise they are cancelled or dropped.
+    """
+
+    def __init__(
+        self,
+        executor: ThreadPoolExecutor,
+        bind: Engine,
+        *,
+        rag: QdrantRAG | None = None,
+        user_cache: UserDataCache | None = None,
+        match_threshold: float = 0.6,
+        candidate_limit: int = 50,
+    ) -> None:
+        self.executor = executor
+        self.bind = bind
+        self.rag = rag
+        self.user_cache = user_cache
+        self.match_threshold = match_threshold
+        self.candidate_limit = candidate_limit
+        self.terms: list[str] = []
+        self._products: Future | None = None
+        self._orders: Future | None = None
+        self._used: set[str] = set()
+
+    def launch(self, state: ChatbotState) -> None:
+        self.terms = speculative_terms(state.get("message", ""))
+        if self.terms:
+            self._products = self.executor.submit(self._search_products, " ".join(self.terms))
+            metrics.incr("speculation.launched")
+        if state.get("user_id"):
+            self._orders = self.executor.submit(self._load_orders, state["user_id"])
+            metrics.incr("speculation.launched")
+
+    def _search_products(self, query_text: str) -> list[dict]:
+        with Session(bind=self.bind) as db:
+            return retrieve_product_candidates(
+                db,
+                self.terms,
+                query_text=query_text,
+                rag=self.rag,
+                candidate_limit=self.candidate_limit,
+            )
+
+    def _load_orders(self, user_id: int) -> list[dict]:
+        with Session(bind=self.bind) as db:
+            if self.user_cache:
+                return self.user_cache.get_orders(db, user_id)
+            return get_user_orders(db, user_id)
+
+    def products_for(
+        self,
+        keywords: list[str] | None,
+        *,
+        min_price: float | None,
+        max_price: float | None,
+        unit_price: UnitPriceQuery | None = None,
+        category_ids: set[int] | None = None,
+        limit: int = 5,
+    ) -> list[dict] | None:
+        if self._products is None:
+            return None
+        overlap = keyword_overlap(self.terms, keywords)
+        if overlap < self.match_threshold:
+            print(f"[Speculation] Product search rejected, keyword overlap {overlap:.2f}")
+            metrics.incr("speculation.products.rejected")
+            return None
+        try:
+            candidates = self._products.result()
+        except Exception as e:
+            print(f"[Speculation] Speculative product search failed: {e}")
+            metrics.incr("speculation.products.failed")
+            return None
+
+        clean_terms = [keyword.lower() for keyword in (keywords or []) if keyword]
+        if all(product.get("score") is None for product in candidates):
+            # SQL pool: newest products matching any single word of the raw message. It holds every
+            # row the final keyword query matches only if it was not truncated and each keyword
+            # contains one of those words; the rows are then narrowed to the final keyword clauses.
+            if len(candidates) >= self.candidate_limit or not self._covers(clean_terms):
+                print("[Speculation] Product search rejected, SQL pool may miss keyword matches")
+                metrics.incr("speculation.products.rejected")
+                return None
+            candidates = [
+                product
+                for product in candidates
+                if any(term in (product.get("product_name") or "").lower() for term in clean_terms)
+            ]
+
+        search_min, search_max = price_search_bounds(min_price, max_price)
+        in_range = [
+            product
+            for product in candidates
+            if (search_min is None or product["price"] >= search_min)
+            and (search_max is None or product["price"] <= search_max)
+            and (category_ids is None or product.get("category_id") in category_ids)
+        ]
+        if len(in_range) < limit and len(candidates) >= self.candidate_limit:
+            # The unfiltered candidate list was truncated, so a filtered query could still find more.
+            metrics.incr("speculation.products.rejected")
+            return None
+        if (unit_price is not None or category_ids is not None) and len(candidates) >= self.candidate_limit:
+            # The cheapest per unit or the category's products may be outside a truncated list of
+            # newest / most similar products.
+            metrics.incr("speculation.products.rejected")
+            return None
+
+        self._used.add("products")
+        metrics.incr("speculation.products.hits")
+        return rerank_products(
+            in_range,
+            keywords=clean_terms,
+            min_price=min_price,
+            max_price=max_price,
+            unit_price=unit_price,
+            top_k=limit,
+        )
+
+    def _covers(self, clean_terms: list[str]) -> bool:
+        """Whether every final keyword contains a speculated word, so its matches are in the SQL pool."""
+        terms = set(self.terms)
+        return bool(clean_terms) and all(terms & set(speculative_terms(keyword)) for keyword in clean_terms)
+
+    def orders_for(self, user_id: int | None) -> list[dict] | None:
+        if self._orders is None or not user_id:
+            return None
+        try:
+            orders = self._orders.result()
+        except Exception as e:
+            print(f"[Speculation] Speculative orders lookup failed: {e}")
+            metrics.incr("speculation.orders.failed")
+            return None
+        self._used.add("orders")
+        metrics.incr("speculation.orders.hits")
+        return orders
+
+    def finish(self) -> None:
+        """Cancel or account for speculative work the final plan did not use."""
+        for name, future in (("products", self._products), ("orders", self._orders)):
+            if future is None or name in self._used:
+                continue
+            if future.cancel():
+                metrics.incr(f"speculation.{name}.cancelled")
+            else:
+                metrics.incr(f"speculation.{name}.wasted")
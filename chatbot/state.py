@@ -1,16 +1,24 @@
 from typing import Any, TypedDict
 
+from chatbot.token_budget import LLMMode
+from chatbot.unit_price import UnitPriceQuery
+
 
 class ChatbotState(TypedDict, total=False):
     session_id: str
     user_id: int | None
     message: str
+    llm_mode: LLMMode
     recent_messages: list[dict[str, Any]] | None
     conversation_context: str | None
+    prior_summary: str | None
     intent: str | None
     keywords: list[str] | None
     product_query: str | None
     min_price: float | None
     max_price: float | None
+    unit_price_query: UnitPriceQuery | None
+    category: str | None
+    category_id: int | None
     tool_result: dict | None
     response: str | None
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import math
+import time
+from collections.abc import Callable
+from typing import Any, Generic, Literal, TypeVar
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from chatbot.formatting import load_json_object
+from chatbot.capture import current_capture
+from chatbot.token_budget import TurnUsage, current_turn_usage, step_tags
+from core.health import CallBreaker
+from core.metrics import metrics
+
+
+class IntentOutput(BaseModel):
+    intent: Literal["orders", "profile", "product_search"]
+    confidence: float | None = Field(None, ge=0, le=1, description="How sure the model is, 0-1")
+
+
+class KeywordOutput(BaseModel):
+    keywords: list[str] | None = None
+    query: str | None = None
+    min_price: float | None = None
+    max_price: float | None = None
+    category: str | None = None
+
+    @field_validator("min_price", "max_price", mode="before")
+    @classmethod
+    def _drop_unparseable_price(cls, value: Any) -> Any:
+        # A malformed price ("50k", "rẻ") drops only that bound, not the whole keyword payload.
+        if value is None or isinstance(value, bool):
+            return None
+        try:
+            price = float(value)
+        except (TypeError, ValueError):
+            return None
+        return price if math.isfinite(price) else None
+
+
+class ConversationOutput(BaseModel):
+    context: str = Field("", description="1-2 sentence summary, empty when there is no useful context")
+
+
+SchemaT = TypeVar("SchemaT", bound=BaseModel)
+
+
+def _message_text(message: Any) -> str:
+    content = getattr(message, "content", message)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part if isinstance(part, str) else str(part.get("text", "")) for part in content)
+    return str(content or "")
+
+
+def turn_callbacks(usage: TurnUsage | None) -> list[BaseCallbackHandler]:
+    """Per-turn handlers for a chain call: token accounting and, when recording, traffic capture."""
+    capture = current_capture()
+    return [handler for handler in (usage, capture) if handler is not None]
+
+
+def model_label(model: BaseChatModel) -> str:
+    """Model name used in metric names, e.g. "gemini-flash-lite-latest"."""
+    name = getattr(model, "model", None) or getattr(model, "model_name", None) or model._llm_type
+    return str(name).removeprefix("models/")
+
+
+class ModelUsageCallback(BaseCallbackHandler):
+    """Records latency, calls, errors and token usage per model as `llm.model.<name>.*` metrics.
+
+    With a `breaker`, call outcomes also decide whether the LLM counts as up.
+    """
+
+    def __init__(self, model_name: str, breaker: CallBreaker | None = None) -> None:
+        self.prefix = f"llm.model.{model_name}"
+        self.breaker = breaker
+        self._started: dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized: dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            metrics.observe(f"{self.prefix}.latency", time.perf_counter() - started)
+        metrics.incr(f"{self.prefix}.calls")
+        if self.breaker is not None:
+            self.breaker.success()
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                metrics.incr(f"{self.prefix}.input_tokens", usage.get("input_tokens", 0))
+                metrics.incr(f"{self.prefix}.output_tokens", usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started.pop(run_id, None)
+        metrics.incr(f"{self.prefix}.errors")
+        if self.breaker is not None:
+            self.breaker.failure(error)
+
+
+class StructuredChain(Generic[SchemaT]):
+    """A prompt bound to a Pydantic output schema.
+
+    Uses the model's native structured output (Gemini JSON schema mode) when it has one and a
+    plain text chain otherwise. Replies that do not validate are first repaired from the raw
+    text with the tolerant parser; only when that fails is the call repeated once, and only if
+    a second call still fits within `retry_deadline` seconds of the first one's start.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        prompt: ChatPromptTemplate,
+        model: BaseChatModel,
+        schema: type[SchemaT],
+        *,
+        structured: bool = True,
+        retry_deadline: float = 8.0,
+        batch_concurrency: int = 8,
+        breaker: CallBreaker | None = None,
+    ) -> None:
+        self.name = name
+        self.model_name = model_label(model)
+        self.usage_callback = ModelUsageCallback(self.model_name, breaker)
+        self.tags = step_tags(name)
+        self.schema = schema
+        self.retry_deadline = retry_deadline
+        self.batch_concurrency = batch_concurrency
+        self.structured = False
+        if structured:
+            try:
+                self.chain = prompt | model.with_structured_output(schema, method="json_schema", include_raw=True)
+                self.structured = True
+            except (NotImplementedError, TypeError, ValueError) as e:
+                print(f"[LLM] Structured output unavailable for {name} chain, parsing text replies: {e}")
+        if not self.structured:
+            self.chain = prompt | model | StrOutputParser()
+
+    def _config(self, usage: TurnUsage | None) -> dict[str, Any]:
+        return {"callbacks": [self.usage_callback, *turn_callbacks(usage)], "tags": self.tags}
+
+    def invoke(self, payload: dict[str, Any]) -> SchemaT | None:
+        started = time.monotonic()
+        config = self._config(current_turn_usage())
+        result = self._decode(self.chain.invoke(payload, config=config))
+        if result is None and self._can_retry(started):
+            metrics.incr(f"llm.{self.name}.retries")
+            result = self._decode(self.chain.invoke(payload, config=config))
+        if result is None:
+            metrics.incr(f"llm.{self.name}.failed")
+        return result
+
+    def batch(
+        self, payloads: list[dict[str, Any]], usages: list[TurnUsage | None] | None = None
+    ) -> list[SchemaT | None]:
+        """Batched invoke; transport errors come back as None without a retry.
+
+        `usages[i]` is the turn the tokens of `payloads[i]` are counted against.
+        """
+        if not payloads:
+            return []
+        usages = usages or [current_turn_usage()] * len(payloads)
+        configs = [{**self._config(usage), "max_concurrency": self.batch_concurrency} for usage in usages]
+        started = time.monotonic()
+        outputs = self.chain.batch(payloads, config=configs, return_exceptions=True)
+        results = [self._decode_or_log(output) for output in outputs]
+        malformed = [
+            index
+            for index, (output, result) in enumerate(zip(outputs, results))
+            if result is None and not isinstance(output, Exception)
+        ]
+        if malformed and self._can_retry(started):
+            metrics.incr(f"llm.{self.name}.retries", len(malformed))
+            retried = self.chain.batch(
+                [payloads[index] for index in malformed],
+                config=[configs[index] for index in malformed],
+                return_exceptions=True,
+            )
+            for index, output in zip(malformed, retried):
+                results[index] = self._decode_or_log(output)
+        failed = sum(1 for result in results if result is None)
+        if failed:
+            metrics.incr(f"llm.{self.name}.failed", failed)
+        return results
+
+    def _can_retry(self, started: float) -> bool:
+        if self.retry_deadline <= 0:
+            return False
+        # Assume the retry takes as long as the first attempt did.
+        elapsed = time.monotonic() - started
+        if 2 * elapsed <= self.retry_deadline:
+            return True
+        metrics.incr(f"llm.{self.name}.retries_skipped")
+        return False
+
+    def _decode_or_log(self, output: Any) -> SchemaT | None:
+        if isinstance(output, Exception):
+            print(f"[LLM] {self.name} call failed: {output}")
+            return None
+        return self._decode(output)
+
+    def _decode(self, output: Any) -> SchemaT | None:
+        if isinstance(output, dict) and "parsed" in output:
+            if isinstance(output["parsed"], self.schema):
+                metrics.incr(f"llm.{self.name}.structured")
+                return output["parsed"]
+            text = _message_text(output.get("raw"))
+        else:
+            text = _message_text(output)
+
+        data = load_json_object(text)
+        if data is not None:
+            try:
+                result = self.schema.model_validate(data)
+            except ValidationError as e:
+                print(f"[LLM] {self.name} payload failed validation: {e.errors()}")
+            else:
+                metrics.incr(f"llm.{self.name}.{'recovered' if self.structured else 'parsed'}")
+                return result
+        print(f"[LLM] Malformed {self.name} payload: {text!r}")
+        metrics.incr(f"llm.{self.name}.malformed")
+        return None
+
+
+class TieredChain(Generic[SchemaT]):
+    """A step run on a small model first, escalated to a larger one when the answer is invalid or unsure."""
+
+    def __init__(
+        self,
+        primary: StructuredChain[SchemaT],
+        escalation: StructuredChain[SchemaT] | None = None,
+        unsure: Callable[[SchemaT], bool] | None = None,
+    ) -> None:
+        self.name = primary.name
+        self.primary = primary
+        self.escalation = escalation
+        self.unsure = unsure
+
+    def _needs_escalation(self, result: SchemaT | None) -> bool:
+        return self.escalation is not None and (result is None or (self.unsure is not None and self.unsure(result)))
+
+    def invoke(self, payload: dict[str, Any]) -> SchemaT | None:
+        result = self.primary.invoke(payload)
+        if not self._needs_escalation(result):
+            return result
+        metrics.incr(f"llm.{self.name}.escalations")
+        escalated = self.escalation.invoke(payload)
+        return escalated if escalated is not None else result
+
+    def batch(
+        self, payloads: list[dict[str, Any]], usages: list[TurnUsage | None] | None = None
+    ) -> list[SchemaT | None]:
+        results = self.primary.batch(payloads, usages)
+        pending = [index for index, result in enumerate(results) if self._needs_escalation(result)]
+        if pending:
+            metrics.incr(f"llm.{self.name}.escalations", len(pending))
+            escalated = self.escalation.batch(
+                [payloads[index] for index in pending], [usages[index] for index in pending] if usages else None
+            )
+            for index, result in zip(pending, escalated):
+                if result is not None:
+                    results[index] = result
+        return results
@@ -0,0 +1,184 @@
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Any, Literal
+from uuid import UUID
+
+import redis
+from langchain_core.callbacks import BaseCallbackHandler
+
+from core.config import Settings
+from core.health import health
+from core.metrics import metrics
+
+# full: every LLM step; template: the reply is built from a template instead of the product
+# response model; off: no LLM call at all (regex intent/keywords, template reply).
+LLMMode = Literal["full", "template", "off"]
+
+SESSION_TTL_SECONDS = 86400 * 7
+DAILY_TTL_SECONDS = 86400 * 2
+STEP_TAG_PREFIX = "step:"
+
+_current_turn: ContextVar["TurnUsage | None"] = ContextVar("chatbot_turn_usage", default=None)
+
+
+def step_tags(step: str) -> list[str]:
+    """Tags for a chain call so TurnUsage can attribute its tokens to the step."""
+    return [f"{STEP_TAG_PREFIX}{step}"]
+
+
+class TurnUsage(BaseCallbackHandler):
+    """Tokens used by one turn, per LLM step; attached as a callback to every chain call of the turn."""
+
+    def __init__(self, session_id: str, user_id: int | None = None, mode: LLMMode = "full") -> None:
+        self.session_id = session_id
+        self.user_id = user_id
+        self.mode = mode
+        self.steps: dict[str, list[int]] = {}
+        self._lock = Lock()
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, tags: list[str] | None = None, **kwargs: Any) -> None:
+        steps = [tag.removeprefix(STEP_TAG_PREFIX) for tag in tags or () if tag.startswith(STEP_TAG_PREFIX)]
+        step = steps[0] if steps else "other"
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                self.add(step, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+
+    def add(self, step: str, input_tokens: int, output_tokens: int) -> None:
+        with self._lock:
+            counts = self.steps.setdefault(step, [0, 0])
+            counts[0] += input_tokens
+            counts[1] += output_tokens
+
+    @property
+    def input_tokens(self) -> int:
+        return sum(counts[0] for counts in self.steps.values())
+
+    @property
+    def output_tokens(self) -> int:
+        return sum(counts[1] for counts in self.steps.values())
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+def current_turn_usage() -> TurnUsage | None:
+    return _current_turn.get()
+
+
+@contextmanager
+def track_turn(usage: TurnUsage | None) -> Iterator[TurnUsage | None]:
+    """Attribute the LLM calls made in this context (and threads copying it) to `usage`."""
+    token = _current_turn.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_turn.reset(token)
+
+
+class TokenBudget:
+    """Token counters per session, per user per day and globally per day, with budgets.
+
+    Counters are Redis hashes ({input, output, total, <step>}) shared by every worker; without
+    Redis, or while the health monitor reports it down, they are per-process. A turn starts in
+    "template" mode once any counter reaches `token_budget_template_ratio` of its budget and in
+    "off" mode once it reaches the budget. A budget of 0 is unlimited.
+    """
+
+    def __init__(self, settings: Settings, client: redis.Redis | None = None, max_entries: int = 10000) -> None:
+        self.redis_client = client
+        self.budgets = {
+            "session": settings.token_budget_session,
+            "user": settings.token_budget_user_daily,
+            "global": settings.token_budget_global_daily,
+        }
+        self.template_ratio = settings.token_budget_template_ratio
+        self.max_entries = max_entries
+        self._local: OrderedDict[str, dict[str, int]] = OrderedDict()
+        self._lock = Lock()
+
+    def _keys(self, session_id: str, user_id: int | None) -> dict[str, tuple[str, int]]:
+        """scope -> (key, ttl)"""
+        day = datetime.now(timezone.utc).strftime("%Y%m%d")
+        keys = {
+            "session": (f"chatbot:tokens:session:{session_id}", SESSION_TTL_SECONDS),
+            "global": (f"chatbot:tokens:global:{day}", DAILY_TTL_SECONDS),
+        }
+        if user_id:
+            keys["user"] = (f"chatbot:tokens:user:{user_id}:{day}", DAILY_TTL_SECONDS)
+        return keys
+
+    def _use_redis(self) -> bool:
+        return self.redis_client is not None and health.is_up("redis")
+
+    def totals(self, session_id: str, user_id: int | None = None) -> dict[str, int]:
+        """Tokens used so far: {"session": ..., "global": ..., "user": ...}."""
+        keys = self._keys(session_id, user_id)
+        if self._use_redis():
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for key, _ in keys.values():
+                    pipe.hget(key, "total")
+                return {scope: int(value or 0) for scope, value in zip(keys, pipe.execute())}
+            except Exception as e:
+                print(f"[TokenBudget] Error reading counters: {e}")
+                return {scope: 0 for scope in keys}
+        with self._lock:
+            return {scope: self._local.get(key, {}).get("total", 0) for scope, (key, _) in keys.items()}
+
+    def start_turn(self, session_id: str, user_id: int | None = None) -> TurnUsage:
+        """A TurnUsage whose mode reflects the budgets the session, user and service have left."""
+        mode: LLMMode = "full"
+        if any(self.budgets.values()):
+            totals = self.totals(session_id, user_id)
+            used = max(
+                (totals.get(scope, 0) / budget for scope, budget in self.budgets.items() if budget), default=0.0
+            )
+            if used >= 1:
+                mode = "off"
+            elif used >= self.template_ratio:
+                mode = "template"
+            if mode != "full":
+                metrics.incr(f"tokens.degraded.{mode}")
+                print(f"[TokenBudget] Session {session_id} runs in {mode} mode ({used:.0%} of a token budget used)")
+        return TurnUsage(session_id, user_id, mode)
+
+    def commit(self, usage: TurnUsage) -> None:
+        """Add a finished turn's tokens to its session, user and global counters."""
+        if not usage.steps:
+            return
+        fields = {"input": usage.input_tokens, "output": usage.output_tokens, "total": usage.total_tokens}
+        for step, (input_tokens, output_tokens) in usage.steps.items():
+            fields[step] = input_tokens + output_tokens
+            metrics.incr(f"tokens.{step}.input", input_tokens)
+            metrics.incr(f"tokens.{step}.output", output_tokens)
+        metrics.incr("tokens.input", fields["input"])
+        metrics.incr("tokens.output", fields["output"])
+
+        keys = self._keys(usage.session_id, usage.user_id)
+        if self._use_redis():
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for key, ttl in keys.values():
+                    for field, value in fields.items():
+                        pipe.hincrby(key, field, value)
+                    pipe.expire(key, ttl)
+                pipe.execute()
+                return
+            except Exception as e:
+                print(f"[TokenBudget] Error writing counters: {e}")
+                if isinstance(e, (redis.ConnectionError, redis.TimeoutError)):
+                    health.mark_down("redis", e)
+        with self._lock:
+            for key, _ in keys.values():
+                counters = self._local.setdefault(key, {})
+                for field, value in fields.items():
+                    counters[field] = counters.get(field, 0) + value
+                self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
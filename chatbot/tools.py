@@ -1,9 +1,18 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
 from sqlalchemy import or_
 from sqlalchemy.orm import Session
 
 from chatbot.prompts import TOOL_PROMPTS
-from chatbot.rag import QdrantRAG
-from models.models import Order, Product, User
+from chatbot.ranking import price_search_bounds, rerank_products
+from chatbot.unit_price import UnitPriceQuery
+from models.models import CategoryClosure, Order, Product, User
+
+if TYPE_CHECKING:
+    # qdrant_client is slow to import; the tools only need the type.
+    from chatbot.rag import QdrantRAG
 
 SEARCH_PRODUCTS_PROMPT = TOOL_PROMPTS["search_products_by_keyword"]
 GET_ORDERS_PROMPT = TOOL_PROMPTS["get_user_orders"]
@@ -16,40 +25,126 @@ def search_products_by_keyword(
     *,
     min_price: float | None = None,
     max_price: float | None = None,
+    unit_price: UnitPriceQuery | None = None,
+    category_id: int | None = None,
+    query_text: str | None = None,
+    rag: QdrantRAG | None = None,
+    limit: int = 5,
+    candidate_limit: int = 50,
 ) -> list[dict]:
     clean_terms = [term.lower() for term in (keywords or []) if term]
-    print(f"[Tools] search_products_by_keyword terms={clean_terms}, min={min_price}, max={max_price}")
-
-    print("[Tools] Using SQL search")
-    query = db.query(Product).filter(Product.is_active.is_(True))
-    if clean_terms:
-        like_clauses = [Product.product_name.ilike(f"%{term}%") for term in clean_terms]
-        query = query.filter(or_(*like_clauses))
-    else:
-        print("[Tools] No keyword provided, returning latest active products.")
+    print(
+        f"[Tools] search_products_by_keyword terms={clean_terms}, min={min_price}, max={max_price}, "
+        f"unit_price={unit_price}, category={category_id}"
+    )
 
-    if min_price is not None:
-        query = query.filter(Product.current_price >= min_price)
-    if max_price is not None:
-        query = query.filter(Product.current_price <= max_price)
+    # Retrieve slightly outside the range; re-ranking penalizes the distance from it.
+    search_min, search_max = price_search_bounds(min_price, max_price)
+    search = dict(
+        min_price=search_min,
+        max_price=search_max,
+        unit_price=unit_price,
+        query_text=query_text,
+        rag=rag,
+        candidate_limit=candidate_limit,
+    )
+    candidates = retrieve_product_candidates(db, clean_terms, category_id=category_id, **search)
+    if not candidates and category_id is not None:
+        # The category may be wrong or its products not categorized yet.
+        print("[Tools] Nothing in the category, searching all products")
+        candidates = retrieve_product_candidates(db, clean_terms, **search)
+    return rerank_products(
+        candidates,
+        keywords=clean_terms,
+        min_price=min_price,
+        max_price=max_price,
+        unit_price=unit_price,
+        top_k=limit,
+    )
 
-    products = query.order_by(Product.created_at.desc()).limit(5).all()
 
-    return [
-        {
-            "product_id": str(product.id),
-            "product_code": product.product_code,
-            "product_name": product.product_name or "",
-            "price": float(product.current_price or 0),
-            "price_text": product.current_price_text,
-            "unit": product.unit,
-            "product_url": product.product_url,
-            "image_url": product.image_url,
-            "discount_percent": product.discount_percent,
-            "score": None,
-        }
-        for product in products
-    ]
+def retrieve_product_candidates(
+    db: Session,
+    clean_terms: list[str],
+    *,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    unit_price: UnitPriceQuery | None = None,
+    category_id: int | None = None,
+    query_text: str | None = None,
+    rag: QdrantRAG | None = None,
+    candidate_limit: int = 50,
+) -> list[dict]:
+    """Fetch up to candidate_limit unranked products, from Qdrant when possible, else SQL.
+
+    With `unit_price`, only products with a known unit price are returned, and SQL returns the
+    cheapest per unit instead of the newest. With `category_id`, only products of that category
+    or its descendants are considered, looked up through the category closure before any text match.
+    """
+    candidates: list[dict] = []
+    rag_query = query_text or " ".join(clean_terms)
+    if rag and rag.available and rag_query:
+        print("[Tools] Using Qdrant search")
+        candidates = rag.search_products(
+            rag_query,
+            limit=candidate_limit,
+            min_price=min_price,
+            max_price=max_price,
+            unit_price=unit_price,
+            category_id=category_id,
+        )
+
+    if not candidates:
+        print("[Tools] Using SQL search")
+        query = db.query(Product).filter(Product.is_active.is_(True))
+        if category_id is not None:
+            # Driven from the closure: each descendant category is a range of
+            # ix_products_category_id_is_active_created_at.
+            query = query.join(CategoryClosure, CategoryClosure.descendant_id == Product.category_id).filter(
+                CategoryClosure.ancestor_id == category_id
+            )
+        if clean_terms:
+            like_clauses = [Product.product_name.ilike(f"%{term}%") for term in clean_terms]
+            query = query.filter(or_(*like_clauses))
+        else:
+            print("[Tools] No keyword provided, returning latest active products.")
+
+        if min_price is not None:
+            query = query.filter(Product.current_price >= min_price)
+        if max_price is not None:
+            query = query.filter(Product.current_price <= max_price)
+
+        if unit_price is not None:
+            query = query.filter(Product.unit_price.isnot(None))
+            if unit_price.unit:
+                query = query.filter(Product.unit_price_unit == unit_price.unit)
+            if unit_price.max_unit_price is not None:
+                query = query.filter(Product.unit_price <= unit_price.max_unit_price)
+            query = query.order_by(Product.unit_price.asc())
+        else:
+            query = query.order_by(Product.created_at.desc())
+
+        products = query.limit(candidate_limit).all()
+        candidates = [
+            {
+                "product_id": str(product.id),
+                "product_code": product.product_code,
+                "product_name": product.product_name or "",
+                "price": float(product.current_price or 0),
+                "price_text": product.current_price_text,
+                "unit": product.unit,
+                "product_url": product.product_url,
+                "image_url": product.image_url,
+                "discount_percent": product.discount_percent,
+                "stock_quantity": product.stock_quantity,
+                "unit_price": float(product.unit_price) if product.unit_price is not None else None,
+                "unit_price_unit": product.unit_price_unit,
+                "category_id": product.category_id,
+                "score": None,
+            }
+            for product in products
+        ]
+    return candidates
 
 
 def get_user_orders(db: Session, user_id: int) -> list[dict]:
@@ -84,6 +179,9 @@ def suggest_products(db: Session, limit: int = 3) -> list[dict]:
             "product_url": product.product_url,
             "image_url": product.image_url,
             "discount_percent": product.discount_percent,
+            "stock_quantity": product.stock_quantity,
+            "unit_price": float(product.unit_price) if product.unit_price is not None else None,
+            "unit_price_unit": product.unit_price_unit,
             "score": None,
         }
         for product in products
@@ -0,0 +1,207 @@
+import argparse
+import re
+import unicodedata
+from typing import Any, NamedTuple
+
+from sqlalchemy import bindparam, event, inspect, select, update
+from sqlalchemy.engine import Connection
+
+from models.models import Product
+
+BASE_UNITS = ("kg", "l", "item")
+UNIT_LABELS = {"kg": "kg", "l": "lít", "item": "cái"}
+
+# Measured units -> (base unit, factor to the base unit).
+MEASURES = {
+    "mg": ("kg", 0.000001),
+    "g": ("kg", 0.001),
+    "gr": ("kg", 0.001),
+    "gam": ("kg", 0.001),
+    "gram": ("kg", 0.001),
+    "kg": ("kg", 1.0),
+    "ký": ("kg", 1.0),
+    "kí": ("kg", 1.0),
+    "ml": ("l", 0.001),
+    "l": ("l", 1.0),
+    "lít": ("l", 1.0),
+    "lit": ("l", 1.0),
+}
+# Counted units: "Vỉ 10 quả" is 10 items; "Thùng 24 lon 330ml" is 24 x 330ml.
+COUNT_UNITS = "quả|trái|cái|chiếc|cây|miếng|viên|gói|hộp|lon|chai|túi|bịch|hũ|ly|cuộn|tép|con|bó|vỉ|lốc|thùng"
+
+# Numbers must start a token, so "Gạo ST25 túi 5kg" is not read as 25 x 5kg.
+_NUMBER = r"(?<![\w.,])(\d+(?:[.,]\d+)*)"
+_MEASURE = rf"{_NUMBER}\s*({'|'.join(sorted(MEASURES, key=len, reverse=True))})(?!\w)"
+_COUNT = rf"(?<![\w.,])(\d+)\s*({COUNT_UNITS})(?!\w)"
+# "Thùng 24 lon 330ml", "Lốc 4 hộp x 180ml", "4 x 180ml"
+MULTIPACK_RE = re.compile(rf"(?<![\w.,])(\d+)\s*(?:[x×*]|(?:{COUNT_UNITS})(?:\s*[x×*])?)\s*{_MEASURE}")
+MEASURE_RE = re.compile(_MEASURE)
+COUNT_RE = re.compile(_COUNT)
+BARE_MEASURE_RE = re.compile(r"^(kg|ký|kí|lít|lit|l)$")
+THOUSANDS_RE = re.compile(r"^\d{1,3}(?:[.,]\d{3})+$")
+
+# "rẻ nhất tính theo kg", "giá một lít", "dưới 100k/kg"; a plain "mua 1 kg gạo" is not a best-value request.
+_QUERY_UNITS = {
+    "kg": "kg",
+    "ký": "kg",
+    "kí": "kg",
+    "cân": "kg",
+    "lít": "l",
+    "lit": "l",
+    "cái": "item",
+    "quả": "item",
+    "trái": "item",
+}
+QUERY_UNIT_RE = re.compile(rf"(?:theo|mỗi|/|trên|per|giá (?:một|1))\s*({'|'.join(_QUERY_UNITS)})(?!\w)")
+QUERY_BEST_VALUE_RE = re.compile(r"(?:quy đổi|đơn giá|giá đơn vị|tính theo (?:khối lượng|dung tích|trọng lượng))")
+QUERY_MAX_RE = re.compile(
+    rf"(?:dưới|không quá|tối đa|<=?)\s*{_NUMBER}\s*(k|nghìn|ngàn|tr|triệu|đ|đồng|vnd)?\s*"
+    rf"(?:/|một|mỗi|1|trên)\s*({'|'.join(_QUERY_UNITS)})(?!\w)"
+)
+_AMOUNT_FACTORS = {"k": 1000, "nghìn": 1000, "ngàn": 1000, "tr": 1000000, "triệu": 1000000}
+
+
+class PackSize(NamedTuple):
+    quantity: float
+    unit: str  # one of BASE_UNITS
+
+
+class UnitPriceQuery(NamedTuple):
+    """A best-value request: rank by price per `unit` (None = the most common unit among results)."""
+
+    unit: str | None = None
+    max_unit_price: float | None = None
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFC", text).lower().strip()
+
+
+def _number(raw: str) -> float:
+    if THOUSANDS_RE.match(raw):
+        return float(re.sub(r"[.,]", "", raw))
+    return float(raw.replace(",", "."))
+
+
+def parse_pack_size(text: str | None) -> PackSize | None:
+    """Pack size of one listing text such as "Gói 50g", "Thùng 24 lon 330ml" or "Vỉ 10 quả"."""
+    if not text:
+        return None
+    text = _normalize(text)
+    if match := MULTIPACK_RE.search(text):
+        count, amount, measure = match.groups()
+        unit, factor = MEASURES[measure]
+        quantity = int(count) * _number(amount) * factor
+    elif match := MEASURE_RE.search(text):
+        amount, measure = match.groups()
+        unit, factor = MEASURES[measure]
+        quantity = _number(amount) * factor
+    elif match := COUNT_RE.search(text):
+        unit, quantity = "item", float(match.group(1))
+    elif match := BARE_MEASURE_RE.match(text):
+        # Sold by weight/volume: "120.000đ/Kg"
+        unit, quantity = MEASURES[match.group(1)][0], 1.0
+    else:
+        return None
+    return PackSize(quantity, unit) if quantity > 0 else None
+
+
+def product_pack_size(price_text: str | None, unit: str | None, name: str | None) -> PackSize | None:
+    """Pack size from the price text ("16.000đ/Gói 50g"), else the unit column, else the name."""
+    pack_text = price_text.split("/", 1)[1] if price_text and "/" in price_text else None
+    for text in (pack_text, unit, name):
+        pack = parse_pack_size(text)
+        if pack is not None:
+            return pack
+    return None
+
+
+def unit_price(price: Any, price_text: str | None, unit: str | None, name: str | None) -> tuple[float, str] | None:
+    """(price per kg / liter / item, base unit), or None when the pack size is not recognized."""
+    pack = product_pack_size(price_text, unit, name)
+    if pack is None or not price:
+        return None
+    return round(float(price) / pack.quantity, 2), pack.unit
+
+
+def format_unit_price(value: float, unit: str) -> str:
+    return f"{value:,.0f}đ/{UNIT_LABELS[unit]}".replace(",", ".")
+
+
+def parse_unit_price_query(message: str | None) -> UnitPriceQuery | None:
+    """Detect "cheapest per kg / liter / item" requests and an optional per-unit budget."""
+    if not message:
+        return None
+    text = _normalize(message)
+    if match := QUERY_MAX_RE.search(text):
+        amount, suffix, unit = match.groups()
+        value = _number(amount) * _AMOUNT_FACTORS.get(suffix or "", 1)
+        return UnitPriceQuery(_QUERY_UNITS[unit], value)
+    if match := QUERY_UNIT_RE.search(text):
+        return UnitPriceQuery(_QUERY_UNITS[match.group(1)])
+    if QUERY_BEST_VALUE_RE.search(text):
+        return UnitPriceQuery()
+    return None
+
+
+def _fill_unit_price(mapper, connection, target: Product) -> None:
+    state = inspect(target)
+    if state.persistent and not any(
+        state.attrs[name].history.has_changes()
+        for name in ("current_price", "current_price_text", "unit", "product_name")
+    ):
+        return
+    parsed = unit_price(target.current_price, target.current_price_text, target.unit, target.product_name)
+    target.unit_price, target.unit_price_unit = parsed if parsed else (None, None)
+
+
+def register_unit_price_hooks() -> None:
+    """Keep products.unit_price in sync whenever the ORM writes a product."""
+    if event.contains(Product, "before_insert", _fill_unit_price):
+        return
+    event.listen(Product, "before_insert", _fill_unit_price)
+    event.listen(Product, "before_update", _fill_unit_price)
+
+
+def backfill_unit_prices(connection: Connection, *, recompute: bool = False, batch_size: int = 1000) -> int:
+    """Fill unit_price for products written outside the ORM (or all products with recompute)."""
+    table = Product.__table__
+    statement = update(table).where(table.c.id == bindparam("_id"))
+    statement = statement.values(unit_price=bindparam("_unit_price"), unit_price_unit=bindparam("_unit"))
+    last_id = 0
+    updated = 0
+    while True:
+        query = select(
+            table.c.id, table.c.current_price, table.c.current_price_text, table.c.unit, table.c.product_name
+        ).where(table.c.id > last_id)
+        if not recompute:
+            query = query.where(table.c.unit_price.is_(None))
+        rows = connection.execute(query.order_by(table.c.id).limit(batch_size)).all()
+        if not rows:
+            return updated
+        params = []
+        for row in rows:
+            parsed = unit_price(row.current_price, row.current_price_text, row.unit, row.product_name)
+            if parsed or recompute:
+                value, unit = parsed or (None, None)
+                params.append({"_id": row.id, "_unit_price": value, "_unit": unit})
+        if params:
+            connection.execute(statement, params)
+            updated += len(params)
+        last_id = rows[-1].id
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fill products.unit_price from the pack sizes")
+    parser.add_argument("--recompute", action="store_true", help="reparse every product, not only missing ones")
+    args = parser.parse_args()
+
+    from db.database import get_engine
+
+    with get_engine().begin() as connection:
+        updated = backfill_unit_prices(connection, recompute=args.recompute)
+    print(f"[UnitPrice] Updated {updated} products")
+
+
+if __name__ == "__main__":
+    main()
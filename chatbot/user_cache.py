@@ -0,0 +1,172 @@
+import json
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from functools import lru_cache
+from threading import Lock
+from typing import Any
+
+import redis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from chatbot.tools import get_user_orders, get_user_profile
+from core.config import Settings, get_settings
+from core.health import health
+from core.metrics import metrics
+from models.models import Order, User
+
+_MISSING = object()
+
+
+class UserDataCache:
+    """Read-through cache for per-user tool results (orders, profile).
+
+    Uses Redis when configured so every worker sees the same entries and invalidations,
+    otherwise falls back to a bounded in-process TTL map.
+    """
+
+    KINDS = ("orders", "profile")
+
+    def __init__(self, settings: Settings, client: redis.Redis | None = None, max_entries: int = 10000) -> None:
+        self.ttl = settings.user_cache_ttl_seconds
+        self.redis_client: redis.Redis | None = client
+        if self.redis_client is None and settings.redis_url:
+            try:
+                self.redis_client = redis.from_url(
+                    settings.redis_url,
+                    decode_responses=True,
+                    socket_connect_timeout=settings.redis_socket_timeout_seconds,
+                    socket_timeout=settings.redis_socket_timeout_seconds,
+                )
+            except Exception as e:
+                print(f"[UserCache] Failed to connect to Redis, using in-process cache: {e}")
+                self.redis_client = None
+        self.max_entries = max_entries
+        self._local: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = Lock()
+
+    def _key(self, user_id: int, kind: str) -> str:
+        return f"chatbot:user:{user_id}:{kind}"
+
+    def _get(self, key: str) -> Any:
+        if self.redis_client is not None:
+            if not health.is_up("redis"):
+                # Read straight from the database rather than waiting on a dead Redis.
+                return _MISSING
+            try:
+                raw = self.redis_client.get(key)
+            except Exception as e:
+                print(f"[UserCache] Error reading {key}: {e}")
+                return _MISSING
+            return _MISSING if raw is None else json.loads(raw)
+
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+            return value
+
+    def _set_many(self, values: dict[str, Any]) -> None:
+        if self.redis_client is not None:
+            if not health.is_up("redis"):
+                return
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for key, value in values.items():
+                    pipe.set(key, json.dumps(value, ensure_ascii=False), ex=self.ttl)
+                pipe.execute()
+            except Exception as e:
+                print(f"[UserCache] Error writing cache: {e}")
+            return
+
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in values.items():
+                self._local[key] = (expires_at, value)
+                self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def _read_through(self, db: Session, user_id: int, kind: str, loader: Callable[[Session, int], Any]) -> Any:
+        key = self._key(user_id, kind)
+        cached = self._get(key)
+        if cached is not _MISSING:
+            metrics.incr(f"user_cache.{kind}.hits")
+            return cached
+        metrics.incr(f"user_cache.{kind}.misses")
+        value = loader(db, user_id)
+        self._set_many({key: value})
+        return value
+
+    def get_orders(self, db: Session, user_id: int) -> list[dict]:
+        return self._read_through(db, user_id, "orders", get_user_orders)
+
+    def get_profile(self, db: Session, user_id: int) -> dict | None:
+        return self._read_through(db, user_id, "profile", get_user_profile)
+
+    def prefetch(self, db: Session, user_id: int) -> None:
+        """Load orders and profile in one go and write both entries in a single round-trip."""
+        self._set_many(
+            {
+                self._key(user_id, "orders"): get_user_orders(db, user_id),
+                self._key(user_id, "profile"): get_user_profile(db, user_id),
+            }
+        )
+        metrics.incr("user_cache.prefetches")
+
+    def invalidate(self, user_id: int) -> None:
+        keys = [self._key(user_id, kind) for kind in self.KINDS]
+        if self.redis_client is not None:
+            try:
+                self.redis_client.delete(*keys)
+            except Exception as e:
+                print(f"[UserCache] Error invalidating user {user_id}: {e}")
+        else:
+            with self._lock:
+                for key in keys:
+                    self._local.pop(key, None)
+        metrics.incr("user_cache.invalidations")
+
+
+@lru_cache(maxsize=1)
+def get_user_cache() -> UserDataCache:
+    return UserDataCache(get_settings())
+
+
+def invalidate_user(user_id: int | None) -> None:
+    """Hook for code paths that change a user's orders or profile outside the ORM listeners."""
+    if user_id:
+        get_user_cache().invalidate(user_id)
+
+
+def _track_user_change(mapper, connection, target) -> None:
+    user_id = target.id if isinstance(target, User) else target.user_id
+    session = Session.object_session(target)
+    if session is not None and user_id:
+        session.info.setdefault("chatbot_dirty_users", set()).add(user_id)
+
+
+def _invalidate_after_commit(session: Session) -> None:
+    for user_id in session.info.pop("chatbot_dirty_users", ()):
+        invalidate_user(user_id)
+
+
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop("chatbot_dirty_users", None)
+
+
+def register_invalidation_hooks() -> None:
+    """Invalidate cached orders/profile once a transaction that touched them commits."""
+    if event.contains(Session, "after_commit", _invalidate_after_commit):
+        return
+    for model in (Order, User):
+        for name in ("after_insert", "after_update", "after_delete"):
+            event.listen(model, name, _track_user_change)
+    event.listen(Session, "after_commit", _invalidate_after_commit)
+    event.listen(Session, "after_rollback", _discard_after_rollback)
@@ -6,12 +6,89 @@ class Settings(BaseSettings):
     chatbot_port: int = 8001
     database_url: str
     redis_url: str | None = None
+    redis_socket_timeout_seconds: float = 2.0
+    redis_write_behind: bool = True
+    redis_write_buffer_size: int = 10000
+    redis_write_batch_size: int = 200
+    # With a Redis turn lock, a turn waits this long for its history writes before releasing the lock.
+    redis_write_flush_wait_seconds: float = 2.0
+    # Every stored message is also appended to this stream for `python -m chatbot.archive`.
+    history_stream_enabled: bool = False
+    history_stream_key: str = "chatbot:history:stream"
+    # Backlog cap: at this many unarchived entries new messages are not published (history_stream.dropped).
+    history_stream_maxlen: int = 1000000
+    archive_dir: str = "archive/history"
+    archive_format: str = "parquet"
+    archive_batch_rows: int = 10000
+    archive_flush_seconds: float = 60.0
+    archive_claim_idle_seconds: float = 300.0
     gemini_api_key: str | None = None
     gemini_model: str = "gemini-flash-latest"
+    llm_structured_output: bool = True
+    llm_retry_deadline_seconds: float = 8.0
+    # Per-step models; unset steps use gemini_model. Invalid or unsure answers from a step's model
+    # are retried once on llm_escalation_model (default gemini_model) when it is a different model.
+    # Timeouts are unset (no client timeout) unless configured, e.g. LLM_INTENT_TIMEOUT_SECONDS=5.
+    llm_intent_model: str | None = None
+    llm_intent_temperature: float = 0.0
+    llm_intent_timeout_seconds: float | None = None
+    llm_intent_min_confidence: float = 0.6
+    llm_keywords_model: str | None = None
+    llm_keywords_temperature: float = 0.0
+    llm_keywords_timeout_seconds: float | None = None
+    llm_conversation_model: str | None = None
+    llm_conversation_temperature: float = 0.0
+    llm_conversation_timeout_seconds: float | None = None
+    llm_product_model: str | None = None
+    llm_product_temperature: float = 0.0
+    llm_product_timeout_seconds: float | None = None
+    llm_escalation_model: str | None = None
+    # After this many consecutive failed LLM calls the LLM counts as down for the cooldown.
+    llm_breaker_failures: int = 5
+    llm_breaker_cooldown_seconds: float = 30.0
+    # Token budgets (0 = unlimited). From template_ratio of a budget on, replies are built from
+    # templates; past the budget the turn makes no LLM call.
+    token_budget_session: int = 0
+    token_budget_user_daily: int = 0
+    token_budget_global_daily: int = 0
+    token_budget_template_ratio: float = 0.8
     log_level: str = "INFO"
+    health_check_interval_seconds: float = 5.0
+    health_check_timeout_seconds: float = 2.0
+    user_cache_ttl_seconds: int = 60
+    category_tree_ttl_seconds: int = 300
+    session_warmup_wait_seconds: float = 1.0
+    speculative_tools: bool = False
+    speculation_workers: int = 8
+    speculation_match_threshold: float = 0.6
+    session_latest_wins: bool = False
+    session_lock_ttl_seconds: int = 60
+    session_lock_wait_seconds: float = 30.0
+    batch_max_items: int = 100
+    batch_max_concurrency: int = 8
+    payment_batch_max_items: int = 500
+    response_gzip_min_bytes: int = 0
+    # Sampled request profiling; requests sending X-Profile-Token: <profiling_token> are always profiled.
+    profiling_sample_rate: float = 0.0
+    profiling_token: str | None = None
+    profiling_dir: str = ".profiles"
+    profiling_interval_ms: float = 5.0
+    profiling_keep: int = 200
+    # Traffic capture for offline replay (benchmarks/replay.py); off unless capture_dir is set.
+    capture_dir: str | None = None
+    capture_sample_rate: float = 1.0
+    capture_flush_records: int = 50
+    capture_flush_seconds: float = 10.0
     qdrant_url: str | None = None
     qdrant_api_key: str | None = None
     qdrant_collection: str = "products"
+    qdrant_vector_name: str = "text"
+    rag_score_threshold: float | None = None
+    embedding_model: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    embedding_batch_size: int = 64
+    embedding_cache_size: int = 2048
+    index_batch_size: int = 256
+    index_checkpoint_path: str = ".index_checkpoint.json"
 
     model_config = {
         "env_file": ".env",
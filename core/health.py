@@ -0,0 +1,161 @@
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import Event, Lock, Thread
+from typing import Any
+
+from core.metrics import metrics
+
+
+class HealthMonitor:
+    """Pings registered dependencies on an interval and caches whether each one answered.
+
+    Request paths call `is_up()` instead of talking to a dependency that is known to be down, so
+    they skip it immediately rather than each waiting for a connection timeout. A dependency
+    that was never probed counts as up. Callers that see a connection error can `mark_down()`
+    right away; the next successful probe brings the dependency back.
+    """
+
+    def __init__(self, interval: float = 5.0, timeout: float = 2.0) -> None:
+        self.interval = interval
+        self.timeout = timeout
+        self._probes: dict[str, tuple[Callable[[], Any], Callable[[], bool] | None]] = {}
+        self._results: dict[str, dict[str, Any]] = {}
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Thread | None = None
+        self._executor: ThreadPoolExecutor | None = None
+
+    def register(self, name: str, probe: Callable[[], Any], when: Callable[[], bool] | None = None) -> None:
+        """Add a probe; `when` defers probing until it returns True (e.g. the client is built)."""
+        with self._lock:
+            self._probes[name] = (probe, when)
+
+    def is_up(self, name: str) -> bool:
+        result = self._results.get(name)
+        if result is None or result["up"]:
+            return True
+        # Dependencies without a probe come back on their own once the retry time has passed.
+        return result.get("retry_at") is not None and time.time() >= result["retry_at"]
+
+    def status(self, name: str) -> dict[str, Any] | None:
+        """The last recorded result for `name` (up, checked_at, error, ...), or None if never recorded."""
+        with self._lock:
+            result = self._results.get(name)
+            return dict(result) if result is not None else None
+
+    def mark_down(self, name: str, error: Exception | str, retry_after: float | None = None) -> None:
+        """Record a failure; with `retry_after`, `is_up()` lets calls through again after that many seconds."""
+        self._record(name, False, str(error), None, retry_after)
+
+    def mark_up(self, name: str) -> None:
+        self._record(name, True, None, None)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="health-probe")
+        self._thread = Thread(target=self._run, name="health-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.check_all()
+            self._stop.wait(self.interval)
+
+    def check_all(self) -> None:
+        """Run every probe concurrently; a probe that exceeds `timeout` counts as down."""
+        with self._lock:
+            probes = {name: probe for name, (probe, when) in self._probes.items() if when is None or when()}
+        executor = self._executor or ThreadPoolExecutor(max_workers=4, thread_name_prefix="health-probe")
+        futures = {name: executor.submit(self._timed, probe) for name, probe in probes.items()}
+        deadline = time.perf_counter() + self.timeout
+        for name, future in futures.items():
+            try:
+                seconds = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+            except FutureTimeoutError:
+                self._record(name, False, f"no answer within {self.timeout}s", None)
+            except Exception as e:
+                self._record(name, False, str(e), None)
+            else:
+                self._record(name, True, None, seconds)
+        if executor is not self._executor:
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def _timed(probe: Callable[[], Any]) -> float:
+        started = time.perf_counter()
+        probe()
+        return time.perf_counter() - started
+
+    def _record(
+        self, name: str, up: bool, error: str | None, seconds: float | None, retry_after: float | None = None
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            previous = self._results.get(name)
+            self._results[name] = {
+                "up": up,
+                "checked_at": now,
+                "latency_ms": round(seconds * 1000, 1) if seconds is not None else None,
+                "error": error,
+                "retry_at": now + retry_after if retry_after is not None else None,
+            }
+        if previous is None or previous["up"] != up:
+            if up:
+                print(f"[Health] {name} is up")
+            else:
+                print(f"[Health] {name} is down: {error}")
+                metrics.incr(f"health.{name}.down")
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {
+                name: {key: value for key, value in result.items() if value is not None}
+                for name, result in self._results.items()
+            }
+
+
+class CallBreaker:
+    """Health of a dependency judged from the outcome of real calls instead of a probe.
+
+    After `failures` consecutive errors the dependency is marked down in `monitor` for `cooldown`
+    seconds. Once that has passed `is_up()` lets calls through again; the first success marks
+    it up, another failure opens it for a further `cooldown`.
+    """
+
+    def __init__(self, name: str, monitor: HealthMonitor, failures: int = 5, cooldown: float = 30.0) -> None:
+        self.name = name
+        self.monitor = monitor
+        self.failures = failures
+        self.cooldown = cooldown
+        self._consecutive = 0
+        self._lock = Lock()
+
+    def success(self) -> None:
+        with self._lock:
+            self._consecutive = 0
+        status = self.monitor.status(self.name)
+        if status is None or not status["up"]:
+            self.monitor.mark_up(self.name)
+
+    def failure(self, error: BaseException | str) -> None:
+        with self._lock:
+            self._consecutive += 1
+            tripped = self._consecutive >= self.failures
+        if tripped:
+            self.monitor.mark_down(self.name, error, retry_after=self.cooldown)
+
+
+health = HealthMonitor()
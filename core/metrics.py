@@ -0,0 +1,71 @@
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Deque, Iterator
+
+
+class Metrics:
+    """In-process counters and latency samples, exposed as JSON on /metrics."""
+
+    def __init__(self, sample_size: int = 1024) -> None:
+        self._lock = Lock()
+        self._counters: dict[str, float] = defaultdict(float)
+        self._timings: dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=sample_size))
+        self._timing_counts: dict[str, int] = defaultdict(int)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._timings[name].append(seconds)
+            self._timing_counts[name] += 1
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {name: (sorted(samples), self._timing_counts[name]) for name, samples in self._timings.items()}
+        return {
+            "counters": counters,
+            "timings": {name: self._summarize(samples, count) for name, (samples, count) in timings.items()},
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+            self._timing_counts.clear()
+
+    @staticmethod
+    def _summarize(samples: list[float], count: int) -> dict[str, float]:
+        if not samples:
+            return {"count": count}
+
+        def pct(q: float) -> float:
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3)
+
+        return {
+            "count": count,
+            "avg_ms": round(sum(samples) / len(samples) * 1000, 3),
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "max_ms": round(samples[-1] * 1000, 3),
+        }
+
+
+metrics = Metrics()
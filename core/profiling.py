@@ -0,0 +1,175 @@
+import hmac
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from functools import lru_cache
+from threading import Event, Lock, Thread, get_ident
+from types import FrameType
+from typing import Any
+from uuid import uuid4
+
+from core.config import Settings, get_settings
+from core.metrics import metrics
+
+PROFILE_SUFFIX = ".collapsed"
+
+
+def _frame_label(frame: FrameType, root: str) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(root):
+        filename = os.path.relpath(filename, root)
+    else:
+        filename = "/".join(filename.split(os.sep)[-2:])
+    # ";" separates frames in the collapsed format.
+    return f"{code.co_qualname} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class StackSampler:
+    """Samples one thread's Python stack every `interval` seconds from a background thread.
+
+    The result is in the collapsed ("folded") stack format: one `frame;frame;... count` line per
+    distinct stack, root first, which flamegraph.pl and speedscope.app read as is.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._root = os.getcwd() + os.sep
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def start(self) -> None:
+        self._thread = Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame, self._root))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    """Profiles a sample of requests, or requests carrying the profiling token, into `directory`.
+
+    Each profile is a collapsed-stack file plus a small JSON sidecar (operation, duration, sample
+    count, labels); only the newest `keep` profiles are kept. With a sample rate of 0 and no
+    token configured, `maybe_profile()` is a null context and costs nothing.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.sample_rate = settings.profiling_sample_rate
+        self.token = settings.profiling_token
+        self.directory = settings.profiling_dir
+        self.interval = settings.profiling_interval_ms / 1000
+        self.keep = settings.profiling_keep
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or bool(self.token)
+
+    def authorized(self, token: str | None) -> bool:
+        return bool(self.token) and token is not None and hmac.compare_digest(token, self.token)
+
+    def maybe_profile(self, operation: str, token: str | None = None, **labels: Any):
+        """Profile the block when the token matches or the request is sampled."""
+        if not self.enabled:
+            return nullcontext()
+        if self.authorized(token) or (self.sample_rate > 0 and random.random() < self.sample_rate):
+            return self.profile(operation, **labels)
+        return nullcontext()
+
+    @contextmanager
+    def profile(self, operation: str, **labels: Any) -> Iterator[None]:
+        sampler = StackSampler(get_ident(), self.interval)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            duration = time.perf_counter() - started
+            try:
+                self._save(operation, duration, sampler, labels)
+            except OSError as e:
+                print(f"[Profiling] Could not save {operation} profile: {e}")
+
+    def _save(self, operation: str, duration: float, sampler: StackSampler, labels: dict[str, Any]) -> None:
+        created = datetime.now(timezone.utc)
+        name = f"{created:%Y%m%dT%H%M%S}-{operation}-{uuid4().hex[:8]}"
+        meta = {
+            "name": name,
+            "operation": operation,
+            "created_at": created.isoformat(),
+            "duration_ms": round(duration * 1000, 1),
+            "samples": sum(sampler.stacks.values()),
+            "interval_ms": self.interval * 1000,
+            "labels": labels,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name + PROFILE_SUFFIX), "w", encoding="utf-8") as fh:
+            fh.write(sampler.collapsed())
+        with open(os.path.join(self.directory, name + ".json"), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, ensure_ascii=False)
+        metrics.incr("profiling.profiles")
+        print(f"[Profiling] Saved {name} ({meta['duration_ms']} ms, {meta['samples']} samples)")
+        self._prune()
+
+    def _prune(self) -> None:
+        with self._lock:
+            names = self._names()
+            for name in names[self.keep :]:
+                for suffix in (PROFILE_SUFFIX, ".json"):
+                    try:
+                        os.remove(os.path.join(self.directory, name + suffix))
+                    except FileNotFoundError:
+                        pass
+
+    def _names(self) -> list[str]:
+        """Stored profile names, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        suffixed = [entry for entry in os.listdir(self.directory) if entry.endswith(PROFILE_SUFFIX)]
+        return sorted((entry.removesuffix(PROFILE_SUFFIX) for entry in suffixed), reverse=True)
+
+    def recent(self, limit: int = 50) -> list[dict[str, Any]]:
+        profiles = []
+        for name in self._names()[:limit]:
+            try:
+                with open(os.path.join(self.directory, name + ".json"), encoding="utf-8") as fh:
+                    profiles.append(json.load(fh))
+            except (OSError, ValueError):
+                profiles.append({"name": name})
+        return profiles
+
+    def path(self, name: str) -> str | None:
+        """Path of a stored profile; None for unknown names (never a path outside the directory)."""
+        if name not in self._names():
+            return None
+        return os.path.join(self.directory, name + PROFILE_SUFFIX)
+
+
+@lru_cache(maxsize=1)
+def get_profiler() -> RequestProfiler:
+    return RequestProfiler(get_settings())
@@ -0,0 +1,37 @@
+import gzip
+from collections.abc import Mapping
+
+from pydantic import BaseModel
+from starlette.responses import Response
+
+GZIP_LEVEL = 6
+
+
+class ModelResponse(Response):
+    """JSON response rendered straight from an already validated Pydantic model.
+
+    When an endpoint returns a model, FastAPI validates it against `response_model` once more
+    before encoding it. Returning this response skips that step and encodes with Pydantic's Rust
+    serializer. Bodies of at least `gzip_min_bytes` are gzip-compressed for clients that accept
+    it; 0 disables compression.
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        content: BaseModel,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+        *,
+        accept_encoding: str | None = None,
+        gzip_min_bytes: int = 0,
+    ) -> None:
+        body = content.__pydantic_serializer__.to_json(content)
+        headers = dict(headers or {})
+        if gzip_min_bytes:
+            headers["Vary"] = "Accept-Encoding"
+            if len(body) >= gzip_min_bytes and "gzip" in (accept_encoding or "").lower():
+                body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+                headers["Content-Encoding"] = "gzip"
+        super().__init__(body, status_code, headers)
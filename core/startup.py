@@ -0,0 +1,115 @@
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Generic, TypeVar
+
+from core.metrics import metrics
+
+T = TypeVar("T")
+
+
+class LazyResource(Generic[T]):
+    """A dependency that is built on first use or warmed up ahead of time in the background.
+
+    `get()` blocks until the value exists: it waits for a running warm-up or builds the value in
+    the calling thread if warm-up was never started. `check` runs after the build to verify the
+    dependency actually answers (ping, SELECT 1); a failed check is reported by `status()` but
+    the built value is still handed out, since every client here degrades on its own. If the
+    factory itself raises, `get()` re-raises that error until `retry_seconds` have passed and
+    then builds again, so a dependency that was unreachable at boot recovers without a restart.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], T],
+        check: Callable[[T], Any] | None = None,
+        retry_seconds: float = 5.0,
+    ) -> None:
+        self.name = name
+        self.factory = factory
+        self.check = check
+        self.retry_seconds = retry_seconds
+        self._lock = Lock()
+        self._future: Future | None = None
+        self._state = "pending"
+        self._seconds: float | None = None
+        self.finished_at: float | None = None
+        self._error: str | None = None
+
+    def start(self, executor: ThreadPoolExecutor) -> None:
+        with self._lock:
+            if self._future is None:
+                self._future = executor.submit(self._build)
+
+    def get(self) -> T:
+        with self._lock:
+            if self._future is None or self._retry_due(self._future):
+                self._future = Future()
+                self._future.set_running_or_notify_cancel()
+                self._state = "pending"
+                owner = True
+            else:
+                owner = False
+            future = self._future
+        if owner:
+            try:
+                future.set_result(self._build())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def _retry_due(self, future: Future) -> bool:
+        if not future.done() or future.exception() is None:
+            return False
+        return self.finished_at is None or time.perf_counter() - self.finished_at >= self.retry_seconds
+
+    def set(self, value: T) -> None:
+        """Replace the value, e.g. with a stand-in client in tests and benchmarks."""
+        future: Future = Future()
+        future.set_result(value)
+        with self._lock:
+            self._future = future
+            self._state, self._error = "ready", None
+
+    def _build(self) -> T:
+        started = time.perf_counter()
+        try:
+            value = self.factory()
+            if self.check is not None:
+                try:
+                    self.check(value)
+                except Exception as e:
+                    self._error = str(e)
+                    self._state = "failed"
+                    print(f"[Startup] {self.name} is up but not answering: {e}")
+                else:
+                    self._state, self._error = "ready", None
+            else:
+                self._state, self._error = "ready", None
+            return value
+        except Exception as e:
+            self._state, self._error = "failed", str(e)
+            print(f"[Startup] Failed to initialize {self.name}: {e}")
+            raise
+        finally:
+            self.finished_at = time.perf_counter()
+            self._seconds = self.finished_at - started
+            metrics.observe(f"startup.{self.name}", self._seconds)
+
+    @property
+    def done(self) -> bool:
+        return self._state != "pending"
+
+    @property
+    def ready(self) -> bool:
+        return self._state == "ready"
+
+    def status(self) -> dict[str, Any]:
+        status: dict[str, Any] = {"state": self._state}
+        if self._seconds is not None:
+            status["seconds"] = round(self._seconds, 3)
+        if self._error:
+            status["error"] = self._error
+        return status
@@ -1,18 +1,31 @@
 from contextlib import contextmanager
+from functools import lru_cache
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session, sessionmaker
 
 from core.config import get_settings
 
-settings = get_settings()
-engine = create_engine(settings.database_url, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
+@lru_cache(maxsize=1)
+def get_engine() -> Engine:
+    """Create the engine on first use so importing this module does not load the DB driver."""
+    engine = create_engine(get_settings().database_url, pool_pre_ping=True)
+    SessionLocal.configure(bind=engine)
+    return engine
+
+
+def new_session() -> Session:
+    get_engine()
+    return SessionLocal()
 
 
 @contextmanager
 def get_db() -> Session:
-    db = SessionLocal()
+    db = new_session()
     try:
         yield db
     finally:
@@ -0,0 +1,106 @@
+"""Baseline schema as it existed before migrations
+
+Databases created before Alembic was introduced already have these tables; mark them with
+`alembic stamp 0001_baseline` instead of running this revision.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _timestamps() -> list[sa.Column]:
+    return [sa.Column("created_at", sa.DateTime()), sa.Column("updated_at", sa.DateTime())]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "categories",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(255), nullable=False),
+        sa.Column("description", sa.Text()),
+        sa.Column("parent_id", sa.Integer(), sa.ForeignKey("categories.id"), nullable=True),
+        sa.Column("is_active", sa.Boolean()),
+        *_timestamps(),
+    )
+    op.create_index("ix_categories_id", "categories", ["id"])
+
+    op.create_table(
+        "products",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("product_code", sa.String(50), nullable=False, unique=True),
+        sa.Column("product_id", sa.String(50)),
+        sa.Column("title", sa.String(255)),
+        sa.Column("product_name", sa.String(255)),
+        sa.Column("current_price", sa.Numeric(10, 2)),
+        sa.Column("current_price_text", sa.String(100)),
+        sa.Column("unit", sa.String(50)),
+        sa.Column("original_price", sa.Numeric(10, 2)),
+        sa.Column("original_price_text", sa.String(100)),
+        sa.Column("discount_percent", sa.Integer()),
+        sa.Column("discount_text", sa.String(20)),
+        sa.Column("product_url", sa.String(500)),
+        sa.Column("image_url", sa.String(500)),
+        sa.Column("image_alt", sa.String(255)),
+        sa.Column("product_position", sa.Integer()),
+        sa.Column("description", sa.Text()),
+        sa.Column("stock_quantity", sa.Integer()),
+        sa.Column("is_active", sa.Boolean()),
+        *_timestamps(),
+    )
+    op.create_index("ix_products_id", "products", ["id"])
+
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("email", sa.String(255), nullable=False, unique=True),
+        sa.Column("username", sa.String(100), nullable=False, unique=True),
+        sa.Column("hashed_password", sa.String(255), nullable=False),
+        sa.Column("full_name", sa.String(255)),
+        sa.Column("phone", sa.String(20)),
+        sa.Column("role", sa.String(10)),
+        sa.Column("is_active", sa.Boolean()),
+        *_timestamps(),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+
+    op.create_table(
+        "orders",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("order_number", sa.String(50), nullable=False, unique=True),
+        sa.Column("total_amount", sa.Numeric(15, 2), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum("pending", "confirmed", "shipping", "delivered", "cancelled", name="order_status"),
+        ),
+        *_timestamps(),
+    )
+    op.create_index("ix_orders_id", "orders", ["id"])
+
+    op.create_table(
+        "payments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("order_id", sa.Integer(), sa.ForeignKey("orders.id"), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("payment_method", sa.Enum("momo", "vnpay", "cod", name="payment_method"), nullable=False),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("status", sa.Enum("pending", "paid", "failed", "refunded", name="payment_status")),
+        sa.Column("transaction_id", sa.String(255), nullable=True, unique=True),
+        sa.Column("request_id", sa.String(255), nullable=False, unique=True),
+        *_timestamps(),
+    )
+    op.create_index("ix_payments_id", "payments", ["id"])
+
+
+def downgrade() -> None:
+    for table in ("payments", "orders", "users", "products", "categories"):
+        op.drop_table(table)
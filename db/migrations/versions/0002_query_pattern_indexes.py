@@ -0,0 +1,38 @@
+"""Composite indexes for the chatbot's query patterns
+
+- orders (user_id, created_at): get_user_orders, a user's latest orders
+- products (is_active, created_at): SQL product search and suggestions, newest active first
+- products (is_active, current_price): min_price / max_price filters
+- products (updated_at, id): incremental Qdrant sync keyset pagination
+
+orders.order_number (payment lookup) is already covered by its unique constraint.
+Check the plans with `python -m benchmarks.query_plans`.
+
+Revision ID: 0002_query_pattern_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+revision = "0002_query_pattern_indexes"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_orders_user_id_created_at", "orders", ["user_id", "created_at"]),
+    ("ix_products_is_active_created_at", "products", ["is_active", "created_at"]),
+    ("ix_products_is_active_current_price", "products", ["is_active", "current_price"]),
+    ("ix_products_updated_at_id", "products", ["updated_at", "id"]),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
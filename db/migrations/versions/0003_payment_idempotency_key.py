@@ -0,0 +1,33 @@
+"""Idempotency key on payments
+
+Client retries of a payment initiation carry the same key; the unique constraint turns a
+duplicate insert into a replay of the first payment. A replay is only accepted for the same
+amount, so payments.amount becomes an exact NUMERIC(15, 2) like orders.total_amount: MySQL's
+single-precision FLOAT reads VND amounts above 2^24 back rounded.
+
+Revision ID: 0003_payment_idempotency_key
+Revises: 0002_query_pattern_indexes
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_payment_idempotency_key"
+down_revision = "0002_query_pattern_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("payments") as batch_op:
+        batch_op.add_column(sa.Column("idempotency_key", sa.String(255), nullable=True))
+        batch_op.create_unique_constraint("uq_payments_idempotency_key", ["idempotency_key"])
+        batch_op.alter_column("amount", existing_type=sa.Float(), type_=sa.Numeric(15, 2), existing_nullable=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("payments") as batch_op:
+        batch_op.alter_column("amount", existing_type=sa.Numeric(15, 2), type_=sa.Float(), existing_nullable=False)
+        batch_op.drop_constraint("uq_payments_idempotency_key", type_="unique")
+        batch_op.drop_column("idempotency_key")
@@ -0,0 +1,145 @@
+"""Unit price on products
+
+products.unit_price is the price per kg / liter / item parsed from the pack size
+("16.000đ/Gói 50g" -> 320000 per kg), products.unit_price_unit its base unit (kg, l, item).
+Existing rows are filled here; the ORM keeps them current afterwards. Products written by other
+services can be filled later with `python -m chatbot.unit_price`.
+
+Revision ID: 0004_product_unit_price
+Revises: 0003_payment_idempotency_key
+Create Date: 2026-10-19
+"""
+
+import re
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004_product_unit_price"
+down_revision = "0003_payment_idempotency_key"
+branch_labels = None
+depends_on = None
+
+
+# Frozen copy of the pack size parser in chatbot.unit_price as of this revision, so the backfill
+# does not change when the application's parser does.
+MEASURES = {
+    "mg": ("kg", 0.000001),
+    "g": ("kg", 0.001),
+    "gr": ("kg", 0.001),
+    "gam": ("kg", 0.001),
+    "gram": ("kg", 0.001),
+    "kg": ("kg", 1.0),
+    "ký": ("kg", 1.0),
+    "kí": ("kg", 1.0),
+    "ml": ("l", 0.001),
+    "l": ("l", 1.0),
+    "lít": ("l", 1.0),
+    "lit": ("l", 1.0),
+}
+COUNT_UNITS = "quả|trái|cái|chiếc|cây|miếng|viên|gói|hộp|lon|chai|túi|bịch|hũ|ly|cuộn|tép|con|bó|vỉ|lốc|thùng"
+_NUMBER = r"(?<![\w.,])(\d+(?:[.,]\d+)*)"
+_MEASURE = rf"{_NUMBER}\s*({'|'.join(sorted(MEASURES, key=len, reverse=True))})(?!\w)"
+MULTIPACK_RE = re.compile(rf"(?<![\w.,])(\d+)\s*(?:[x×*]|(?:{COUNT_UNITS})(?:\s*[x×*])?)\s*{_MEASURE}")
+MEASURE_RE = re.compile(_MEASURE)
+COUNT_RE = re.compile(rf"(?<![\w.,])(\d+)\s*({COUNT_UNITS})(?!\w)")
+BARE_MEASURE_RE = re.compile(r"^(kg|ký|kí|lít|lit|l)$")
+THOUSANDS_RE = re.compile(r"^\d{1,3}(?:[.,]\d{3})+$")
+
+products = sa.table(
+    "products",
+    sa.column("id", sa.Integer),
+    sa.column("current_price", sa.Numeric),
+    sa.column("current_price_text", sa.String),
+    sa.column("unit", sa.String),
+    sa.column("product_name", sa.String),
+    sa.column("unit_price", sa.Numeric),
+    sa.column("unit_price_unit", sa.String),
+)
+
+
+def _number(raw: str) -> float:
+    if THOUSANDS_RE.match(raw):
+        return float(re.sub(r"[.,]", "", raw))
+    return float(raw.replace(",", "."))
+
+
+def _pack_size(text: str | None) -> tuple[float, str] | None:
+    if not text:
+        return None
+    text = unicodedata.normalize("NFC", text).lower().strip()
+    if match := MULTIPACK_RE.search(text):
+        count, amount, measure = match.groups()
+        unit, factor = MEASURES[measure]
+        quantity = int(count) * _number(amount) * factor
+    elif match := MEASURE_RE.search(text):
+        amount, measure = match.groups()
+        unit, factor = MEASURES[measure]
+        quantity = _number(amount) * factor
+    elif match := COUNT_RE.search(text):
+        unit, quantity = "item", float(match.group(1))
+    elif match := BARE_MEASURE_RE.match(text):
+        unit, quantity = MEASURES[match.group(1)][0], 1.0
+    else:
+        return None
+    return (quantity, unit) if quantity > 0 else None
+
+
+def _unit_price(row) -> tuple[float, str] | None:
+    price_text = row.current_price_text
+    pack_text = price_text.split("/", 1)[1] if price_text and "/" in price_text else None
+    for text in (pack_text, row.unit, row.product_name):
+        pack = _pack_size(text)
+        if pack is not None:
+            return (round(float(row.current_price) / pack[0], 2), pack[1]) if row.current_price else None
+    return None
+
+
+def _backfill(connection: sa.engine.Connection, batch_size: int = 1000) -> None:
+    statement = (
+        sa.update(products)
+        .where(products.c.id == sa.bindparam("_id"))
+        .values(unit_price=sa.bindparam("_unit_price"), unit_price_unit=sa.bindparam("_unit"))
+    )
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(
+                products.c.id,
+                products.c.current_price,
+                products.c.current_price_text,
+                products.c.unit,
+                products.c.product_name,
+            )
+            .where(products.c.id > last_id)
+            .order_by(products.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        params = []
+        for row in rows:
+            parsed = _unit_price(row)
+            if parsed:
+                params.append({"_id": row.id, "_unit_price": parsed[0], "_unit": parsed[1]})
+        if params:
+            connection.execute(statement, params)
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.add_column(sa.Column("unit_price", sa.Numeric(12, 2), nullable=True))
+        batch_op.add_column(sa.Column("unit_price_unit", sa.String(10), nullable=True))
+    op.create_index(
+        "ix_products_is_active_unit_price", "products", ["is_active", "unit_price_unit", "unit_price"]
+    )
+    _backfill(op.get_bind())
+
+
+def downgrade() -> None:
+    op.drop_index("ix_products_is_active_unit_price", table_name="products")
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.drop_column("unit_price_unit")
+        batch_op.drop_column("unit_price")
@@ -0,0 +1,74 @@
+"""Product categories and the category closure table
+
+- products.category_id links a product to its (leaf) category
+- category_closure holds every (ancestor, descendant) pair of the category tree, so the products
+  of a subtree are one indexed lookup: category_closure(ancestor_id) -> products(category_id)
+
+The closure is built here from categories.parent_id and rebuilt by the ORM whenever a category
+changes; `python -m chatbot.categories` rebuilds it after categories are edited elsewhere.
+
+Revision ID: 0005_product_category_closure
+Revises: 0004_product_unit_price
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_product_category_closure"
+down_revision = "0004_product_unit_price"
+branch_labels = None
+depends_on = None
+
+categories = sa.table("categories", sa.column("id", sa.Integer), sa.column("parent_id", sa.Integer))
+category_closure = sa.table(
+    "category_closure",
+    sa.column("ancestor_id", sa.Integer),
+    sa.column("descendant_id", sa.Integer),
+    sa.column("depth", sa.Integer),
+)
+
+
+def _build_closure(connection: sa.engine.Connection) -> None:
+    """Every (ancestor, descendant, depth) pair of the tree as of this revision; cycles are cut."""
+    parents = dict(connection.execute(sa.select(categories.c.id, categories.c.parent_id)).all())
+    rows = []
+    for category_id in parents:
+        node, depth, seen = category_id, 0, set()
+        while node is not None and node in parents and node not in seen:
+            seen.add(node)
+            rows.append({"ancestor_id": node, "descendant_id": category_id, "depth": depth})
+            node = parents[node]
+            depth += 1
+    if rows:
+        connection.execute(sa.insert(category_closure), rows)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "category_closure",
+        sa.Column(
+            "ancestor_id", sa.Integer(), sa.ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True
+        ),
+        sa.Column(
+            "descendant_id", sa.Integer(), sa.ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True
+        ),
+        sa.Column("depth", sa.Integer(), nullable=False),
+    )
+    op.create_index("ix_category_closure_descendant_id", "category_closure", ["descendant_id"])
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.add_column(sa.Column("category_id", sa.Integer(), nullable=True))
+        batch_op.create_foreign_key("fk_products_category_id", "categories", ["category_id"], ["id"])
+    op.create_index(
+        "ix_products_category_id_is_active_created_at", "products", ["category_id", "is_active", "created_at"]
+    )
+    _build_closure(op.get_bind())
+
+
+def downgrade() -> None:
+    op.drop_index("ix_products_category_id_is_active_created_at", table_name="products")
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.drop_constraint("fk_products_category_id", type_="foreignkey")
+        batch_op.drop_column("category_id")
+    op.drop_index("ix_category_closure_descendant_id", table_name="category_closure")
+    op.drop_table("category_closure")
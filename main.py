@@ -1,14 +1,52 @@
-from fastapi import Depends, FastAPI, HTTPException
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 
 from chatbot.service import ChatbotService
+from chatbot.session_lock import SessionBusy, TurnSuperseded
 from core.config import get_settings
-from schemas.schemas import MessageRequest, MessageResponse, SessionCreateRequest, SessionCreateResponse
+from core.metrics import metrics
+from core.profiling import get_profiler
+from core.responses import ModelResponse
+from services.services import IdempotencyKeyReused, OrderNotFound, initiate_payment, initiate_payments
+from schemas.payment_schemas import (
+    PaymentBatchRequest,
+    PaymentBatchResponse,
+    PaymentInitRequest,
+    PaymentInitResponse,
+)
+from schemas.schemas import (
+    MessageBatchItem,
+    MessageBatchRequest,
+    MessageRequest,
+    MessageResponse,
+    SessionCreateRequest,
+    SessionCreateResponse,
+)
 
-app = FastAPI(title="Bach Hoa Xanh Chatbot Service", version="0.1.0")
 settings = get_settings()
+# Cheap to construct: Gemini, Qdrant, Redis and the database are connected by start() below.
 chatbot_service = ChatbotService()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    chatbot_service.start()
+    startup_seconds = time.perf_counter() - IMPORT_STARTED
+    metrics.observe("startup.accepting_traffic", startup_seconds)
+    print(f"[Startup] Accepting traffic {startup_seconds:.2f}s after import, dependencies warming up")
+    yield
+    chatbot_service.shutdown()
+
+
+app = FastAPI(title="Bach Hoa Xanh Chatbot Service", version="0.1.0", lifespan=lifespan)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
@@ -27,6 +65,43 @@ def health_check():
     return {"status": "healthy", "service": "chatbot", "port": settings.chatbot_port}
 
 
+@app.get("/health/ready")
+def readiness_check(service: ChatbotService = Depends(get_service)):
+    readiness = service.readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+
+@app.get("/metrics")
+def get_metrics(service: ChatbotService = Depends(get_service)):
+    snapshot = metrics.snapshot()
+    if service.components["rag"].done:
+        snapshot["embedding_cache"] = service.rag.embedder.cache_stats()
+    if service.components["redis"].done and service.redis_memory.writer is not None:
+        snapshot["redis_writer_depth"] = service.redis_memory.writer.depth()
+    return snapshot
+
+
+def require_profiling_token(x_profile_token: str | None = Header(None)) -> None:
+    profiler = get_profiler()
+    if not profiler.token:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not profiler.authorized(x_profile_token):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+
+@app.get("/admin/profiles", dependencies=[Depends(require_profiling_token)])
+def list_profiles(limit: int = 50):
+    return {"profiles": get_profiler().recent(limit)}
+
+
+@app.get("/admin/profiles/{name}", dependencies=[Depends(require_profiling_token)])
+def download_profile(name: str):
+    path = get_profiler().path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{name}.collapsed")
+
+
 @app.post("/api/v1/chatbot/session", response_model=SessionCreateResponse)
 def create_session(payload: SessionCreateRequest, service: ChatbotService = Depends(get_service)):
     session_id = service.create_session(user_id=payload.user_id)
@@ -34,12 +109,75 @@ def create_session(payload: SessionCreateRequest, service: ChatbotService = Depe
 
 
 @app.post("/api/v1/chatbot/message", response_model=MessageResponse)
-def send_message(payload: MessageRequest, service: ChatbotService = Depends(get_service)):
-    response = service.send_message(
-        session_id=payload.session_id,
-        message=payload.message,
-        user_id=payload.user_id,
-    )
+def send_message(
+    payload: MessageRequest,
+    service: ChatbotService = Depends(get_service),
+    accept_encoding: str | None = Header(None),
+    x_profile_token: str | None = Header(None),
+):
+    try:
+        with get_profiler().maybe_profile("send_message", x_profile_token, session_id=payload.session_id):
+            response = service.send_message(
+                session_id=payload.session_id,
+                message=payload.message,
+                user_id=payload.user_id,
+            )
+    except TurnSuperseded:
+        raise HTTPException(status_code=409, detail="Superseded by a newer message in this session")
+    except SessionBusy:
+        raise HTTPException(status_code=429, detail="Session is busy, please retry")
     if not response:
         raise HTTPException(status_code=500, detail="Chatbot is unavailable")
-    return MessageResponse(**response)
+    return ModelResponse(
+        response, accept_encoding=accept_encoding, gzip_min_bytes=settings.response_gzip_min_bytes
+    )
+
+
+@app.post("/api/v1/chatbot/messages:batch")
+def send_messages(payload: MessageBatchRequest, service: ChatbotService = Depends(get_service)):
+    if len(payload.messages) > settings.batch_max_items:
+        raise HTTPException(status_code=413, detail=f"At most {settings.batch_max_items} messages per batch")
+    concurrency = min(payload.max_concurrency or settings.batch_max_concurrency, settings.batch_max_concurrency)
+
+    def stream():
+        results = service.send_messages(
+            [item.model_dump() for item in payload.messages],
+            max_concurrency=concurrency,
+        )
+        for index, result in results:
+            if isinstance(result, TurnSuperseded):
+                item = MessageBatchItem(index=index, error="Superseded by a newer message in this session")
+            elif isinstance(result, Exception):
+                item = MessageBatchItem(index=index, error="Chatbot is unavailable")
+            else:
+                item = MessageBatchItem(index=index, response=result)
+            yield item.model_dump_json(exclude_none=True) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.post("/api/v1/payments", response_model=PaymentInitResponse)
+def create_payment(
+    payload: PaymentInitRequest,
+    response: Response,
+    idempotency_key: str | None = Header(None, max_length=255),
+):
+    try:
+        payment = initiate_payment(payload.order_number, payload.payment_method, payload.amount, idempotency_key)
+    except OrderNotFound:
+        raise HTTPException(status_code=404, detail="Order not found")
+    except IdempotencyKeyReused:
+        raise HTTPException(status_code=409, detail="Idempotency-Key was already used for a different payment")
+    if payment["replayed"]:
+        response.headers["Idempotent-Replayed"] = "true"
+    return PaymentInitResponse(**payment)
+
+
+@app.post("/api/v1/payments:batch", response_model=PaymentBatchResponse)
+def create_payments(payload: PaymentBatchRequest):
+    if len(payload.payments) > settings.payment_batch_max_items:
+        raise HTTPException(
+            status_code=413, detail=f"At most {settings.payment_batch_max_items} payments per batch"
+        )
+    results = initiate_payments([item.model_dump() for item in payload.payments])
+    return PaymentBatchResponse(results=[{"index": index, **result} for index, result in enumerate(results)])
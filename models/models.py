@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Boolean, Column, DateTime, Enum, Float, ForeignKey, Integer, Numeric, String, Text
+from sqlalchemy import Boolean, Column, DateTime, Enum, ForeignKey, Index, Integer, Numeric, String, Text
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -19,6 +19,25 @@ class Category(Base):
     parent = relationship("Category", remote_side=[id], backref="children")
 
 
+class CategoryClosure(Base):
+    """Every (ancestor, descendant) pair of the category tree, including each category with itself.
+
+    Rebuilt from categories.parent_id by chatbot.categories; a category subtree is one indexed
+    lookup on ancestor_id.
+    """
+
+    __tablename__ = "category_closure"
+
+    ancestor_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True)
+    depth = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Ancestors of a category (Qdrant payload, tree rebuilds).
+        Index("ix_category_closure_descendant_id", "descendant_id"),
+    )
+
+
 class Product(Base):
     __tablename__ = "products"
 
@@ -40,10 +59,29 @@ class Product(Base):
     product_position = Column(Integer)
     description = Column(Text)
     stock_quantity = Column(Integer, default=0)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    # Price per kg / liter / item parsed from the pack size (chatbot.unit_price), for best-value queries.
+    unit_price = Column(Numeric(12, 2), nullable=True)
+    unit_price_unit = Column(String(10), nullable=True)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    category = relationship("Category", backref="products")
+
+    __table_args__ = (
+        # Chatbot SQL search and suggestions: active products, newest first.
+        Index("ix_products_is_active_created_at", "is_active", "created_at"),
+        # Price-range filters on active products.
+        Index("ix_products_is_active_current_price", "is_active", "current_price"),
+        # Category-scoped search: products of a category subtree.
+        Index("ix_products_category_id_is_active_created_at", "category_id", "is_active", "created_at"),
+        # Cheapest per kg / liter / item first.
+        Index("ix_products_is_active_unit_price", "is_active", "unit_price_unit", "unit_price"),
+        # Incremental Qdrant sync walks (updated_at, id).
+        Index("ix_products_updated_at_id", "updated_at", "id"),
+    )
+
 
 class User(Base):
     __tablename__ = "users"
@@ -76,6 +114,11 @@ class Order(Base):
 
     user = relationship("User", backref="orders")
 
+    __table_args__ = (
+        # get_user_orders: a user's latest orders.
+        Index("ix_orders_user_id_created_at", "user_id", "created_at"),
+    )
+
 
 class Payment(Base):
     __tablename__ = "payments"
@@ -84,10 +127,11 @@ class Payment(Base):
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     payment_method = Column(Enum("momo", "vnpay", "cod", name="payment_method"), nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column(Numeric(15, 2), nullable=False)
     status = Column(Enum("pending", "paid", "failed", "refunded", name="payment_status"), default="pending")
     transaction_id = Column(String(255), nullable=True, unique=True)
     request_id = Column(String(255), nullable=False, unique=True)
+    idempotency_key = Column(String(255), nullable=True, unique=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -11,3 +11,22 @@ class PaymentInitResponse(BaseModel):
     request_id: str
     status: str
     redirect_url: str | None = None
+    replayed: bool = Field(False, description="True when an earlier request with the same idempotency key is returned")
+
+
+class PaymentBatchItemRequest(PaymentInitRequest):
+    idempotency_key: str | None = Field(None, max_length=255)
+
+
+class PaymentBatchRequest(BaseModel):
+    payments: list[PaymentBatchItemRequest] = Field(..., min_length=1)
+
+
+class PaymentBatchItemResponse(BaseModel):
+    index: int
+    payment: PaymentInitResponse | None = None
+    error: str | None = None
+
+
+class PaymentBatchResponse(BaseModel):
+    results: list[PaymentBatchItemResponse]
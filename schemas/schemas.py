@@ -36,7 +36,12 @@ class ProductInfo(BaseModel):
     product_url: str | None = Field(None, description="Product detail page URL")
     image_url: str | None = Field(None, description="Product image URL")
     discount_percent: int | None = Field(None, description="Discount percentage (0-100)")
-    score: float | None = Field(None, description="Semantic similarity score (0-1) when using Qdrant RAG")
+    unit_price: float | None = Field(None, description="Price per kg, liter or item in VND, parsed from the pack size")
+    unit_price_unit: str | None = Field(None, description="Unit of unit_price: kg, l or item")
+    score: float | None = Field(None, description="Re-ranking score (0-1) combining relevance, stock, price fit and discount")
+    score_details: dict[str, float] | None = Field(
+        None, description="Weighted components of score: relevance, stock, price, discount"
+    )
 
 
 class OrderInfo(BaseModel):
@@ -89,3 +94,22 @@ class MessageResponse(BaseModel):
         "Contains products/orders/profile based on detected intent. "
         "Empty lists/None values indicate no results found."
     )
+
+
+class MessageBatchRequest(BaseModel):
+    """Request to process many chat turns in one call."""
+    messages: list[MessageRequest] = Field(
+        ...,
+        min_length=1,
+        description="Chat turns to process. Turns of the same session are processed in the given order.",
+    )
+    max_concurrency: int | None = Field(
+        None, ge=1, description="Optional cap on sessions processed concurrently (server limit still applies)"
+    )
+
+
+class MessageBatchItem(BaseModel):
+    """One streamed result of a batch request (one JSON object per line)."""
+    index: int = Field(..., description="Position of the turn in the request's messages list")
+    response: MessageResponse | None = Field(None, description="Chatbot response when the turn succeeded")
+    error: str | None = Field(None, description="Error message when the turn failed")
@@ -1,30 +1,184 @@
 import uuid
+from decimal import Decimal
+from typing import Any
+
+from sqlalchemy import Numeric, String, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 
 from db.database import get_db
 from models.models import Order, Payment
 
 
-def initiate_payment(order_number: str, method: str, amount: float) -> dict:
+class OrderNotFound(ValueError):
+    pass
+
+
+class IdempotencyKeyReused(Exception):
+    """The idempotency key belongs to a payment for a different order, method or amount."""
+
+
+def _redirect_url(request_id: str) -> str:
+    return f"https://payments.example.com/{request_id}"
+
+
+def _response(request_id: str, status: str, replayed: bool = False) -> dict:
+    return {
+        "request_id": request_id,
+        "status": status,
+        "redirect_url": _redirect_url(request_id),
+        "replayed": replayed,
+    }
+
+
+def _replay(db: Session, idempotency_keys: list[str]) -> dict[str, tuple[Payment, str]]:
+    """Existing payments for the given keys, with their order numbers."""
+    rows = db.execute(
+        select(Payment, Order.order_number)
+        .join(Order, Order.id == Payment.order_id)
+        .where(Payment.idempotency_key.in_(idempotency_keys))
+    ).all()
+    return {payment.idempotency_key: (payment, order_number) for payment, order_number in rows}
+
+
+def _amount(value: float | Decimal) -> Decimal:
+    """An amount as stored in payments.amount (NUMERIC(15, 2)), so a replay compares exactly."""
+    return Decimal(str(value)).quantize(Decimal("0.01"))
+
+
+def _check_same_request(payment: Payment, order_number: str, stored_order: str, method: str, amount: float) -> None:
+    if stored_order != order_number or payment.payment_method != method or _amount(payment.amount) != _amount(amount):
+        raise IdempotencyKeyReused(f"Idempotency key {payment.idempotency_key} was used for a different payment")
+
+
+def initiate_payment(order_number: str, method: str, amount: float, idempotency_key: str | None = None) -> dict:
+    """Create a pending payment for an order.
+
+    The order lookup and the insert are one INSERT ... SELECT statement, so the happy path is a
+    single statement plus the commit. A retry with the same idempotency key returns the payment
+    created by the first attempt instead of a duplicate.
+    """
+    request_id = str(uuid.uuid4())
     with get_db() as db:
-        order = db.query(Order).filter(Order.order_number == order_number).first()
-        if not order:
-            raise ValueError("Order not found")
-
-        request_id = str(uuid.uuid4())
-        payment = Payment(
-            order_id=order.id,
-            user_id=order.user_id,
-            payment_method=method,
-            amount=amount,
-            status="pending",
-            request_id=request_id,
+        statement = insert(Payment).from_select(
+            ["order_id", "user_id", "payment_method", "amount", "status", "request_id", "idempotency_key"],
+            select(
+                Order.id,
+                Order.user_id,
+                literal(method, String),
+                literal(_amount(amount), Numeric(15, 2)),
+                literal("pending", String),
+                literal(request_id, String),
+                literal(idempotency_key, String),
+            ).where(Order.order_number == order_number),
         )
-        db.add(payment)
-        db.commit()
-        db.refresh(payment)
+        try:
+            result = db.execute(statement)
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            if idempotency_key is None:
+                raise
+            existing = _replay(db, [idempotency_key]).get(idempotency_key)
+            if existing is None:
+                raise
+            payment, stored_order = existing
+            _check_same_request(payment, order_number, stored_order, method, amount)
+            return _response(payment.request_id, payment.status, replayed=True)
+
+        if result.rowcount == 0:
+            raise OrderNotFound("Order not found")
+        return _response(request_id, "pending")
+
+
+def initiate_payments(items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Bulk initiate_payment for a checkout batch, in a fixed number of round-trips.
+
+    One SELECT resolves every order, one SELECT finds replays by idempotency key and one
+    multi-row INSERT creates the rest. Returns one {"payment": ...} or {"error": ...} per item,
+    in input order. If a concurrent request inserts one of the keys first, the batch falls back
+    to per-item initiation.
+    """
+    results: list[dict[str, Any] | None] = [None] * len(items)
+    with get_db() as db:
+        order_numbers = {item["order_number"] for item in items}
+        orders = {
+            order_number: (order_id, user_id)
+            for order_id, user_id, order_number in db.execute(
+                select(Order.id, Order.user_id, Order.order_number).where(Order.order_number.in_(order_numbers))
+            )
+        }
+        keys = [item["idempotency_key"] for item in items if item.get("idempotency_key")]
+        existing = _replay(db, keys) if keys else {}
+
+        rows: list[dict[str, Any]] = []
+        first_by_key: dict[str, int] = {}
+        for index, item in enumerate(items):
+            key = item.get("idempotency_key")
+            try:
+                if key in existing:
+                    payment, stored_order = existing[key]
+                    _check_same_request(
+                        payment, item["order_number"], stored_order, item["payment_method"], item["amount"]
+                    )
+                    results[index] = {"payment": _response(payment.request_id, payment.status, replayed=True)}
+                    continue
+                if key in first_by_key:
+                    first = items[first_by_key[key]]
+                    if (first["order_number"], first["payment_method"], _amount(first["amount"])) != (
+                        item["order_number"],
+                        item["payment_method"],
+                        _amount(item["amount"]),
+                    ):
+                        raise IdempotencyKeyReused(f"Idempotency key {key} was used for a different payment")
+                    continue
+                if item["order_number"] not in orders:
+                    raise OrderNotFound("Order not found")
+            except (OrderNotFound, IdempotencyKeyReused) as e:
+                results[index] = {"error": str(e)}
+                continue
+
+            order_id, user_id = orders[item["order_number"]]
+            request_id = str(uuid.uuid4())
+            rows.append(
+                {
+                    "order_id": order_id,
+                    "user_id": user_id,
+                    "payment_method": item["payment_method"],
+                    "amount": _amount(item["amount"]),
+                    "status": "pending",
+                    "request_id": request_id,
+                    "idempotency_key": key,
+                }
+            )
+            results[index] = {"payment": _response(request_id, "pending")}
+            if key:
+                first_by_key[key] = index
+
+        if rows:
+            try:
+                # Core executemany on the table: a single multi-row INSERT.
+                db.execute(insert(Payment.__table__), rows)
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                print("[Payments] Idempotency key race in batch, initiating items one by one")
+                return [_initiate_one(item) for item in items]
+
+    for index, item in enumerate(items):
+        if results[index] is None:
+            # Repeated key within the batch: same payment as its first occurrence.
+            first = results[first_by_key[item["idempotency_key"]]]["payment"]
+            results[index] = {"payment": {**first, "replayed": True}}
+    return results
+
 
+def _initiate_one(item: dict[str, Any]) -> dict[str, Any]:
+    try:
         return {
-            "request_id": request_id,
-            "status": payment.status,
-            "redirect_url": f"https://payments.example.com/{request_id}",
+            "payment": initiate_payment(
+                item["order_number"], item["payment_method"], item["amount"], item.get("idempotency_key")
+            )
         }
+    except (OrderNotFound, IdempotencyKeyReused) as e:
+        return {"error": str(e)}
@@ -0,0 +1,179 @@
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+from qdrant_client import QdrantClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from chatbot.indexer import IndexCheckpoint, ProductIndexer
+from core.config import Settings
+from models.models import Base, Product
+
+CATALOG_SIZE = 45
+
+
+class FakeEmbedder:
+    """Deterministic bag-of-words vectors in place of the fastembed model."""
+
+    dimension = 16
+
+    def embed_documents(self, texts):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimension
+            for word in text.lower().split():
+                vector[hashlib.md5(word.encode()).digest()[0] % self.dimension] += 1.0
+            vector[0] += 1.0
+            vectors.append(vector)
+        return vectors
+
+
+@pytest.fixture
+def settings(tmp_path) -> Settings:
+    return Settings(
+        database_url="sqlite://",
+        index_batch_size=10,
+        index_checkpoint_path=str(tmp_path / "checkpoint.json"),
+    )
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    started = datetime(2024, 1, 1)
+    for index in range(1, CATALOG_SIZE + 1):
+        session.add(
+            Product(
+                id=index,
+                product_code=f"893{index:010d}",
+                product_name=f"Sản phẩm {index}",
+                current_price=index * 1000,
+                unit="500g",
+                is_active=index % 7 != 0,
+                updated_at=started + timedelta(minutes=index),
+            )
+        )
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def client() -> QdrantClient:
+    return QdrantClient(":memory:")
+
+
+def make_indexer(settings: Settings, client: QdrantClient) -> ProductIndexer:
+    return ProductIndexer(
+        settings,
+        client=client,
+        embedder=FakeEmbedder(),
+        checkpoint=IndexCheckpoint(settings.index_checkpoint_path).load(),
+    )
+
+
+def indexed_ids(client: QdrantClient, settings: Settings) -> set[int]:
+    points, _ = client.scroll(settings.qdrant_collection, limit=1000, with_payload=False, with_vectors=False)
+    return {point.id for point in points}
+
+
+def active_ids(db: Session) -> set[int]:
+    return {product_id for (product_id,) in db.query(Product.id).filter(Product.is_active.is_(True))}
+
+
+def touch(db: Session, product_id: int, **values) -> None:
+    product = db.get(Product, product_id)
+    for name, value in values.items():
+        setattr(product, name, value)
+    product.updated_at = datetime(2030, 1, 1) + timedelta(seconds=product_id)
+    db.commit()
+
+
+def test_full_build_indexes_active_products(settings, db, client):
+    stats = make_indexer(settings, client).run(db, full=True)
+
+    assert indexed_ids(client, settings) == active_ids(db)
+    assert stats["upserted"] == len(active_ids(db))
+    checkpoint = IndexCheckpoint(settings.index_checkpoint_path).load()
+    assert checkpoint.completed
+    assert checkpoint.mode == "incremental"
+    assert checkpoint.last_updated_at == max(product.updated_at for product in db.query(Product))
+
+
+def test_incremental_run_picks_up_updated_products(settings, db, client):
+    make_indexer(settings, client).run(db, full=True)
+    product_id = min(active_ids(db))
+    touch(db, product_id, product_name="Sữa tươi không đường 1L")
+
+    stats = make_indexer(settings, client).run(db)
+
+    # The touched product plus the row sitting on the previous high-water mark, which is re-read on
+    # purpose so rows committed later with the same updated_at are not missed.
+    assert (stats["upserted"], stats["deleted"]) == (2, 0)
+    (point,) = client.retrieve(settings.qdrant_collection, ids=[product_id])
+    assert point.payload["product_name"] == "Sữa tươi không đường 1L"
+
+
+def test_incremental_run_removes_deactivated_products(settings, db, client):
+    make_indexer(settings, client).run(db, full=True)
+    product_id = max(active_ids(db))
+    touch(db, product_id, is_active=False)
+
+    stats = make_indexer(settings, client).run(db)
+
+    assert stats["deleted"] == 1
+    assert product_id not in indexed_ids(client, settings)
+    assert indexed_ids(client, settings) == active_ids(db)
+
+
+def test_interrupted_full_run_resumes_from_checkpoint(settings, db, client, monkeypatch):
+    indexer = make_indexer(settings, client)
+    upsert = client.upsert
+    calls = []
+
+    def failing_upsert(*args, **kwargs):
+        calls.append(kwargs["points"])
+        if len(calls) == 3:
+            raise ConnectionError("qdrant went away")
+        return upsert(*args, **kwargs)
+
+    monkeypatch.setattr(client, "upsert", failing_upsert)
+    with pytest.raises(ConnectionError):
+        indexer.run(db, full=True)
+    monkeypatch.setattr(client, "upsert", upsert)
+
+    checkpoint = IndexCheckpoint(settings.index_checkpoint_path).load()
+    assert checkpoint.mode == "full"
+    assert not checkpoint.completed
+    assert checkpoint.last_id == 20
+
+    resumed_ids = []
+
+    def recording_upsert(*args, **kwargs):
+        resumed_ids.extend(point.id for point in kwargs["points"])
+        return upsert(*args, **kwargs)
+
+    monkeypatch.setattr(client, "upsert", recording_upsert)
+    make_indexer(settings, client).run(db)
+
+    assert min(resumed_ids) > 20
+    assert indexed_ids(client, settings) == active_ids(db)
+    assert IndexCheckpoint(settings.index_checkpoint_path).load().completed
+
+
+def test_full_run_drops_points_of_deleted_products(settings, db, client):
+    make_indexer(settings, client).run(db, full=True)
+    product_id = min(active_ids(db))
+    db.delete(db.get(Product, product_id))
+    db.commit()
+
+    stats = make_indexer(settings, client).run(db, full=True)
+
+    assert stats["deleted"] >= 1
+    assert product_id not in indexed_ids(client, settings)
+    assert indexed_ids(client, settings) == active_ids(db)